@@ -27,10 +27,12 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",  # keep before SessionMiddleware
+    "store.metrics.ServerTimingMiddleware",  # after WhiteNoise, before SessionMiddleware
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "store.profiling.ProfilingMiddleware",  # needs request.user
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -41,8 +43,6 @@ if DEBUG:
     WHITENOISE_AUTOREFRESH = True
     WHITENOISE_USE_FINDERS = True
 else:
-    # Hashed, compressed assets in production builds
-    STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
     WHITENOISE_MAX_AGE = 31536000  # 1 year cache for hashed files
 
 # ─── URLS / WSGI ──────────────────────────────────────────────────────────────
@@ -61,6 +61,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "store.context_processors.cart_item_total",
             ],
         },
     },
@@ -74,6 +75,107 @@ DATABASES = {
     }
 }
 
+# ─── CACHE ────────────────────────────────────────────────────────────────────
+# Local memory by default. Set DJANGO_CACHE_DIR to share one file cache between
+# gunicorn workers (catalogue and coupon version bumps then reach every worker).
+# Under local memory a bump stays in the worker that made it: the others keep
+# serving cached catalogue pages (stock, prices) for up to CATALOGUE_CACHE_TIMEOUT
+# and coupons for up to COUPON_CACHE_TIMEOUT.
+# "default" holds one catalogue page per distinct search, one favorites set per
+# signed-in user and the version keys; MAX_ENTRIES is sized for that rather than
+# Django's 300, which those keys would churn through.
+CACHE_DIR = os.getenv("DJANGO_CACHE_DIR")
+DEFAULT_CACHE_ENTRIES = int(os.getenv("DJANGO_CACHE_ENTRIES", "20000"))
+if CACHE_DIR:
+    CACHES = {
+        "default": {
+            "BACKEND": "store.cache.FileCache",
+            "LOCATION": CACHE_DIR,
+            "OPTIONS": {"MAX_ENTRIES": DEFAULT_CACHE_ENTRIES},
+        },
+        "sessions": {
+            # Culls at most once a minute, oldest first (Django's globs the
+            # directory on every write and drops random live entries)
+            "BACKEND": "store.cache.FileCache",
+            "LOCATION": os.path.join(CACHE_DIR, "sessions"),
+            "OPTIONS": {"MAX_ENTRIES": 100_000},
+        },
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "farm-store",
+            "OPTIONS": {"MAX_ENTRIES": DEFAULT_CACHE_ENTRIES},
+        },
+        "sessions": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "farm-store-sessions",
+            "OPTIONS": {"MAX_ENTRIES": 100_000},
+        },
+    }
+
+# Seconds a rendered catalogue page's data stays cached (also bounded by version
+# bumps, which only reach other workers with DJANGO_CACHE_DIR)
+CATALOGUE_CACHE_TIMEOUT = int(os.getenv("CATALOGUE_CACHE_TIMEOUT", "600"))
+
+# Seconds a user's favorite-id set stays cached (also dropped whenever it changes)
+FAVORITES_CACHE_TIMEOUT = int(os.getenv("FAVORITES_CACHE_TIMEOUT", "3600"))
+
+# Seconds a cart line holds its stock for other shoppers after the cart was last touched
+CART_RESERVATION_SECONDS = int(os.getenv("CART_RESERVATION_SECONDS", "900"))
+
+# Seconds a worker trusts its cached coupon rows. A coupon save drops them in every
+# worker only with DJANGO_CACHE_DIR; under LocMem other workers wait out this TTL.
+COUPON_CACHE_TIMEOUT = int(os.getenv("COUPON_CACHE_TIMEOUT", "60"))
+
+# ─── REQUEST METRICS ──────────────────────────────────────────────────────────
+# Per-route histograms (store.metrics) are flushed every METRICS_FLUSH_SECONDS
+# into one SQLite file shared by every worker on the host, and scraped at /metrics
+# by staff or the comma-separated METRICS_ALLOWED_IPS (none by default).
+METRICS_DB = os.getenv("DJANGO_METRICS_DB") or os.path.join(CACHE_DIR or BASE_DIR, "metrics.sqlite3")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv("METRICS_ALLOWED_IPS", "").split(",") if ip.strip()]
+# Statements at least this slow are logged with their plan (store.slowlog; 0 = off).
+# Rank them with `manage.py slow_queries`.
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+
+# ─── REQUEST PROFILING ────────────────────────────────────────────────────────
+# store.profiling: staff send the signed X-Profile header from Admin › Request
+# profiles, or set PROFILE_SAMPLE_RATE=N to profile one request in N (0 = off).
+PROFILE_DIR = os.getenv("DJANGO_PROFILE_DIR") or os.path.join(BASE_DIR, "profiles")
+PROFILE_SAMPLE_RATE = int(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "100"))
+PROFILE_TOKEN_MAX_AGE = int(os.getenv("PROFILE_TOKEN_MAX_AGE", "3600"))
+
+# Test runs keep METRICS_DB and PROFILE_DIR in a temporary directory
+TEST_RUNNER = "store.testing.TestRunner"
+
+# ─── SESSIONS ─────────────────────────────────────────────────────────────────
+# DJANGO_SESSION_PROFILE picks the engine:
+#   db            – Django default; one django_session write per modified request
+#   cached_db     – write-through: DB write + cache, reads served from cache
+#   write_behind  – cache on every save, DB row refreshed at most every
+#                   SESSION_WRITE_BEHIND_SECONDS (store.sessions)
+#   cache         – cache only; no DB writes, sessions lost if the cache is flushed
+# Cache profiles need the shared file cache when running several workers,
+# so the default is write_behind with DJANGO_CACHE_DIR and db without it.
+# The sessions cache holds MAX_ENTRIES sessions; past that, a cull deletes the
+# least recently written third. write_behind then reloads a culled session from
+# its DB row, losing up to SESSION_WRITE_BEHIND_SECONDS of changes; under the
+# cache profile the session (cart, login) is gone for good.
+# Sweep expired rows with `manage.py sweep_sessions`.
+SESSION_ENGINES = {
+    "db": "django.contrib.sessions.backends.db",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "write_behind": "store.sessions",
+    "cache": "django.contrib.sessions.backends.cache",
+}
+SESSION_PROFILE = os.getenv("DJANGO_SESSION_PROFILE") or ("write_behind" if CACHE_DIR else "db")
+SESSION_ENGINE = SESSION_ENGINES[SESSION_PROFILE]
+SESSION_CACHE_ALIAS = "sessions"
+SESSION_WRITE_BEHIND_SECONDS = int(os.getenv("SESSION_WRITE_BEHIND_SECONDS", "60"))
+
 # ─── AUTH VALIDATORS ──────────────────────────────────────────────────────────
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
@@ -97,6 +199,18 @@ STATIC_ROOT = BASE_DIR / "staticfiles"    # collectstatic output (prod-like)
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
+# Serve MEDIA_URL from Django (products.views.serve_media) in every environment
+SERVE_MEDIA = os.getenv("DJANGO_SERVE_MEDIA", "1") != "0"
+
+STORAGES = {
+    # Uploads get content-hashed names so they can be cached as immutable
+    "default": {"BACKEND": "products.storage.HashedMediaStorage"},
+    # Hashed, compressed assets in production builds
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage" if DEBUG
+        else "whitenoise.storage.CompressedManifestStaticFilesStorage",
+    },
+}
 
 # ─── DEFAULTS ─────────────────────────────────────────────────────────────────
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
@@ -1,15 +1,25 @@
 from __future__ import annotations
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+
+from products.views import serve_media
+from store.metrics import metrics_view
+from store.profiling import profile_detail_view, profiles_view
 
 urlpatterns = [
+    path("admin/profiles/", admin.site.admin_view(profiles_view), name="profiles"),
+    path("admin/profiles/<str:name>/", admin.site.admin_view(profile_detail_view), name="profile_detail"),
     path("admin/", admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
     path("", include("store.urls", namespace="store")),
     path("accounts/", include("store.auth_urls", namespace="accounts")),
 ]
 
-# Serve uploaded media in development
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Serve uploaded media (hashed names get immutable caching); turn off when a proxy/CDN serves MEDIA_ROOT
+if settings.SERVE_MEDIA and settings.MEDIA_URL.startswith("/"):
+    urlpatterns += [
+        re_path(rf"^{re.escape(settings.MEDIA_URL.lstrip('/'))}(?P<path>.+)$", serve_media, name="media"),
+    ]
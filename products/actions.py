@@ -0,0 +1,144 @@
+"""
+Set-based pricing and stock actions for ProductAdmin and CategoryAdmin.
+
+Each action shows a confirmation page asking for its amount, then runs ONE
+``UPDATE`` over the selected products (or every product in the selected
+categories) with ``F()`` expressions: no per-object ``save()``, so it costs
+the same for five products or five thousand. Signals don't fire for
+``QuerySet.update()``, so ``products_bulk_changed`` is sent after commit.
+
+The actions rewrite products whichever admin they run from, so both admins
+gate them on ``products.change_product`` (``has_bulk_product_permission``).
+"""
+from __future__ import annotations
+
+from decimal import Decimal
+
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.auth import get_permission_codename
+from django.db import transaction
+from django.db.models import DecimalField, F, QuerySet, Value
+from django.db.models.functions import Greatest, Round
+from django.template.response import TemplateResponse
+
+from .models import Category, Product
+from .signals import products_bulk_changed
+
+MONEY = DecimalField(max_digits=7, decimal_places=2)
+
+
+class PercentForm(forms.Form):
+    amount = forms.DecimalField(
+        label="Percent off", min_value=Decimal("0.01"), max_value=Decimal("99.99"), decimal_places=2,
+        help_text="Sale price = price minus this percentage, rounded to the cent.",
+    )
+
+
+class QuantityForm(forms.Form):
+    amount = forms.DecimalField(label="Quantity", max_digits=7, decimal_places=2)
+
+
+class NonNegativeQuantityForm(QuantityForm):
+    amount = forms.DecimalField(label="Quantity", max_digits=7, decimal_places=2, min_value=Decimal("0"))
+
+
+class ConfirmForm(forms.Form):
+    pass
+
+
+def _sale_percent_off(amount):
+    return {"sale_price": Round(F("price") * Value((100 - amount) / 100, output_field=MONEY), 2, output_field=MONEY)}
+
+
+def _clear_sale(amount):
+    return {"sale_price": None}
+
+
+def _set_stock(amount):
+    return {"stock_qty": Value(amount, output_field=MONEY)}
+
+
+def _add_stock(amount):
+    # Negative amounts remove stock; never below zero
+    return {"stock_qty": Greatest(F("stock_qty") + Value(amount, output_field=MONEY), Value(0), output_field=MONEY)}
+
+
+OPERATIONS = {
+    # name: (description, form, describe(amount), update kwargs(amount))
+    "sale_percent_off": ("Put on sale (% off price)", PercentForm,
+                         lambda a: f"set sale price to {a}% off the regular price", _sale_percent_off),
+    "clear_sale": ("Clear sale price", ConfirmForm, lambda a: "clear the sale price", _clear_sale),
+    "set_stock": ("Set stock to N", NonNegativeQuantityForm, lambda a: f"set stock to {a}", _set_stock),
+    "add_stock": ("Add N to stock", QuantityForm,
+                  lambda a: f"add {a} to stock (never going below zero)", _add_stock),
+}
+
+
+def apply_operation(products: QuerySet, name: str, amount=None) -> int:
+    """Run one operation as a single UPDATE; returns the number of rows changed."""
+    *_, update_kwargs = OPERATIONS[name]
+    with transaction.atomic():
+        count = products.order_by().update(**update_kwargs(amount))
+        if count:
+            transaction.on_commit(lambda: products_bulk_changed.send(sender=Product, product_ids=None))
+    return count
+
+
+def has_bulk_product_permission(request) -> bool:
+    """Whether the user may run PRODUCT_ACTIONS (from either admin)."""
+    opts = Product._meta
+    return request.user.has_perm(f"{opts.app_label}.{get_permission_codename('change', opts)}")
+
+
+def _products_for(queryset: QuerySet) -> QuerySet:
+    if queryset.model is Category:
+        return Product.objects.filter(category__in=queryset.values("pk"))
+    return queryset
+
+
+def _run(modeladmin, request, queryset, name):
+    description, form_class, describe, _ = OPERATIONS[name]
+    products = _products_for(queryset)
+
+    if "apply" in request.POST:
+        form = form_class(request.POST)
+        if form.is_valid():
+            amount = form.cleaned_data.get("amount")
+            count = apply_operation(products, name, amount)
+            modeladmin.message_user(
+                request, f"{description}: updated {count} product(s).", messages.SUCCESS,
+            )
+            return None  # back to the changelist
+    else:
+        form = form_class()
+
+    opts = modeladmin.model._meta
+    select_across = request.POST.get("select_across") == "1"
+    context = {
+        **modeladmin.admin_site.each_context(request),
+        "title": description,
+        "opts": opts,
+        "form": form,
+        "action": name,
+        "action_summary": describe("N"),
+        "product_count": products.count(),
+        "select_across": select_across,
+        "selected": [] if select_across else request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+        "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+        "media": modeladmin.media,
+    }
+    return TemplateResponse(request, "admin/products/bulk_update_confirm.html", context)
+
+
+def _make_action(name):
+    def action(modeladmin, request, queryset):
+        return _run(modeladmin, request, queryset, name)
+
+    action.__name__ = name
+    description = OPERATIONS[name][0].replace("%", "%%")  # the admin %-formats action descriptions
+    return admin.action(description=f"{description}…", permissions=["bulk_product"])(action)
+
+
+PRODUCT_ACTIONS = [_make_action(name) for name in OPERATIONS]
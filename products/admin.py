@@ -1,11 +1,31 @@
 # products/admin.py
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db.models import Count, Prefetch
+from django.forms.models import BaseInlineFormSet
 from django.urls import reverse
 from django.utils.html import format_html, format_html_join
 
+from . import thumbnails
+from .actions import PRODUCT_ACTIONS, has_bulk_product_permission
 from .models import Category, Product, ProductImage, CategoryImage, ProductReview
 from .forms import ProductAdminForm  # keep using your existing form
 
+def save_product(product):
+    """
+    Save an admin edit. Existing rows are written without DENORMALIZED_FIELDS:
+    a rating or image change that landed after the form loaded the product
+    must not be overwritten by its stale copy.
+    """
+    if product.pk is None or product._state.adding:
+        product.save()
+        return
+    product.save(update_fields=[
+        f.name for f in Product._meta.concrete_fields
+        if not f.primary_key and f.name not in Product.DENORMALIZED_FIELDS
+    ])
+
+
 # ─────────────────────────  INLINES  ─────────────────────────
 
 class ProductImageInline(admin.TabularInline):
@@ -16,13 +36,48 @@ class ProductImageInline(admin.TabularInline):
 
     def preview(self, obj):
         if getattr(obj, "image", None):
-            return format_html('<img src="{}" style="height:60px; width:auto; border-radius:4px;" />', obj.image.url)
+            return format_html(
+                '<img src="{}" srcset="{}" sizes="120px" style="height:60px; width:auto; border-radius:4px;" />',
+                thumbnails.image_url(obj.image, 160), thumbnails.image_srcset(obj.image, widths=(160, 480)),
+            )
         return "—"
     preview.short_description = "Preview"
 
 
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """
+    Inline formset that only builds forms for one page of related rows
+    (``page_number`` is set per request by the inline's ``get_formset``).
+    The change form posts back to the same URL, so a save binds the same
+    slice; unchanged rows are skipped by the formset as usual.
+    """
+    per_page = 25
+    page_number = 1
+
+    def get_queryset(self):
+        if not hasattr(self, "_queryset"):
+            qs = super().get_queryset()
+            self._page = Paginator(qs, self.per_page).get_page(self.page_number)
+            self._queryset = list(self._page.object_list)
+        return self._queryset
+
+    @property
+    def page(self):
+        self.get_queryset()
+        return self._page
+
+
+class ProductInlineFormSet(PaginatedInlineFormSet):
+    def save_existing(self, form, obj, commit=True):
+        obj = form.save(commit=False)
+        if commit:
+            save_product(obj)
+            form.save_m2m()
+        return obj
+
+
 class ProductInline(admin.TabularInline):
-    """Products editable directly under a Category page."""
+    """Products editable directly under a Category page, one page of rows at a time."""
     model = Product
     fk_name = "category"   # be explicit about the FK to Category
     extra = 1              # show one blank row so the inline is always visible
@@ -33,6 +88,17 @@ class ProductInline(admin.TabularInline):
     )
     readonly_fields = ("effective_price",)
     show_change_link = True
+    formset = ProductInlineFormSet
+    template = "admin/products/category/product_inline.html"
+    page_param = "products_page"
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).order_by("name", "id")
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)  # a fresh class per call
+        formset.page_number = request.GET.get(self.page_param) or 1
+        return formset
 
 
 # ─────────────────────────  ADMINS  ─────────────────────────
@@ -43,23 +109,39 @@ class ProductAdmin(admin.ModelAdmin):
 
     list_display = ("thumb", "name", "category", "unit", "price", "sale_price", "stock_qty")
     list_filter = ("category", "unit")
+    actions = PRODUCT_ACTIONS  # single-UPDATE pricing/stock changes
     search_fields = ("name", "description")
     inlines = [ProductImageInline]
 
     list_display_links = ("name",)
     list_editable = ("category", "unit", "price", "sale_price", "stock_qty")
+    list_select_related = ("primary_image", "category")
 
     def thumb(self, obj):
-        pic = obj.images.first()
+        pic = obj.primary_image
         if pic and pic.image:
-            return format_html('<img src="{}" style="height:40px; width:auto; border-radius:4px;" />', pic.image.url)
+            return format_html(
+                '<img src="{}" style="height:40px; width:auto; border-radius:4px;" />',
+                thumbnails.image_url(pic.image, 160),
+            )
         return "—"
     thumb.short_description = "Img"
 
+    def save_model(self, request, obj, form, change):
+        save_product(obj)  # change form and list_editable rows
+
+    def has_bulk_product_permission(self, request):
+        return has_bulk_product_permission(request)
+
     # Remove plus/pencil/eye icons next to the Category field at the form level
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         formfield = super().formfield_for_foreignkey(db_field, request, **kwargs)
         if db_field.name == "category":
+            # Every list_editable row gets this field; load the choices once per request
+            choices = getattr(request, "_category_choices", None)
+            if choices is None:
+                choices = request._category_choices = list(formfield.choices)
+            formfield.choices = choices
             w = formfield.widget
             for attr in ("can_add_related", "can_change_related", "can_view_related", "can_delete_related"):
                 if hasattr(w, attr):
@@ -79,30 +161,53 @@ class ProductAdmin(admin.ModelAdmin):
         js = ("products/admin_overrides.js",)
 
 
+# Quick-edit links shown per category on the changelist (the count column has the total)
+PRODUCT_LINKS_LIMIT = 10
+
+
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     # Show products on the LIST page with quick edit links, plus an add button
     list_display = ("name", "products_count", "products_links", "add_product_link")
     search_fields = ("name",)
     inlines = [ProductInline]  # keeps inline editing on the CHANGE page
+    actions = PRODUCT_ACTIONS  # applied to every product in the selected categories
+
+    def get_queryset(self, request):
+        # Count + one bounded prefetch for the whole page instead of two queries per row
+        return super().get_queryset(request).annotate(_products_count=Count("products")).prefetch_related(
+            Prefetch(
+                "products",
+                queryset=Product.objects.only("id", "name", "category_id").order_by("name")[:PRODUCT_LINKS_LIMIT],
+                to_attr="_link_products",
+            )
+        )
 
     def products_count(self, obj):
-        return obj.products.count()
+        return obj._products_count
     products_count.short_description = "Products"
+    products_count.admin_order_field = "_products_count"
+
+    def has_bulk_product_permission(self, request):
+        return has_bulk_product_permission(request)  # the actions edit products, not categories
 
     def products_links(self, obj):
         """
         Read-only list of products with quick 'Change' links.
         """
-        qs = obj.products.all().only("id", "name").order_by("name")
-        if not qs.exists():
+        products = obj._link_products
+        if not products:
             return "—"
 
         def link(p):
             url = reverse("admin:products_product_change", args=[p.id])
             return format_html('<a href="{}">{}</a>', url, p.name)
 
-        return format_html_join(", ", "{}", ((link(p),) for p in qs))
+        links = format_html_join(", ", "{}", ((link(p),) for p in products))
+        more = obj._products_count - len(products)
+        if more > 0:
+            return format_html("{} … +{} more", links, more)
+        return links
     products_links.short_description = "Products (quick edit)"
 
     def add_product_link(self, obj):
@@ -121,5 +226,7 @@ class ProductReviewAdmin(admin.ModelAdmin):
     list_filter = ("stars",)
 
 
-admin.site.register(ProductImage)
+@admin.register(ProductImage)
+class ProductImageAdmin(admin.ModelAdmin):
+    list_select_related = ("product",)  # __str__ uses the product name
 # admin.site.register(CategoryImage)  # intentionally not registered
@@ -0,0 +1,60 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+
+from products.models import CategoryImage, ProductImage
+from products.signals import record_variants
+from products.thumbnails import generate_variants
+
+
+def _init_worker():
+    django.setup()  # no-op when forked; needed when workers are spawned
+
+
+def _build(name, force):
+    try:
+        return name, generate_variants(name, force=force), ""
+    except Exception as exc:  # report and keep going; one bad upload shouldn't stop the run
+        return name, 0, str(exc) or exc.__class__.__name__
+
+
+class Command(BaseCommand):
+    help = ("Create missing WebP/JPEG thumbnail variants for every product and category image, in parallel, "
+            "and record them on the image rows.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="Worker processes (1 = run in this process).")
+        parser.add_argument("--force", action="store_true", help="Rebuild variants that already exist.")
+
+    def handle(self, *args, **options):
+        names = sorted(
+            {n for n in ProductImage.objects.values_list("image", flat=True) if n}
+            | {n for n in CategoryImage.objects.values_list("image", flat=True) if n}
+        )
+        force, workers = options["force"], max(1, options["workers"])
+
+        if workers == 1 or len(names) < 2:
+            results = (_build(n, force) for n in names)
+            self._report(results, len(names))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                self._report(pool.map(_build, names, [force] * len(names), chunksize=4), len(names))
+
+    def _report(self, results, total):
+        written = failed = 0
+        built = []
+        for name, count, error in results:
+            written += count
+            if error:
+                failed += 1
+                self.stderr.write(f"{name}: {error}")
+            else:
+                built.append(name)
+        record_variants(built)
+        msg = f"Wrote {written} variant(s) for {total} image(s)."
+        if failed:
+            msg += f" {failed} failed."
+        self.stdout.write(self.style.SUCCESS(msg))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from products.transfer import FORMATS, export_rows, format_for
+
+
+class Command(BaseCommand):
+    help = "Stream every product's slug, name, category, unit, price, sale_price and stock_qty as CSV or JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", "-o", default="-", help="File to write ('-' for stdout).")
+        parser.add_argument("--format", choices=FORMATS, help="Default: from the output extension (csv).")
+
+    def handle(self, *args, **options):
+        path = options["output"]
+        fmt = format_for(path, options["format"])
+        if path == "-":
+            count = export_rows(self.stdout, fmt)
+        else:
+            with open(path, "w", newline="", encoding="utf-8") as fh:
+                count = export_rows(fh, fmt)
+            self.stdout.write(self.style.SUCCESS(f"Exported {count} product(s) to {path}."))
@@ -0,0 +1,51 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.transfer import BATCH_SIZE, FORMATS, format_for, import_rows, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Update product price, sale_price and stock_qty from a CSV or JSONL file, matched on slug "
+        "(streamed, applied in batches; --create also adds unknown slugs)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import ('-' for stdin).")
+        parser.add_argument("--format", choices=FORMATS, help="Default: from the file extension (csv).")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument("--create", action="store_true",
+                            help="Create products for unknown slugs (rows need name, category and price).")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = format_for(path, options["format"])
+
+        def progress(report):
+            self.stdout.write(
+                f"batch {report.batches}: {report.rows} row(s) read, {report.updated} updated, "
+                f"{report.created} created, {report.failed} failed"
+            )
+
+        if path == "-":
+            report = import_rows(read_rows(sys.stdin, fmt), batch_size=options["batch_size"],
+                                 create=options["create"], progress=progress)
+        else:
+            try:
+                fh = open(path, newline="", encoding="utf-8-sig")
+            except OSError as exc:
+                raise CommandError(str(exc))
+            with fh:
+                report = import_rows(read_rows(fh, fmt), batch_size=options["batch_size"],
+                                     create=options["create"], progress=progress)
+
+        for line in report.errors:
+            self.stderr.write(line)
+        if report.failed > len(report.errors):
+            self.stderr.write(f"... and {report.failed - len(report.errors)} more error(s)")
+        summary = (
+            f"Imported {report.rows} row(s): {report.updated} updated, {report.created} created, "
+            f"{report.unchanged} unchanged, {report.failed} failed."
+        )
+        self.stdout.write(self.style.WARNING(summary) if report.failed else self.style.SUCCESS(summary))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.search import fts_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the FTS5 product search index from the Product and Category tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="default", help="Database alias (default: 'default').")
+
+    def handle(self, *args, **options):
+        using = options["database"]
+        if not fts_available(using):
+            raise CommandError("Full-text search is not available on this database (SQLite with FTS5 required).")
+        count = rebuild_index(using)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} products."))
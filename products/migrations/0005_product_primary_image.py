@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_primary_image(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    ProductImage = apps.get_model("products", "ProductImage")
+    first = (
+        ProductImage.objects.filter(product=models.OuterRef("pk"))
+        .order_by("id")
+        .values("pk")[:1]
+    )
+    Product.objects.update(primary_image=models.Subquery(first))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_sale_price_productreview'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='products.productimage'),
+        ),
+        migrations.RunPython(backfill_primary_image, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:03
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+from django.db.models import F
+
+from products.thumbnails import variant_names
+
+
+def record_existing_variants(apps, schema_editor):
+    # Rows whose variants are already on disk keep serving them; the rest fall
+    # back to the original until `manage.py build_thumbnails` writes them.
+    for model_name in ("ProductImage", "CategoryImage"):
+        model = apps.get_model("products", model_name)
+        names = {n for n in model.objects.values_list("image", flat=True).distinct() if n}
+        built = [n for n in names if all(default_storage.exists(v) for v in variant_names(n))]
+        model.objects.filter(image__in=built).update(thumbs_name=F("image"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categoryimage',
+            name='thumbs_name',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='thumbs_name',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.RunPython(record_existing_variants, migrations.RunPython.noop),
+    ]
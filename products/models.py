@@ -25,6 +25,21 @@ class Category(models.Model):
 
 
 # ─────────────────────────  PRODUCT  ─────────────────────────
+CARD_IMAGE_LIMIT = 3
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_card_images(self):
+        """Primary image via JOIN plus the first CARD_IMAGE_LIMIT images in one extra query."""
+        return self.select_related("primary_image").prefetch_related(
+            models.Prefetch(
+                "images",
+                queryset=ProductImage.objects.order_by("id")[:CARD_IMAGE_LIMIT],
+                to_attr="_card_images",
+            )
+        )
+
+
 class Product(models.Model):
     class Unit(models.TextChoices):
         EACH  = "ea", "Each"
@@ -44,8 +59,25 @@ class Product(models.Model):
     # Optional sale price (if set & < price, show crossed-out original)
     sale_price  = models.DecimalField(max_digits=7, decimal_places=2, null=True, blank=True)
 
+    # Denormalized first image (lowest id); kept in sync by products.signals
+    primary_image = models.ForeignKey(
+        "ProductImage", null=True, blank=True, editable=False,
+        on_delete=models.SET_NULL, related_name="+",
+    )
+
+    # Denormalized store.Rating aggregates; maintained by store.signals,
+    # repaired with `manage.py recompute_ratings`
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum   = models.PositiveIntegerField(default=0, editable=False)
+
     created_at  = models.DateTimeField(auto_now_add=True)
 
+    objects = ProductQuerySet.as_manager()
+
+    # Columns maintained by targeted UPDATEs; admin edits save without them
+    # (products.admin.save_product) so a stale form can't overwrite them
+    DENORMALIZED_FIELDS = ("primary_image", "rating_count", "rating_sum")
+
     class Meta:
         ordering = ("name",)
 
@@ -65,9 +97,20 @@ class Product(models.Model):
         return self.price
 
     @property
-    def avg_rating(self):
-        agg = self.reviews.aggregate(models.Avg('stars'))
-        return (agg['stars__avg'] or 0)
+    def card_images(self):
+        """
+        Up to CARD_IMAGE_LIMIT images for product cards. Uses the bounded prefetch
+        from ``Product.objects.with_card_images()`` when present.
+        """
+        cached = getattr(self, "_card_images", None)
+        if cached is None:
+            cached = list(self.images.all()[:CARD_IMAGE_LIMIT])
+        return cached
+
+    @property
+    def avg_rating(self) -> float:
+        """Average store.Rating stars, 0 when unrated (a column read, no query)."""
+        return self.rating_sum / self.rating_count if self.rating_count else 0
 
 
 # ─────────────────────────  IMAGES  ─────────────────────────
@@ -75,6 +118,8 @@ class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="images")
     image   = models.ImageField(upload_to="products")
     alt     = models.CharField(max_length=120, blank=True)
+    # image.name once its thumbs/ variants are written (products.signals.record_variants)
+    thumbs_name = models.CharField(max_length=100, blank=True, editable=False)
 
     class Meta:
         ordering = ("id",)
@@ -87,6 +132,7 @@ class CategoryImage(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="images")
     image    = models.ImageField(upload_to="categories")
     alt      = models.CharField(max_length=120, blank=True)
+    thumbs_name = models.CharField(max_length=100, blank=True, editable=False)
 
     class Meta:
         ordering = ("id",)
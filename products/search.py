@@ -0,0 +1,147 @@
+"""
+Full-text product search backed by an SQLite FTS5 table.
+
+``products_product_fts`` holds one row per product (rowid = product id) with
+the product name, description and category name. It is created by migration
+0006, kept in sync by the receivers in ``products.signals`` and can be rebuilt
+with ``manage.py rebuild_search_index``. On other database backends (or an
+SQLite build without FTS5) ``search_product_ids`` and ``search_products``
+return None and callers fall back to ``icontains`` filtering.
+"""
+from __future__ import annotations
+
+import re
+from typing import Iterable, List, Optional
+
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models import QuerySet
+
+from .models import Category, Product
+
+FTS_TABLE = "products_product_fts"
+
+# Default cap for ``search_product_ids`` (ids are passed back as parameters)
+SEARCH_LIMIT = 200
+
+# bm25 column weights: name, description, category
+BM25_WEIGHTS = (10.0, 1.0, 5.0)
+
+_available: dict = {}
+
+
+def fts_available(using: str = DEFAULT_DB_ALIAS) -> bool:
+    """True when the FTS table exists on this connection (checked once per process)."""
+    if using not in _available:
+        conn = connections[using]
+        if conn.vendor != "sqlite":
+            _available[using] = False
+        else:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+                _available[using] = cur.fetchone() is not None
+    return _available[using]
+
+
+def _populate_sql(where: str) -> str:
+    return (
+        f"INSERT INTO {FTS_TABLE} (rowid, name, description, category) "
+        "SELECT p.id, p.name, p.description, c.name "
+        f"FROM {Product._meta.db_table} p JOIN {Category._meta.db_table} c ON c.id = p.category_id "
+        f"WHERE {where}"
+    )
+
+
+def index_products(product_ids: Iterable[int], using: str = DEFAULT_DB_ALIAS) -> None:
+    """(Re)index the given products."""
+    ids = [int(pk) for pk in product_ids]
+    if not ids or not fts_available(using):
+        return
+    marks = ", ".join(["%s"] * len(ids))
+    with connections[using].cursor() as cur:
+        cur.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({marks})", ids)
+        cur.execute(_populate_sql(f"p.id IN ({marks})"), ids)
+
+
+def index_category(category_id: int, using: str = DEFAULT_DB_ALIAS) -> None:
+    """Reindex every product in a category (its name is part of each row)."""
+    if not fts_available(using):
+        return
+    with connections[using].cursor() as cur:
+        cur.execute(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid IN "
+            f"(SELECT id FROM {Product._meta.db_table} WHERE category_id = %s)",
+            [category_id],
+        )
+        cur.execute(_populate_sql("p.category_id = %s"), [category_id])
+
+
+def unindex_product(product_id: int, using: str = DEFAULT_DB_ALIAS) -> None:
+    if not fts_available(using):
+        return
+    with connections[using].cursor() as cur:
+        cur.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [product_id])
+
+
+def rebuild_index(using: str = DEFAULT_DB_ALIAS) -> int:
+    """Clear and repopulate every row. Returns the number of indexed products."""
+    if not fts_available(using):
+        return 0
+    with connections[using].cursor() as cur:
+        cur.execute(f"DELETE FROM {FTS_TABLE}")
+        cur.execute(_populate_sql("1 = 1"))
+        cur.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cur.execute(f"SELECT COUNT(*) FROM {FTS_TABLE}")
+        return cur.fetchone()[0]
+
+
+def match_expression(q: str) -> str:
+    """
+    Turn free text into an FTS5 query: every word must match as a prefix,
+    so 'tom veg' finds 'Tomatoes' in 'Vegetables'. User input never reaches
+    FTS5 syntax unquoted.
+    """
+    terms = re.findall(r"\w+", q)
+    return " ".join(f'"{t}"*' for t in terms)
+
+
+def _rank_sql() -> str:
+    return f"bm25({FTS_TABLE}, {', '.join(str(w) for w in BM25_WEIGHTS)})"
+
+
+def search_products(products: QuerySet, q: str) -> Optional[QuerySet]:
+    """
+    ``products`` narrowed to every match for ``q``, best bm25 rank first,
+    joined against the FTS table by rowid in the same query (no id list
+    round trip, however many products match). None when full-text search is
+    unavailable on this backend.
+    """
+    if not fts_available(products.db):
+        return None
+    expr = match_expression(q)
+    if not expr:
+        return products.none()
+    return products.extra(
+        select={"search_rank": _rank_sql()},
+        tables=[FTS_TABLE],
+        where=[f"{FTS_TABLE}.rowid = {Product._meta.db_table}.id", f"{FTS_TABLE} MATCH %s"],
+        params=[expr],
+        order_by=["search_rank"],
+    )
+
+
+def search_product_ids(q: str, limit: int = SEARCH_LIMIT, using: str = DEFAULT_DB_ALIAS) -> Optional[List[int]]:
+    """
+    Up to ``limit`` product ids matching ``q``, best bm25 rank first. None
+    when full-text search is unavailable on this backend.
+    """
+    if not fts_available(using):
+        return None
+    expr = match_expression(q)
+    if not expr:
+        return []
+    with connections[using].cursor() as cur:
+        cur.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY {_rank_sql()} LIMIT %s",
+            [expr, limit],
+        )
+        return [row[0] for row in cur.fetchall()]
@@ -0,0 +1,99 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from . import search, thumbnails
+from .models import Category, CategoryImage, Product, ProductImage
+
+# Sent (after commit) when products were changed by set-based writes that skip
+# post_save: imports, admin bulk actions. Keyword args: product_ids (list or None).
+products_bulk_changed = Signal()
+
+
+def sync_primary_image(product_id):
+    """Point Product.primary_image at the product's lowest-id image (or NULL). Returns the id."""
+    first_id = (
+        ProductImage.objects.filter(product_id=product_id)
+        .order_by("id")
+        .values_list("pk", flat=True)
+        .first()
+    )
+    Product.objects.filter(pk=product_id).update(primary_image_id=first_id)
+    return first_id
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def _product_image_changed(sender, instance, **kwargs):
+    first_id = sync_primary_image(instance.product_id)
+    # Keep an already-loaded parent in step so a later full save() doesn't write a stale id
+    if ProductImage.product.is_cached(instance):
+        instance.product.primary_image_id = first_id
+
+
+# --- Responsive thumbnails ---
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=CategoryImage)
+def _build_thumbnails(sender, instance, raw=False, **kwargs):
+    name = instance.image.name if instance.image else ""
+    if name and not raw:
+        transaction.on_commit(lambda: build_variants(name))
+
+
+def record_variants(names):
+    """Mark every image row using one of the stored files ``names`` as having its variants."""
+    names = list(names)
+    if not names:
+        return
+    changed = ProductImage.objects.filter(image__in=names).update(thumbs_name=F("image"))
+    CategoryImage.objects.filter(image__in=names).update(thumbs_name=F("image"))
+    if changed:
+        # Cached catalogue pages still hold the rows without their variants
+        products_bulk_changed.send(sender=ProductImage, product_ids=None)
+
+
+def build_variants(name):
+    if thumbnails.generate_variants_quietly(name):
+        record_variants([name])
+
+
+def image_in_use(name):
+    """Whether any image row still points at the stored file ``name`` (identical uploads share one)."""
+    return (
+        ProductImage.objects.filter(image=name).exists()
+        or CategoryImage.objects.filter(image=name).exists()
+    )
+
+
+def _drop_unused_variants(name):
+    if not image_in_use(name):
+        thumbnails.delete_variants(name)
+
+
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_delete, sender=CategoryImage)
+def _drop_thumbnails(sender, instance, **kwargs):
+    name = instance.image.name if instance.image else ""
+    if name:
+        transaction.on_commit(lambda: _drop_unused_variants(name))
+
+
+# --- Full-text search index ---
+
+@receiver(post_save, sender=Product)
+def _index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def _unindex_product(sender, instance, **kwargs):
+    search.unindex_product(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def _index_category(sender, instance, created=False, raw=False, **kwargs):
+    if not raw and not created:
+        search.index_category(instance.pk)
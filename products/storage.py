@@ -0,0 +1,84 @@
+"""
+Media storage that writes uploads under content-hashed names::
+
+    products/eggs.jpg  ->  products/eggs.3f2a9c1b7d4e.jpg
+
+A name then always refers to the same bytes, so the files can be served
+with year-long immutable cache headers (see products.views.serve_media),
+and re-uploading an identical photo reuses the stored file. Thumbnail
+variants keep the names products.thumbnails derives from their (already
+hashed) original. Small text-like uploads such as SVG also get a gzip
+sibling for precompressed serving.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import posixpath
+import re
+
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+from .thumbnails import VARIANT_DIR
+
+HASH_LENGTH = 12
+HASHED_STEM = re.compile(r"\.[0-9a-f]{%d}$" % HASH_LENGTH)
+
+# Served with Content-Encoding when the client accepts it; photos don't compress
+PRECOMPRESS_EXTENSIONS = (".svg", ".txt", ".csv", ".json")
+PRECOMPRESS_MIN_SIZE = 512
+
+
+def content_hash(content) -> str:
+    digest = hashlib.sha256()
+    if hasattr(content, "seek"):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, "seek"):
+        content.seek(0)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+class HashedMediaStorage(FileSystemStorage):
+    unhashed_prefixes = (f"{VARIANT_DIR}/",)
+
+    def hashed_name(self, name: str, content, max_length=None) -> str:
+        dir_name, file_name = posixpath.split(name)
+        stem, ext = posixpath.splitext(file_name)
+        stem = HASHED_STEM.sub("", stem)  # re-saving a stored file: don't stack hashes
+        suffix = f".{content_hash(content)}{ext}"
+        if max_length is not None:
+            room = max_length - len(suffix) - (len(dir_name) + 1 if dir_name else 0)
+            stem = stem[:max(1, room)]
+        return posixpath.join(dir_name, stem + suffix)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        if not name.startswith(self.unhashed_prefixes):
+            name = self.hashed_name(name, content, max_length)
+            if self.exists(name):
+                return name  # identical bytes already stored
+        name = super().save(name, content, max_length)
+        if name.lower().endswith(PRECOMPRESS_EXTENSIONS):
+            self._save_gzip(name)
+        return name
+
+    def _save_gzip(self, name: str) -> None:
+        with self.open(name, "rb") as fh:
+            raw = fh.read()
+        if len(raw) < PRECOMPRESS_MIN_SIZE:
+            return
+        packed = gzip.compress(raw, mtime=0)
+        if len(packed) < len(raw):
+            super().save(f"{name}.gz", ContentFile(packed))
+
+    def delete(self, name):
+        super().delete(name)
+        if name and name.lower().endswith(PRECOMPRESS_EXTENSIONS):
+            super().delete(f"{name}.gz")
@@ -0,0 +1,17 @@
+from django import template
+
+from products import thumbnails
+
+register = template.Library()
+
+
+@register.filter
+def srcset(image, fmt="jpg"):
+    """``{{ pic.image|srcset:"webp" }}`` → "…_w160.webp 160w, …_w480.webp 480w, …" (the original's URL until built)."""
+    return thumbnails.image_srcset(image, fmt)
+
+
+@register.filter
+def thumb_url(image, width=thumbnails.WIDTHS[0]):
+    """``{{ pic.image|thumb_url:160 }}`` → URL of the JPEG variant of that width (the original's until built)."""
+    return thumbnails.image_url(image, int(width))
@@ -1,3 +1,459 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from . import search, signals, thumbnails
+from .admin import PaginatedInlineFormSet
+from .models import Category, Product, ProductImage
+
+User = get_user_model()
+
+
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        self.veg = Category.objects.create(name="Vegetables")
+        self.dairy = Category.objects.create(name="Dairy")
+        self.tomato = Product.objects.create(category=self.veg, name="Heirloom Tomatoes", price=Decimal("4"))
+        self.sauce = Product.objects.create(
+            category=self.dairy, name="Cheese", description="Great with tomatoes", price=Decimal("6"),
+        )
+
+    def test_index_follows_saves_and_deletes(self):
+        self.assertTrue(search.fts_available())
+        self.assertEqual(search.search_product_ids("heirl"), [self.tomato.id])
+
+        self.tomato.name = "Cherry Peppers"
+        self.tomato.save()
+        self.assertEqual(search.search_product_ids("heirl"), [])
+        self.assertEqual(search.search_product_ids("pepp"), [self.tomato.id])
+
+        self.tomato.delete()
+        self.assertEqual(search.search_product_ids("pepp"), [])
+
+    def test_category_rename_reindexes_products(self):
+        self.veg.name = "Produce"
+        self.veg.save()
+        self.assertEqual(search.search_product_ids("produce"), [self.tomato.id])
+
+    def test_name_match_ranks_above_description_match(self):
+        self.assertEqual(search.search_product_ids("tomatoes"), [self.tomato.id, self.sauce.id])
+
+    def test_fts_syntax_in_query_is_treated_as_text(self):
+        self.assertEqual(search.search_product_ids('tom"*'), [self.tomato.id, self.sauce.id])
+        self.assertEqual(search.search_product_ids("tom OR cheese"), [])
+        self.assertEqual(search.search_product_ids('"*'), [])
+
+    def test_unavailable_backend_returns_none(self):
+        with mock.patch.object(search, "fts_available", return_value=False):
+            self.assertIsNone(search.search_product_ids("tomatoes"))
+
+    def test_rebuild_command(self):
+        Product.objects.filter(pk=self.tomato.pk).update(name="Radishes")  # bypasses signals
+        out = StringIO()
+        call_command("rebuild_search_index", stdout=out)
+        self.assertIn("Indexed 2 products", out.getvalue())
+        self.assertEqual(search.search_product_ids("radish"), [self.tomato.id])
+
+
+def jpeg_upload(name="photo.jpg", size=(1200, 800)):
+    buf = BytesIO()
+    Image.new("RGB", size, (200, 120, 40)).save(buf, "JPEG")
+    return ContentFile(buf.getvalue(), name=name)
+
+
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        cat = Category.objects.create(name="Eggs")
+        self.product = Product.objects.create(category=cat, name="Brown Eggs", price=Decimal("5"))
+
+    def _add_image(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ProductImage.objects.create(product=self.product, image=jpeg_upload(**kwargs))
+
+    def test_variants_written_after_commit(self):
+        pic = self._add_image()
+        pic.refresh_from_db()
+        self.assertEqual(pic.thumbs_name, pic.image.name)
+        for name in thumbnails.variant_names(pic.image.name):
+            self.assertTrue(default_storage.exists(name), name)
+        with default_storage.open(thumbnails.variant_name(pic.image.name, 480, "webp")) as fh:
+            with Image.open(fh) as img:
+                self.assertEqual((img.format, img.size), ("WEBP", (480, 320)))
+        # Narrow originals are not upscaled
+        small = self._add_image(name="small.jpg", size=(300, 200))
+        with default_storage.open(thumbnails.variant_name(small.image.name, 960, "jpg")) as fh:
+            with Image.open(fh) as img:
+                self.assertEqual(img.size, (300, 200))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pic.delete()
+        self.assertFalse(default_storage.exists(thumbnails.variant_name(pic.image.name, 160, "jpg")))
+
+    def test_shared_upload_keeps_variants_while_in_use(self):
+        other = Product.objects.create(category=self.product.category, name="White Eggs", price=Decimal("5"))
+        a = self._add_image()
+        with self.captureOnCommitCallbacks(execute=True):
+            b = ProductImage.objects.create(product=other, image=jpeg_upload())  # identical bytes
+        self.assertEqual(a.image.name, b.image.name)
+        variant = thumbnails.variant_name(a.image.name, 480, "webp")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            a.delete()
+        self.assertTrue(default_storage.exists(variant))
+        with self.captureOnCommitCallbacks(execute=True):
+            b.delete()
+        self.assertFalse(default_storage.exists(variant))
+
+    def _render_filters(self, pic):
+        return Template('{% load thumbnails %}{{ pic.image|srcset:"webp" }}|{{ pic.image|thumb_url }}').render(
+            Context({"pic": pic})
+        )
+
+    def test_srcset_filter(self):
+        pic = ProductImage(product=self.product, image="products/eggs.jpg", thumbs_name="products/eggs.jpg")
+        self.assertEqual(
+            self._render_filters(pic),
+            "/media/thumbs/products/eggs_w160.webp 160w, /media/thumbs/products/eggs_w480.webp 480w, "
+            "/media/thumbs/products/eggs_w960.webp 960w|/media/thumbs/products/eggs_w160.jpg",
+        )
+
+    def test_missing_variants_fall_back_to_original(self):
+        with mock.patch.object(thumbnails, "generate_variants", side_effect=OSError("disk full")):
+            with self.assertLogs("products.thumbnails", "ERROR"):
+                pic = self._add_image()
+        pic.refresh_from_db()
+        self.assertEqual(pic.thumbs_name, "")
+        self.assertEqual(self._render_filters(pic), f"{pic.image.url}|{pic.image.url}")
+
+        call_command("build_thumbnails", workers=1, stdout=StringIO())
+        pic.refresh_from_db()
+        self.assertEqual(pic.thumbs_name, pic.image.name)
+        self.assertIn("_w480.webp 480w", self._render_filters(pic))
+
+        pic.image = jpeg_upload(name="other.jpg", size=(640, 480))  # replaced upload: not built yet
+        self.assertEqual(self._render_filters(pic).split("|")[1], pic.image.url)
+
+    def test_backfill_command(self):
+        pics = [self._add_image(name=f"p{i}.jpg", size=(640, 480)) for i in range(3)]
+        for pic in pics[:2]:
+            for name in thumbnails.variant_names(pic.image.name):
+                default_storage.delete(name)
+        out = StringIO()
+        call_command("build_thumbnails", workers=2, stdout=out)
+        self.assertIn("Wrote 12 variant(s) for 3 image(s).", out.getvalue())
+        self.assertTrue(all(
+            default_storage.exists(n) for pic in pics for n in thumbnails.variant_names(pic.image.name)
+        ))
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_uploads_get_content_hashed_names(self):
+        first = default_storage.save("products/eggs.jpg", jpeg_upload())
+        self.assertRegex(first, r"^products/eggs\.[0-9a-f]{12}\.jpg$")
+        self.assertEqual(default_storage.save("products/eggs.jpg", jpeg_upload()), first)  # same bytes, same file
+        other = default_storage.save("products/eggs.jpg", jpeg_upload(size=(10, 10)))
+        self.assertNotEqual(other, first)
+        self.assertEqual(default_storage.save(first, jpeg_upload()), first)  # hashes don't stack
+
+    def test_hashed_file_served_immutable_with_etag(self):
+        name = default_storage.save("products/eggs.jpg", jpeg_upload())
+        url = default_storage.url(name)
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Type"], "image/jpeg")
+        self.assertEqual(resp["Cache-Control"], "public, max-age=31536000, immutable")
+        body = b"".join(resp.streaming_content)
+        self.assertEqual(body, default_storage.open(name).read())
+
+        again = self.client.get(url, HTTP_IF_NONE_MATCH=resp["ETag"])
+        self.assertEqual(again.status_code, 304)
+
+    def test_byte_ranges(self):
+        name = default_storage.save("products/eggs.jpg", jpeg_upload())
+        data = default_storage.open(name).read()
+        url = default_storage.url(name)
+
+        resp = self.client.get(url, HTTP_RANGE="bytes=10-19")
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp["Content-Range"], f"bytes 10-19/{len(data)}")
+        self.assertEqual(b"".join(resp.streaming_content), data[10:20])
+
+        tail = self.client.get(url, HTTP_RANGE="bytes=-5")
+        self.assertEqual(b"".join(tail.streaming_content), data[-5:])
+        self.assertEqual(self.client.get(url, HTTP_RANGE=f"bytes={len(data)}-").status_code, 416)
+        # Stale If-Range: whole file instead
+        self.assertEqual(self.client.get(url, HTTP_RANGE="bytes=0-1", HTTP_IF_RANGE='"old"').status_code, 200)
+
+    def test_precompressed_and_unhashed_files(self):
+        svg = "<svg xmlns='http://www.w3.org/2000/svg'>" + "<rect width='1' height='1'/>" * 50 + "</svg>"
+        name = default_storage.save("categories/logo.svg", ContentFile(svg.encode()))
+        self.assertTrue(default_storage.exists(name + ".gz"))
+        resp = self.client.get(default_storage.url(name), HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        self.assertEqual(resp["Vary"], "Accept-Encoding")
+
+        legacy = FileSystemStorage(location=self.media).save("products/old.jpg", jpeg_upload())
+        resp = self.client.get(default_storage.url(legacy))
+        self.assertEqual(resp["Cache-Control"], "public, max-age=0, must-revalidate")
+
+    def test_paths_outside_media_root_404(self):
+        self.assertEqual(self.client.get("/media/../config/settings.py").status_code, 404)
+        self.assertEqual(self.client.get("/media/%2e%2e/manage.py").status_code, 404)
+
+
+class AdminChangelistQueryTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        self.client.force_login(self.admin)
+
+    def _add(self, n_categories, per_category):
+        start = Category.objects.count()
+        cats = Category.objects.bulk_create(
+            Category(name=f"Cat {i}", slug=f"cat-{i}") for i in range(start, start + n_categories)
+        )
+        self._add_products(cats, per_category)
+
+    def _add_products(self, cats, per_category):
+        start = Product.objects.count()
+        products = Product.objects.bulk_create(
+            Product(category=c, name=f"Item {start + k}", slug=f"item-{start + k}", price=Decimal("1"))
+            for k, c in enumerate(c for c in cats for _ in range(per_category))
+        )
+        ProductImage.objects.bulk_create(ProductImage(product=p, image=f"products/{p.slug}.jpg") for p in products)
+        for p in products:
+            signals.sync_primary_image(p.pk)
+
+    def _queries(self, model):
+        url = reverse(f"admin:products_{model}_changelist")
+        self.client.get(url)  # warm session/content-type caches
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_category_changelist_constant_queries(self):
+        self._add(10, 3)
+        small = self._queries("category")
+        self._add(490, 3)
+        self.assertEqual(self._queries("category"), small)
+
+    def test_product_and_image_changelists_constant_queries(self):
+        self._add(5, 2)
+        small = [self._queries("product"), self._queries("productimage")]
+        self._add_products(list(Category.objects.all()), 98)
+        self.assertEqual([self._queries("product"), self._queries("productimage")], small)
+
+    def test_category_links_are_bounded(self):
+        self._add(1, 12)
+        resp = self.client.get(reverse("admin:products_category_changelist"))
+        self.assertContains(resp, "+2 more")
+
+
+class CategoryProductInlineTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        self.client.force_login(self.admin)
+        self.cat = Category.objects.create(name="Vegetables")
+        Product.objects.bulk_create(
+            Product(category=self.cat, name=f"Veg {i:03d}", slug=f"veg-{i}", price=Decimal("1")) for i in range(60)
+        )
+        self.url = reverse("admin:products_category_change", args=[self.cat.pk])
+
+    def _formset(self, page):
+        resp = self.client.get(self.url, {"products_page": page})
+        self.assertEqual(resp.status_code, 200)
+        return resp, resp.context["inline_admin_formsets"][0].formset
+
+    def test_only_one_page_of_forms(self):
+        resp, formset = self._formset(1)
+        self.assertEqual(formset.initial_form_count(), PaginatedInlineFormSet.per_page)
+        self.assertContains(resp, "Page 1 of 3 (60 products)")
+        _, formset = self._formset(3)
+        self.assertEqual([f.instance.name for f in formset.initial_forms][0], "Veg 050")
+        self.assertEqual(formset.initial_form_count(), 10)
+
+    def test_save_posts_and_updates_only_the_page(self):
+        _, formset = self._formset(2)
+        data = {"name": self.cat.name, "slug": self.cat.slug, "description": ""}
+        for form in formset.initial_forms:
+            for name in form.fields:
+                value = form[name].value()
+                data[form.add_prefix(name)] = "" if value is None else value
+        data.update({
+            f"{formset.prefix}-TOTAL_FORMS": formset.initial_form_count(),
+            f"{formset.prefix}-INITIAL_FORMS": formset.initial_form_count(),
+            f"{formset.prefix}-MIN_NUM_FORMS": 0,
+            f"{formset.prefix}-MAX_NUM_FORMS": 1000,
+        })
+        target = formset.initial_forms[0]
+        data[target.add_prefix("price")] = "9.99"
+
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.post(f"{self.url}?products_page=2", data)
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(Product.objects.get(pk=target.instance.pk).price, Decimal("9.99"))
+        product_updates = [q for q in ctx.captured_queries if q["sql"].startswith('UPDATE "products_product"')]
+        self.assertEqual(len(product_updates), 1)
+
+
+class ImportExportTests(TestCase):
+    def setUp(self):
+        self.veg = Category.objects.create(name="Vegetables")
+        self.kale = Product.objects.create(category=self.veg, name="Kale", price=Decimal("3"), stock_qty=5)
+        self.leek = Product.objects.create(category=self.veg, name="Leeks", price=Decimal("2"), stock_qty=1)
+
+    def _import(self, text, **options):
+        out, err = StringIO(), StringIO()
+        with mock.patch("sys.stdin", StringIO(text)), self.captureOnCommitCallbacks(execute=True):
+            call_command("import_products", "-", stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_import_updates_only_given_columns(self):
+        out, err = self._import(
+            "slug,stock_qty,sale_price\n"
+            "kale,12,2.50\n"
+            "leeks,1,\n"
+            "nope,3,\n"
+            "kale,abc,\n"
+        )
+        self.kale.refresh_from_db()
+        self.assertEqual((self.kale.price, self.kale.stock_qty, self.kale.sale_price),
+                         (Decimal("3.00"), Decimal("12.00"), Decimal("2.50")))
+        self.assertIn("Imported 4 row(s): 1 updated, 0 created, 1 unchanged, 2 failed.", out)
+        self.assertIn("line 4: nope: no such product", err)
+        self.assertIn("line 5: kale:", err)
+
+    def test_jsonl_import_in_batches_creates_and_bumps_catalogue(self):
+        from store.catalogue import catalogue_version
+
+        before = catalogue_version()
+        rows = [{"slug": "kale", "price": "3.25"}, {"slug": "leeks", "stock_qty": "0"}]
+        rows += [{"slug": f"squash-{i}", "name": f"Squash {i}", "category": "vegetables", "price": "4"} for i in range(3)]
+        out, err = self._import("\n".join(json.dumps(r) for r in rows) + "\n", format="jsonl",
+                                batch_size=2, create=True)
+        self.assertEqual(err, "")
+        self.assertIn("batch 3:", out)
+        self.assertIn("2 updated, 3 created", out)
+        self.assertEqual(Product.objects.get(slug="squash-2").category, self.veg)
+        self.assertEqual(
+            set(search.search_product_ids("squash")),
+            set(Product.objects.filter(slug__startswith="squash").values_list("id", flat=True)),
+        )
+        self.assertNotEqual(catalogue_version(), before)
+
+    def test_export_streams_csv_and_jsonl(self):
+        out = StringIO()
+        call_command("export_products", stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], "slug,name,category,unit,price,sale_price,stock_qty")
+        self.assertEqual(lines[1], "kale,Kale,vegetables,ea,3.00,,5.00")
+
+        out = StringIO()
+        call_command("export_products", format="jsonl", stdout=out)
+        first = json.loads(out.getvalue().splitlines()[0])
+        self.assertEqual(first["slug"], "kale")
+        self.assertEqual(first["stock_qty"], "5.00")
+
+
+class BulkActionTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        self.client.force_login(self.admin)
+        self.veg = Category.objects.create(name="Vegetables")
+        self.fruit = Category.objects.create(name="Fruit")
+        Product.objects.bulk_create(
+            Product(category=self.veg if i % 2 else self.fruit, name=f"Item {i}", slug=f"item-{i}",
+                    price=Decimal("10.00"), stock_qty=Decimal("3"))
+            for i in range(40)
+        )
+
+    def _post(self, model, action, ids=(), **extra):
+        data = {"action": action, "index": 0, "_selected_action": [str(pk) for pk in ids], **extra}
+        return self.client.post(reverse(f"admin:products_{model}_changelist"), data)
+
+    def test_confirmation_page_then_single_update(self):
+        ids = list(Product.objects.filter(category=self.veg).values_list("pk", flat=True))
+        resp = self._post("product", "sale_percent_off", ids)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTemplateUsed(resp, "admin/products/bulk_update_confirm.html")
+        self.assertContains(resp, "20 products")
+        self.assertFalse(Product.objects.exclude(sale_price=None).exists())
+
+        from store.catalogue import catalogue_version
+
+        before = catalogue_version()
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            resp = self._post("product", "sale_percent_off", ids, apply="1", amount="25")
+        self.assertEqual(resp.status_code, 302)
+        updates = [q for q in ctx.captured_queries if q["sql"].startswith('UPDATE "products_product"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(set(Product.objects.filter(category=self.veg).values_list("sale_price", flat=True)),
+                         {Decimal("7.50")})
+        self.assertFalse(Product.objects.filter(category=self.fruit).exclude(sale_price=None).exists())
+        self.assertNotEqual(catalogue_version(), before)
+
+    def test_invalid_amount_redisplays_form(self):
+        pk = Product.objects.first().pk
+        resp = self._post("product", "sale_percent_off", [pk], apply="1", amount="150")
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(Product.objects.exclude(sale_price=None).exists())
+
+    def test_category_actions_cover_every_product_in_category(self):
+        self._post("category", "set_stock", [self.veg.pk], apply="1", amount="12")
+        self.assertEqual(set(Product.objects.filter(category=self.veg).values_list("stock_qty", flat=True)),
+                         {Decimal("12")})
+        self.assertEqual(set(Product.objects.filter(category=self.fruit).values_list("stock_qty", flat=True)),
+                         {Decimal("3")})
+
+        self._post("category", "add_stock", [self.veg.pk, self.fruit.pk], apply="1", amount="-5")
+        self.assertEqual(set(Product.objects.filter(category=self.veg).values_list("stock_qty", flat=True)),
+                         {Decimal("7")})
+        self.assertEqual(set(Product.objects.filter(category=self.fruit).values_list("stock_qty", flat=True)),
+                         {Decimal("0")})
+
+        Product.objects.update(sale_price=Decimal("1"))
+        self._post("category", "clear_sale", [self.fruit.pk], apply="1")
+        self.assertEqual(Product.objects.filter(sale_price=None).count(), 20)
+
+    def test_category_editor_without_product_permission_cannot_run_actions(self):
+        editor = User.objects.create_user("editor", "editor@example.com", "pw", is_staff=True)
+        editor.user_permissions.set(Permission.objects.filter(codename__in=["view_category", "change_category"]))
+        self.client.force_login(editor)
+
+        resp = self.client.get(reverse("admin:products_category_changelist"))
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotContains(resp, "set_stock")
+        self._post("category", "set_stock", [self.veg.pk], apply="1", amount="12")
+        self.assertFalse(Product.objects.filter(stock_qty=Decimal("12")).exists())
+
+        editor.user_permissions.add(Permission.objects.get(codename="change_product"))
+        self.client.force_login(User.objects.get(pk=editor.pk))  # fresh permission cache
+        self._post("category", "set_stock", [self.veg.pk], apply="1", amount="12")
+        self.assertEqual(Product.objects.filter(stock_qty=Decimal("12")).count(), 20)
@@ -0,0 +1,119 @@
+"""
+Resized WebP/JPEG derivatives of uploaded product and category photos.
+
+Variants live next to the originals under ``thumbs/`` in the same storage,
+at a path derived from the original's name::
+
+    products/eggs.jpg  ->  thumbs/products/eggs_w480.webp, ..._w480.jpg
+
+Because the name is deterministic, templates can build ``srcset`` values
+without touching the disk. Variants are written after an image row is
+committed (see products.signals) and backfilled for older uploads with
+``manage.py build_thumbnails``; both then record the name in the row's
+``thumbs_name``. Until they have, ``image_url`` and ``image_srcset`` serve
+the original upload instead of a variant that may not exist.
+"""
+from __future__ import annotations
+
+import logging
+import posixpath
+from io import BytesIO
+from typing import List, Sequence
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+VARIANT_DIR = "thumbs"
+WIDTHS = (160, 480, 960)
+FORMATS = ("webp", "jpg")
+QUALITY = {"webp": 80, "jpg": 82}
+_PIL_FORMAT = {"webp": "WEBP", "jpg": "JPEG"}
+
+
+def variant_name(name: str, width: int, fmt: str) -> str:
+    stem, _ext = posixpath.splitext(name)
+    return f"{VARIANT_DIR}/{stem}_w{width}.{fmt}"
+
+
+def variant_names(name: str) -> List[str]:
+    return [variant_name(name, w, fmt) for w in WIDTHS for fmt in FORMATS]
+
+
+def variant_url(name: str, width: int, fmt: str = "jpg") -> str:
+    return default_storage.url(variant_name(name, width, fmt))
+
+
+def srcset(name: str, fmt: str = "jpg", widths: Sequence[int] = WIDTHS) -> str:
+    return ", ".join(f"{variant_url(name, w, fmt)} {w}w" for w in widths)
+
+
+def variants_ready(image) -> bool:
+    """Whether the row owning the FieldFile ``image`` has recorded its variants as written."""
+    return bool(image) and getattr(image.instance, "thumbs_name", "") == image.name
+
+
+def image_url(image, width: int, fmt: str = "jpg") -> str:
+    """URL of one variant of the FieldFile ``image``, or of the original while variants are missing."""
+    if not image:
+        return ""
+    return variant_url(image.name, width, fmt) if variants_ready(image) else image.url
+
+
+def image_srcset(image, fmt: str = "jpg", widths: Sequence[int] = WIDTHS) -> str:
+    if not image:
+        return ""
+    return srcset(image.name, fmt, widths) if variants_ready(image) else image.url
+
+
+def generate_variants(name: str, *, force: bool = False, storage=default_storage) -> int:
+    """
+    Write every missing variant of the stored image ``name`` (all of them with
+    ``force``). Originals narrower than a width are saved at their own size
+    rather than upscaled, so every variant name always exists afterwards.
+    Returns the number of files written.
+    """
+    todo = [
+        (w, fmt) for w in WIDTHS for fmt in FORMATS
+        if force or not storage.exists(variant_name(name, w, fmt))
+    ]
+    if not todo:
+        return 0
+
+    with storage.open(name, "rb") as fh:
+        with Image.open(fh) as src:
+            src = ImageOps.exif_transpose(src)  # phone photos carry rotation in EXIF
+            src = src.convert("RGB")
+
+    written = 0
+    for width in sorted({w for w, _ in todo}, reverse=True):
+        img = src
+        if src.width > width:
+            img = src.resize((width, round(src.height * width / src.width)), Image.Resampling.LANCZOS)
+        for fmt in (f for w, f in todo if w == width):
+            buf = BytesIO()
+            img.save(buf, _PIL_FORMAT[fmt], quality=QUALITY[fmt], optimize=True)
+            target = variant_name(name, width, fmt)
+            if storage.exists(target):
+                storage.delete(target)
+            storage.save(target, ContentFile(buf.getvalue()))
+            written += 1
+    return written
+
+
+def generate_variants_quietly(name: str) -> bool:
+    """``generate_variants`` for use after commit: a bad upload is logged, not raised. True on success."""
+    try:
+        generate_variants(name)
+    except Exception:
+        logger.exception("Could not build thumbnails for %s", name)
+        return False
+    return True
+
+
+def delete_variants(name: str, storage=default_storage) -> None:
+    for target in variant_names(name):
+        if storage.exists(target):
+            storage.delete(target)
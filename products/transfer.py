@@ -0,0 +1,206 @@
+"""
+Streaming CSV / JSONL import and export of product prices and stock
+(``manage.py import_products`` / ``export_products``).
+
+Rows are matched on ``slug`` and applied in batches: one SELECT for the
+batch's slugs, one ``bulk_update`` (only the columns the file provides) and
+one ``bulk_create`` for new products, in a transaction per batch. Memory
+stays flat however long the file is. Because bulk writes skip model signals,
+each committed batch sends ``products_bulk_changed`` (store clears its
+catalogue cache on it) and new products are added to the search index.
+"""
+from __future__ import annotations
+
+import csv
+import json
+from dataclasses import dataclass, field
+from decimal import Decimal
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.text import slugify
+
+from . import search
+from .models import Category, Product
+from .signals import products_bulk_changed
+
+FORMATS = ("csv", "jsonl")
+PRICE_FIELDS = ("price", "sale_price", "stock_qty")
+EXPORT_FIELDS = ("slug", "name", "category", "unit", "price", "sale_price", "stock_qty")
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    updated: int = 0
+    created: int = 0
+    unchanged: int = 0
+    failed: int = 0
+    batches: int = 0
+    errors: List[str] = field(default_factory=list)  # first MAX_REPORTED_ERRORS only
+
+    def error(self, line: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"line {line}: {message}")
+
+
+def format_for(path: str, fmt: Optional[str] = None) -> str:
+    if fmt:
+        return fmt
+    return "jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv"
+
+
+def read_rows(fh: TextIO, fmt: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """(line number, row dict) pairs, one at a time."""
+    if fmt == "csv":
+        reader = csv.DictReader(fh)
+        for row in reader:
+            yield reader.line_num, {k.strip(): v for k, v in row.items() if k}
+    else:
+        for line_no, line in enumerate(fh, start=1):
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError as exc:
+                    row = {"__error__": f"invalid JSON ({exc})"}
+                yield line_no, row if isinstance(row, dict) else {"__error__": "not a JSON object"}
+
+
+def _clean(name: str, value: Any) -> Any:
+    f = Product._meta.get_field(name)
+    if value == "" and f.null:
+        value = None
+    return f.clean(value, None)
+
+
+def _parse(row: Dict[str, Any]) -> Dict[str, Any]:
+    values = {}
+    for name in PRICE_FIELDS:
+        if name in row:
+            values[name] = _clean(name, row[name])
+    return values
+
+
+def _apply_batch(batch: List[Tuple[int, Dict[str, Any]]], report: ImportReport, create: bool,
+                 categories: Dict[str, Category]) -> List[int]:
+    slugs = {str(row.get("slug") or "").strip() for _, row in batch}
+    existing = {p.slug: p for p in Product.objects.filter(slug__in=slugs).only("id", "slug", *PRICE_FIELDS)}
+    to_update: Dict[str, Product] = {}
+    to_create: Dict[str, Product] = {}
+    touched: set = set()
+
+    for line, row in batch:
+        report.rows += 1
+        slug = str(row.get("slug") or "").strip()
+        if "__error__" in row:
+            report.error(line, row["__error__"])
+            continue
+        if not slug:
+            report.error(line, "missing slug")
+            continue
+        try:
+            values = _parse(row)
+        except ValidationError as exc:
+            report.error(line, f"{slug}: {'; '.join(exc.messages)}")
+            continue
+
+        product = existing.get(slug) or to_create.get(slug)
+        if product is None:
+            if not create:
+                report.error(line, f"{slug}: no such product")
+                continue
+            cat_key = str(row.get("category") or "").strip()
+            category = categories.get(cat_key) or categories.get(slugify(cat_key))
+            if not row.get("name") or category is None or "price" not in values:
+                report.error(line, f"{slug}: new products need name, an existing category and price")
+                continue
+            try:
+                product = Product(
+                    slug=_clean("slug", slug),
+                    name=_clean("name", str(row["name"]).strip()),
+                    unit=_clean("unit", row.get("unit") or Product.Unit.EACH),
+                    category=category,
+                    **values,
+                )
+            except ValidationError as exc:
+                report.error(line, f"{slug}: {'; '.join(exc.messages)}")
+                continue
+            to_create[slug] = product
+            continue
+
+        changed = [name for name, value in values.items() if getattr(product, name) != value]
+        for name in changed:
+            setattr(product, name, values[name])
+        if changed and product.pk:
+            to_update[slug] = product
+            touched.update(changed)
+        elif not changed:
+            report.unchanged += 1
+
+    changed_ids: List[int] = []
+    with transaction.atomic():
+        if to_update:
+            Product.objects.bulk_update(list(to_update.values()), sorted(touched))
+            changed_ids.extend(p.pk for p in to_update.values())
+        if to_create:
+            created = Product.objects.bulk_create(list(to_create.values()))
+            changed_ids.extend(p.pk for p in created)
+            search.index_products([p.pk for p in created])
+        if changed_ids:
+            ids = list(changed_ids)
+            transaction.on_commit(lambda: products_bulk_changed.send(sender=Product, product_ids=ids))
+    report.updated += len(to_update)
+    report.created += len(to_create)
+    report.batches += 1
+    return changed_ids
+
+
+def import_rows(rows: Iterable[Tuple[int, Dict[str, Any]]], *, batch_size: int = BATCH_SIZE,
+                create: bool = False, progress: Optional[Callable[[ImportReport], None]] = None) -> ImportReport:
+    """Apply ``rows`` (from ``read_rows``) batch by batch; each batch commits on its own."""
+    report = ImportReport()
+    categories: Dict[str, Category] = {}
+    if create:
+        for c in Category.objects.all():
+            categories[c.slug] = categories[c.name] = c
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        _apply_batch(batch, report, create, categories)
+        if progress:
+            progress(report)
+    return report
+
+
+def _export_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    return str(value) if isinstance(value, Decimal) else value
+
+
+def export_rows(out: TextIO, fmt: str, *, chunk_size: int = 2000) -> int:
+    """Stream every product to ``out`` without loading the table; returns the row count."""
+    qs = (
+        Product.objects.order_by("id")
+        .values_list("slug", "name", "category__slug", "unit", "price", "sale_price", "stock_qty")
+        .iterator(chunk_size=chunk_size)
+    )
+    writer = csv.writer(out) if fmt == "csv" else None
+    if writer:
+        writer.writerow(EXPORT_FIELDS)
+    count = 0
+    for values in qs:
+        values = [_export_value(v) for v in values]
+        if writer:
+            writer.writerow(values)
+        else:
+            out.write(json.dumps(dict(zip(EXPORT_FIELDS, values))) + "\n")
+        count += 1
+    return count
@@ -1,3 +1,145 @@
-from django.shortcuts import render
+"""
+Production media serving (``MEDIA_URL`` is routed here when SERVE_MEDIA is on).
 
-# Create your views here.
+Content-hashed names (products.storage) are served as immutable for a year;
+anything else revalidates with its ETag. Supports conditional GETs, single
+byte ranges, and gzip siblings written next to compressible uploads.
+"""
+from __future__ import annotations
+
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse, Http404, HttpRequest, HttpResponse, HttpResponseNotModified, StreamingHttpResponse,
+)
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags, quote_etag
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+
+from .storage import HASH_LENGTH
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, max-age=0, must-revalidate"
+
+# eggs.3f2a9c1b7d4e.jpg, or its thumbnail thumbs/…/eggs.3f2a9c1b7d4e_w480.webp
+HASHED_NAME = re.compile(r"\.[0-9a-f]{%d}(?:_w\d+)?\.[A-Za-z0-9]+$" % HASH_LENGTH)
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+def _etag(st: os.stat_result) -> str:
+    return quote_etag(f"{st.st_size:x}-{st.st_mtime_ns:x}")
+
+
+def _byte_range(header: str, size: int):
+    """(start, end) inclusive for a single satisfiable range, None to ignore, False if unsatisfiable."""
+    m = RANGE.match(header.strip())
+    if not m:
+        return None  # malformed or multi-range: send the whole file
+    first, last = m.groups()
+    if not first and not last:
+        return None
+    if not first:  # suffix: last N bytes
+        n = int(last)
+        if n == 0:
+            return False
+        return max(0, size - n), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def _read_range(path: str, start: int, length: int):
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        while length > 0:
+            chunk = fh.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@require_safe
+def serve_media(request: HttpRequest, path: str) -> HttpResponse:
+    try:
+        full = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:  # path escapes MEDIA_ROOT
+        raise Http404()
+    try:
+        st = os.stat(full)
+    except OSError:
+        raise Http404()
+    if not stat.S_ISREG(st.st_mode) or path.endswith(".gz"):
+        raise Http404()
+
+    content_type, _ = mimetypes.guess_type(full)
+    content_type = content_type or "application/octet-stream"
+    cache_control = IMMUTABLE if HASHED_NAME.search(path) else REVALIDATE
+
+    # Precompressed sibling (only for whole-file responses)
+    encoding = None
+    has_range = "HTTP_RANGE" in request.META
+    if not has_range and "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", ""):
+        try:
+            gz_st = os.stat(full + ".gz")
+        except OSError:
+            pass
+        else:
+            full, st, encoding = full + ".gz", gz_st, "gzip"
+
+    etag = _etag(st)
+    headers = {
+        "Cache-Control": cache_control,
+        "ETag": etag,
+        "Last-Modified": http_date(st.st_mtime),
+        "Accept-Ranges": "bytes",
+        "Vary": "Accept-Encoding",
+    }
+
+    inm = request.META.get("HTTP_IF_NONE_MATCH")
+    if inm is not None:
+        tags = parse_etags(inm)
+        if "*" in tags or any(t.removeprefix("W/") == etag for t in tags):
+            return _with_headers(HttpResponseNotModified(), headers)
+    elif not was_modified_since(request.META.get("HTTP_IF_MODIFIED_SINCE"), st.st_mtime):
+        return _with_headers(HttpResponseNotModified(), headers)
+
+    byte_range = None
+    if has_range:
+        if_range = request.META.get("HTTP_IF_RANGE")
+        if if_range is None or if_range.strip() == etag:
+            byte_range = _byte_range(request.META["HTTP_RANGE"], st.st_size)
+        if byte_range is False:
+            response = HttpResponse(status=416, content_type=content_type)
+            response["Content-Range"] = f"bytes */{st.st_size}"
+            return _with_headers(response, headers)
+
+    if request.method == "HEAD":
+        response = HttpResponse(content_type=content_type)
+        response["Content-Length"] = str(st.st_size)
+    elif byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(_read_range(full, start, length), status=206, content_type=content_type)
+        response["Content-Length"] = str(length)
+        response["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+    else:
+        response = FileResponse(open(full, "rb"), content_type=content_type)
+    if encoding:
+        response["Content-Encoding"] = encoding
+    return _with_headers(response, headers)
+
+
+def _with_headers(response: HttpResponse, headers) -> HttpResponse:
+    for key, value in headers.items():
+        response[key] = value
+    return response
@@ -1,6 +1,6 @@
 from __future__ import annotations
 from django.contrib import admin
-from .models import Profile, Coupon, Order, OrderItem, Rating
+from .models import Profile, Coupon, Order, OrderItem, Rating, OutboxEmail
 
 
 @admin.register(Profile)
@@ -33,6 +33,7 @@ class OrderAdmin(admin.ModelAdmin):
     list_filter = ("created_at",)
     search_fields = ("email", "user__email")
     readonly_fields = ("customer_display",)
+    list_select_related = ("user",)  # customer column
 
     # Changelist columns
     def customer(self, obj):
@@ -82,3 +83,11 @@ class RatingAdmin(admin.ModelAdmin):
     list_display = ("product", "user", "stars", "created_at")
     list_filter = ("stars", "created_at")
     search_fields = ("product__name", "user__email")
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ("subject", "status", "attempts", "next_attempt_at", "created_at", "sent_at")
+    list_filter = ("status",)
+    search_fields = ("subject", "recipients")
+    readonly_fields = ("created_at", "sent_at", "claimed_by", "last_error")
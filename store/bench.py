@@ -0,0 +1,424 @@
+"""
+Synthetic data and per-view benchmarks.
+
+``manage.py seed_bench`` bulk-generates a shop at a given scale (categories,
+products with images, users with profiles and favorites, orders, ratings, coupons and
+sessions holding carts) with ``bulk_create`` in batches. Everything it
+creates is marked with BENCH_PREFIX so ``--clear`` can remove it again.
+
+``manage.py run_bench`` then drives every store: and accounts: view through
+the test client, signed in as a seeded shopper, inside a transaction that is
+rolled back, and reports p50/p95 latency, queries per request and peak
+Python memory per view as JSON, to compare runs between commits::
+
+    manage.py seed_bench --clear --products 100   && manage.py run_bench -o 100.json
+    manage.py seed_bench --clear --products 10000 && manage.py run_bench -o 10k.json
+    manage.py run_bench --compare 100.json
+"""
+from __future__ import annotations
+
+import platform
+import random
+import secrets
+import statistics
+import subprocess
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from products import search, thumbnails
+from products.models import Category, Product, ProductImage
+from .cart import Cart
+from .catalogue import bump_catalogue_version
+from .coupons import clear_coupon_cache
+from .models import Coupon, Favorite, Order, OrderItem, Profile, Rating
+from .ratings import recompute_rating_aggregates
+
+BENCH_PREFIX = "bench-"
+BENCH_COUPON_PREFIX = "BENCH"
+BENCH_SESSION_PREFIX = "bench"
+BENCH_PASSWORD = "bench"
+SHOPPER = f"{BENCH_PREFIX}shopper"
+
+WORDS = (
+    "Heirloom", "Organic", "Sweet", "Golden", "Baby", "Wild", "Smoked", "Fresh", "Pasture", "Raw",
+    "Tomato", "Kale", "Honey", "Eggs", "Cheddar", "Apple", "Squash", "Carrot", "Bacon", "Garlic",
+)
+
+
+@dataclass
+class SeedScale:
+    categories: int = 12
+    products: int = 1000
+    images_per_product: int = 2
+    users: int = 200
+    orders: int = 1000
+    items_per_order: int = 4
+    ratings: int = 3000
+    coupons: int = 20
+    sessions: int = 200
+    cart_lines: int = 6
+    favorites_per_user: int = 3
+    batch_size: int = 1000
+    seed: int = 42
+
+
+def _batches(items: Iterable, size: int) -> Iterator[list]:
+    it = iter(items)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _bulk(model, objs: Iterable, batch_size: int) -> list:
+    created = []
+    for batch in _batches(objs, batch_size):
+        created += model.objects.bulk_create(batch)
+    return created
+
+
+def _placeholder_image() -> str:
+    """One real stored photo (with thumbnails) shared by every seeded image row."""
+    buf = BytesIO()
+    Image.new("RGB", (1200, 900), (120, 160, 80)).save(buf, "JPEG", quality=80)
+    name = default_storage.save(f"products/{BENCH_PREFIX}placeholder.jpg", ContentFile(buf.getvalue()))
+    thumbnails.generate_variants(name)
+    return name
+
+
+def clear_bench_data() -> None:
+    User = get_user_model()
+    with transaction.atomic():
+        Order.objects.filter(user__username__startswith=BENCH_PREFIX).delete()  # OrderItem protects products
+        Product.objects.filter(slug__startswith=BENCH_PREFIX).delete()
+        Category.objects.filter(slug__startswith=BENCH_PREFIX).delete()
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        Coupon.objects.filter(code__startswith=BENCH_COUPON_PREFIX).delete()
+        Session.objects.filter(session_key__startswith=BENCH_SESSION_PREFIX).delete()
+    bump_catalogue_version()
+    clear_coupon_cache()
+
+
+def seed(scale: SeedScale, log: Callable[[str], None] = lambda msg: None) -> Dict[str, int]:
+    """Create a synthetic shop; returns row counts per model."""
+    rng = random.Random(scale.seed)
+    size = scale.batch_size
+    User = get_user_model()
+    now = timezone.now()
+    counts: Dict[str, int] = {}
+
+    cats = _bulk(Category, (
+        Category(name=f"{BENCH_PREFIX}{WORDS[i % len(WORDS)]} {i}", slug=f"{BENCH_PREFIX}cat-{i}")
+        for i in range(scale.categories)
+    ), size)
+    counts["categories"] = len(cats)
+    log(f"{len(cats)} categories")
+
+    def make_product(i):
+        price = Decimal(rng.randrange(100, 4000)) / 100
+        return Product(
+            category=cats[i % len(cats)],
+            name=f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}",
+            slug=f"{BENCH_PREFIX}product-{i}",
+            description="Grown and packed on the farm this week.",
+            unit=rng.choice(Product.Unit.values),
+            price=price,
+            sale_price=(price * Decimal("0.8")).quantize(Decimal("0.01")) if rng.random() < 0.1 else None,
+            stock_qty=Decimal(rng.choice((0, 5, 20, 100))),
+        )
+
+    products = []
+    for batch in _batches(range(scale.products), size):
+        created = Product.objects.bulk_create(make_product(i) for i in batch)
+        search.index_products(p.pk for p in created)
+        products += created
+    counts["products"] = len(products)
+    log(f"{len(products)} products")
+
+    if scale.images_per_product and products:
+        image = _placeholder_image()
+        counts["images"] = len(_bulk(ProductImage, (
+            ProductImage(product=p, image=image, alt=p.name, thumbs_name=image) for p in products for _ in range(scale.images_per_product)
+        ), size))
+        first_image = ProductImage.objects.filter(product=OuterRef("pk")).order_by("pk").values("pk")[:1]
+        Product.objects.filter(slug__startswith=BENCH_PREFIX).update(primary_image=Subquery(first_image))
+        log(f"{counts['images']} product images")
+
+    password = make_password(BENCH_PASSWORD)  # hash once, not per user
+    users = _bulk(User, (
+        User(username=SHOPPER if i == 0 else f"{BENCH_PREFIX}user-{i}", email=f"{BENCH_PREFIX}user-{i}@example.com",
+             password=password, first_name=rng.choice(WORDS))
+        for i in range(max(1, scale.users))
+    ), size)
+    _bulk(Profile, (Profile(user=u, phone=f"555-{i:04d}") for i, u in enumerate(users)), size)
+    favorites = _bulk(Favorite, (
+        Favorite(user=u, product=p) for u in users
+        for p in rng.sample(products, min(scale.favorites_per_user, len(products)))
+    ), size)
+    counts["users"], counts["favorites"] = len(users), len(favorites)
+    log(f"{len(users)} users with profiles, {len(favorites)} favorites")
+
+    orders, items = [], []
+    for i in range(scale.orders):
+        lines = []
+        for p in rng.sample(products, min(scale.items_per_order, len(products))):
+            qty = Decimal(rng.randint(1, 3))
+            lines.append(OrderItem(product=p, qty=qty, unit=p.unit, unit_price=p.price, line_total=p.price * qty))
+        total = sum((line.line_total for line in lines), Decimal("0"))
+        orders.append(Order(user=rng.choice(users), email=f"{BENCH_PREFIX}order-{i}@example.com",
+                            payment_method="cash", subtotal=total, total=total))
+        items.append(lines)
+    orders = _bulk(Order, orders, size)
+    for order, lines in zip(orders, items):
+        for line in lines:
+            line.order = order
+    items = _bulk(OrderItem, (line for lines in items for line in lines), size)
+    counts["orders"], counts["order_items"] = len(orders), len(items)
+    log(f"{len(orders)} orders, {len(items)} items")
+
+    # Only buyers rate, one rating per (product, user)
+    bought = list({(i.product_id, i.order.user_id) for i in items})
+    rng.shuffle(bought)
+    ratings = _bulk(Rating, (
+        Rating(product_id=pid, user_id=uid, stars=rng.randint(1, 5),
+               text=rng.choice(("", "", "Lovely.", "Will buy again.", "Smaller than expected.")))
+        for pid, uid in bought[:scale.ratings]
+    ), size)
+    recompute_rating_aggregates()
+    counts["ratings"] = len(ratings)
+    log(f"{len(ratings)} ratings")
+
+    counts["coupons"] = len(_bulk(Coupon, (
+        Coupon(code=f"{BENCH_COUPON_PREFIX}{i}", percent_off=Decimal(rng.choice((5, 10, 15))))
+        for i in range(scale.coupons)
+    ), size))
+
+    def make_session(i):
+        data = _SessionDict()
+        cart = Cart(data)
+        for p in rng.sample(products, min(scale.cart_lines, len(products))):
+            cart.set(p.pk, Decimal(rng.randint(1, 3)))
+        return Session(
+            session_key=f"{BENCH_SESSION_PREFIX}{secrets.token_hex(16)}",
+            session_data=SessionStore().encode(dict(data)),
+            expire_date=now + timedelta(seconds=settings.SESSION_COOKIE_AGE),
+        )
+
+    counts["sessions"] = len(_bulk(Session, (make_session(i) for i in range(scale.sessions)), size))
+    log(f"{counts['sessions']} sessions with carts")
+
+    bump_catalogue_version()
+    clear_coupon_cache()
+    return counts
+
+
+class _SessionDict(dict):
+    modified = False
+
+
+# --- Benchmarks ------------------------------------------------------------------
+
+@dataclass
+class ViewResult:
+    name: str
+    method: str
+    path: str
+    status: int
+    iterations: int
+    p50_ms: float
+    p95_ms: float
+    mean_ms: float
+    queries: int
+    peak_kb: float
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+
+class _Rollback(Exception):
+    pass
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))  # ceil
+    return ordered[int(rank) - 1]
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def _routes(product_ids: List[int]) -> List[tuple]:
+    """(name, method, url, data, repeatable) for every store: and accounts: view."""
+    a = product_ids[0]
+    return [
+        ("store:catalogue", "get", reverse("store:catalogue"), {}, True),
+        ("store:catalogue?q", "get", reverse("store:catalogue"), {"q": "honey"}, True),
+        ("store:catalogue?fav", "get", reverse("store:catalogue"), {"fav": "1"}, True),
+        ("store:cart", "get", reverse("store:cart"), {}, True),
+        ("store:update_qty", "post", reverse("store:update_qty", args=[a]), {"qty": "1"}, True),
+        ("store:apply_coupon", "post", reverse("store:apply_coupon"), {"code": ""}, True),
+        ("store:favorites_count", "get", reverse("store:favorites_count"), {}, True),
+        ("store:toggle_favorite", "post", reverse("store:toggle_favorite", args=[a]), {}, True),
+        ("store:rate_product", "post", reverse("store:rate_product", args=[a]), {"stars": "4"}, True),
+        ("store:reviews_detail", "get", reverse("store:reviews_detail", args=[a]), {}, True),
+        ("store:reviews_page", "get", reverse("store:reviews_page", args=[a]), {}, True),
+        ("store:orders", "get", reverse("store:orders"), {}, True),
+        ("store:thanks", "get", reverse("store:thanks", args=[1]), {}, True),
+        ("accounts:profile", "get", reverse("accounts:profile"), {}, True),
+        ("accounts:orders", "get", reverse("accounts:orders"), {}, True),
+        ("accounts:signup", "get", reverse("accounts:signup"), {}, True),
+        ("accounts:login", "get", reverse("accounts:login"), {}, True),
+        # Each checkout empties the cart and the logout ends the session: refilled per iteration
+        ("store:checkout", "post", reverse("store:checkout"),
+         {"email": f"{BENCH_PREFIX}checkout@example.com", "payment_method": "cash"}, False),
+        ("store:remove_from_cart", "post", reverse("store:remove_from_cart", args=[a]), {}, False),
+        ("accounts:logout", "post", reverse("accounts:logout"), {}, False),
+    ]
+
+
+def run_benchmarks(*, iterations: int = 20, cold: bool = False, only: Optional[List[str]] = None,
+                   log: Callable[[str], None] = lambda msg: None) -> Dict[str, Any]:
+    """
+    Time every view ``iterations`` times (after one warm-up request). With
+    ``cold`` the cache is cleared before every request. All writes are rolled
+    back. Raises LookupError if there is no seeded shopper.
+    """
+    User = get_user_model()
+    shopper = User.objects.filter(username=SHOPPER).first()
+    product_ids = list(
+        Product.objects.filter(slug__startswith=BENCH_PREFIX, stock_qty__gt=0).order_by("pk").values_list("pk", flat=True)[:20]
+    )
+    if shopper is None or not product_ids:
+        raise LookupError("No benchmark data; run `manage.py seed_bench` first.")
+    # The shopper has bought the rated product, so rate_product takes the full path
+    if not OrderItem.objects.filter(order__user=shopper, product_id=product_ids[0]).exists():
+        product_ids.insert(0, OrderItem.objects.filter(order__user=shopper).values_list("product_id", flat=True).first()
+                           or product_ids[0])
+
+    results: List[ViewResult] = []
+    try:
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            client = Client()
+
+            def prepare():
+                client.force_login(shopper)
+                session = client.session
+                cart = Cart(session)
+                for pid in product_ids[:6]:
+                    cart.set(pid, Decimal("1"))
+                session.save()
+                if cold:
+                    cache.clear()
+                    clear_coupon_cache()
+
+            for name, method, url, data, repeatable in _routes(product_ids):
+                if only and name.split("?")[0] not in only and name not in only:
+                    continue
+                results.append(_measure(client, prepare, name, method, url, data, iterations, repeatable, cold))
+                log(f"{name}: p50 {results[-1].p50_ms} ms, {results[-1].queries} queries")
+            raise _Rollback
+    except _Rollback:
+        pass
+
+    return {
+        "meta": {
+            "revision": _git_revision(),
+            "timestamp": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "iterations": iterations,
+            "cold_cache": cold,
+            "rows": {
+                "products": Product.objects.count(),
+                "orders": Order.objects.count(),
+                "ratings": Rating.objects.count(),
+                "users": User.objects.count(),
+            },
+        },
+        "views": [asdict(r) for r in results],
+    }
+
+
+def _measure(client: Client, prepare: Callable[[], None], name: str, method: str, url: str, data: dict,
+             iterations: int, repeatable: bool, cold: bool) -> ViewResult:
+    call = getattr(client, method)
+    prepare()
+    call(url, data)  # warm-up (template loading, first-touch caches)
+
+    timings, queries, status = [], [], 0
+    for _ in range(iterations):
+        if not repeatable or cold:
+            prepare()
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            response = call(url, data)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(len(ctx.captured_queries))
+        status = response.status_code
+
+    # Memory in a separate pass so tracing doesn't inflate the timings
+    if not repeatable or cold:
+        prepare()
+    tracemalloc.start()
+    try:
+        call(url, data)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return ViewResult(
+        name=name, method=method.upper(), path=url, status=status, iterations=iterations,
+        p50_ms=round(percentile(timings, 50), 2), p95_ms=round(percentile(timings, 95), 2),
+        mean_ms=round(statistics.fmean(timings), 2), queries=max(queries), peak_kb=round(peak / 1024, 1),
+        extra={"queries_min": min(queries)} if min(queries) != max(queries) else {},
+    )
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Per-view deltas of ``current`` against ``baseline`` (views present in both)."""
+    before = {v["name"]: v for v in baseline.get("views", [])}
+    rows = []
+    for view in current["views"]:
+        old = before.get(view["name"])
+        if old is None:
+            continue
+        rows.append({
+            "name": view["name"],
+            "p50_ms": (old["p50_ms"], view["p50_ms"]),
+            "p95_ms": (old["p95_ms"], view["p95_ms"]),
+            "queries": (old["queries"], view["queries"]),
+            "peak_kb": (old["peak_kb"], view["peak_kb"]),
+        })
+    return rows
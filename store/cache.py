@@ -0,0 +1,53 @@
+"""
+File cache without a directory scan per write (``store.cache.FileCache``).
+
+Django's FileBasedCache culls on every ``set()``: it globs the whole cache
+directory (about 100 ms at 100k files) and, once MAX_ENTRIES is reached,
+deletes a random 1/CULL_FREQUENCY of the entries, live sessions included.
+
+This subclass checks at most once every CULL_INTERVAL seconds (OPTIONS,
+default 60) per process, so the cache can briefly run over MAX_ENTRIES.
+A cull drops expired files first and only then, if still over, the least
+recently written 1/CULL_FREQUENCY of the rest.
+"""
+from __future__ import annotations
+
+import os
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+
+DEFAULT_CULL_INTERVAL = 60
+
+
+class FileCache(FileBasedCache):
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._cull_interval = params.get("OPTIONS", {}).get("CULL_INTERVAL", DEFAULT_CULL_INTERVAL)
+        self._culled_at = float("-inf")
+
+    def _cull(self):
+        now = time.monotonic()
+        if now - self._culled_at < self._cull_interval:
+            return
+        self._culled_at = now
+        filelist = self._list_cache_files()
+        if len(filelist) < self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            return self.clear()
+
+        live = []
+        for fname in filelist:
+            try:
+                with open(fname, "rb") as f:
+                    if self._is_expired(f):  # deletes the file
+                        continue
+                live.append((os.path.getmtime(fname), fname))
+            except FileNotFoundError:
+                pass
+        if len(live) < self._max_entries:
+            return
+        live.sort()
+        for _mtime, fname in live[: len(live) // self._cull_frequency]:
+            self._delete(fname)
@@ -0,0 +1,145 @@
+"""
+Session cart.
+
+Stored under ``session["cart"]`` in a compact, versioned shape::
+
+    {"v": 2,
+     "items": {"<product id>": "<qty>", ...},
+     "count": "<sum of qty>",        # header badge
+     "lines": <number of items>,
+     "subtotal": "<last priced subtotal>",
+     "holder": "<stock reservation token, once something was reserved>"}
+
+The summary block is adjusted on every mutation, so reading the item count
+is O(1) instead of re-parsing every entry. Older carts (``{pid: {"qty": ..}}``,
+``{pid: qty}``) are converted once, the first time they are touched.
+"""
+from __future__ import annotations
+
+import secrets
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterator, Tuple
+
+SESSION_KEY = "cart"
+VERSION = 2
+
+
+def _to_decimal(value) -> Decimal:
+    if isinstance(value, dict):  # legacy {"qty": ...} entry
+        value = value.get("qty", "0")
+    try:
+        return Decimal(str(value or "0"))
+    except (InvalidOperation, ValueError):
+        return Decimal("0")
+
+
+def _empty() -> dict:
+    return {"v": VERSION, "items": {}, "count": "0", "lines": 0, "subtotal": "0"}
+
+
+class Cart:
+    def __init__(self, session):
+        self.session = session
+        data = session.get(SESSION_KEY)
+        if not isinstance(data, dict) or data.get("v") != VERSION:
+            data = self._migrate(data)
+            if data["lines"] or SESSION_KEY in session:
+                session[SESSION_KEY] = data
+                session.modified = True
+        self.data = data
+
+    @staticmethod
+    def _migrate(legacy) -> dict:
+        data = _empty()
+        if isinstance(legacy, dict):
+            total = Decimal("0")
+            for pid, entry in legacy.items():
+                qty = _to_decimal(entry)
+                if qty > 0 and str(pid).isdigit():
+                    data["items"][str(pid)] = str(qty)
+                    total += qty
+            data["count"] = str(total)
+            data["lines"] = len(data["items"])
+        return data
+
+    def _save(self) -> None:
+        self.session[SESSION_KEY] = self.data
+        self.session.modified = True
+
+    # --- Reading ---
+
+    @property
+    def count(self) -> str:
+        """Total quantity across lines, as shown in the header badge."""
+        return self.data["count"]
+
+    @property
+    def lines(self) -> int:
+        return self.data["lines"]
+
+    @property
+    def subtotal(self) -> Decimal:
+        """Subtotal as of the last time the cart was priced."""
+        return Decimal(self.data["subtotal"])
+
+    @property
+    def holder(self) -> str:
+        """Key of this cart's stock reservations ("" until one is made)."""
+        return self.data.get("holder", "")
+
+    def ensure_holder(self) -> str:
+        if not self.data.get("holder"):
+            self.data["holder"] = secrets.token_hex(16)
+            self._save()
+        return self.data["holder"]
+
+    def qty(self, product_id) -> Decimal:
+        return Decimal(self.data["items"].get(str(product_id), "0"))
+
+    def items(self) -> Iterator[Tuple[str, Decimal]]:
+        for pid, qty in self.data["items"].items():
+            yield pid, Decimal(qty)
+
+    def quantities(self) -> Dict[str, Decimal]:
+        return dict(self.items())
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.data["items"])
+
+    def __len__(self) -> int:
+        return self.data["lines"]
+
+    def __contains__(self, product_id) -> bool:
+        return str(product_id) in self.data["items"]
+
+    # --- Mutations (summary maintained incrementally) ---
+
+    def set(self, product_id, qty: Decimal) -> None:
+        """Set a line's qty; zero or less removes it."""
+        pid = str(product_id)
+        items = self.data["items"]
+        old = Decimal(items.get(pid, "0"))
+        if qty <= 0:
+            if pid not in items:
+                return
+            del items[pid]
+            self.data["lines"] -= 1
+            qty = Decimal("0")
+        else:
+            if pid not in items:
+                self.data["lines"] += 1
+            items[pid] = str(qty)
+        self.data["count"] = str(Decimal(self.data["count"]) - old + qty)
+        self._save()
+
+    def remove(self, product_id) -> None:
+        self.set(product_id, Decimal("0"))
+
+    def clear(self) -> None:
+        self.data = _empty()
+        self._save()
+
+    def set_subtotal(self, subtotal: Decimal) -> None:
+        if self.data["subtotal"] != str(subtotal):
+            self.data["subtotal"] = str(subtotal)
+            self._save()
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import hashlib
+import time
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, F, FloatField, Q, QuerySet, Value, When
+from django.db.models.functions import Cast
+
+from products.models import Product
+from products.search import search_products
+from .models import OrderItem, Rating
+
+# Products shown with no ratings yet display as 5 stars.
+DEFAULT_AVG_STARS = 5.0
+
+# Queries issued by ``catalogue_products`` + ``group_by_category``, independent
+# of catalogue size, order history or number of ratings:
+# the annotated product query (joined against the FTS table when searching)
+# and the bounded card-image prefetch.
+QUERY_BUDGET = 2
+
+# Queries issued by ``apply_user_overlay`` for a signed-in user (own ratings,
+# purchased product ids); anonymous visitors cost none.
+OVERLAY_QUERY_BUDGET = 2
+
+VERSION_KEY = "catalogue:version"
+
+
+def catalogue_products(*, q: str = "") -> QuerySet:
+    """
+    Products for the catalogue grid (with category, primary image and card
+    images loaded), best search match first when ``q`` is given, annotated
+    with avg_stars: the average rating from Product.rating_sum/rating_count
+    (DEFAULT_AVG_STARS when unrated). Nothing here depends on the visitor;
+    ``apply_user_overlay`` adds that after the cache.
+    """
+    qs = Product.objects.with_card_images().select_related("category")
+
+    if q:
+        ranked = search_products(qs, q)
+        # No full-text index on this backend: plain substring match
+        qs = ranked if ranked is not None else qs.filter(Q(name__icontains=q) | Q(category__name__icontains=q))
+
+    return qs.annotate(
+        avg_stars=Case(
+            When(rating_count__gt=0, then=Cast("rating_sum", FloatField()) / F("rating_count")),
+            default=Value(DEFAULT_AVG_STARS),
+            output_field=FloatField(),
+        ),
+    )
+
+
+def group_by_category(products: Iterable[Product]) -> List[Dict[str, Any]]:
+    """Group products by category, preserving product order. No queries beyond iterating ``products``."""
+    groups: Dict[Any, Dict[str, Any]] = {}
+    for p in products:
+        cat = p.category
+        key = cat.id if cat else 0
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {
+                "name": cat.name if cat else "All Products",
+                "description": cat.description if cat else "",
+                "visible_products": [],
+            }
+        group["visible_products"].append(p)
+    return list(groups.values())
+
+
+# --- Versioned page cache ---
+
+def catalogue_version() -> int:
+    """
+    Current catalogue version. Seeded from the clock so a cache flush can
+    never resurrect entries written under an older, reused number. Kept in
+    the default cache, so a bump only reaches the workers that share it: under
+    LocMemCache other workers serve their pages until CATALOGUE_CACHE_TIMEOUT.
+    """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalogue_version() -> None:
+    """Invalidate every cached catalogue page (products, categories, images or ratings changed)."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def _page_key(q: str) -> str:
+    digest = hashlib.sha1(q.lower().encode("utf-8")).hexdigest()[:16]
+    return f"catalogue:v{catalogue_version()}:q:{digest}"
+
+
+def load_catalogue(q: str = "") -> List[Dict[str, Any]]:
+    """
+    User-independent catalogue groups (category grouping, product cards,
+    prices, average ratings) for search ``q``. Served from cache under the
+    current catalogue version; a miss costs QUERY_BUDGET queries.
+    """
+    key = _page_key(q)
+    groups = cache.get(key)
+    if groups is None:
+        groups = group_by_category(catalogue_products(q=q))
+        cache.set(key, groups, timeout=getattr(settings, "CATALOGUE_CACHE_TIMEOUT", 600))
+    return groups
+
+
+def apply_user_overlay(
+    groups: List[Dict[str, Any]],
+    user,
+    cart_qty: Dict[str, Decimal],
+    favorite_ids: Iterable[str] = (),
+    held: Optional[Dict[int, Decimal]] = None,
+) -> None:
+    """
+    Stamp per-visitor state onto the (freshly unpickled) products in ``groups``:
+    in_cart, remaining (stock minus other carts' ``held`` qty minus in_cart),
+    is_favorite, user_stars, user_can_rate.
+    """
+    held = held or {}
+    fav = {str(x) for x in favorite_ids}
+    user_stars: Dict[int, int] = {}
+    purchased: set = set()
+    if user is not None and user.is_authenticated:
+        user_stars = dict(Rating.objects.filter(user=user).values_list("product_id", "stars"))
+        purchased = set(
+            OrderItem.objects.filter(order__user=user).values_list("product_id", flat=True).distinct()
+        )
+
+    for group in groups:
+        for p in group["visible_products"]:
+            pid = str(p.id)
+            in_cart = cart_qty.get(pid, Decimal("0"))
+            p.in_cart = in_cart
+            p.remaining = max(Decimal("0"), (p.stock_qty or Decimal("0")) - held.get(p.id, Decimal("0")) - in_cart)
+            p.is_favorite = pid in fav
+            p.user_stars = user_stars.get(p.id, 0)
+            p.user_can_rate = p.id in purchased
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, List
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Q, Value, When
+
+from products.models import Product
+from .catalogue import bump_catalogue_version
+from .models import Order, OrderItem
+from .outbox import queue_order_emails
+from .pricing import PricedCart, display_remaining
+from .reservations import held_by_others, release_holds
+
+
+@dataclass
+class Shortage:
+    product_id: int
+    name: str
+    requested: Decimal
+    available: Decimal
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.requested} requested, only {self.available} left"
+
+
+class InsufficientStock(Exception):
+    """Raised by ``place_order`` when any line can't be filled; nothing is written."""
+
+    def __init__(self, shortages: List[Shortage]):
+        self.shortages = shortages
+        super().__init__("; ".join(str(s) for s in shortages) or "insufficient stock")
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _reserve_stock(need: Dict[int, Decimal], holder: str = "") -> bool:
+    """
+    Decrement every product's stock in ONE conditional UPDATE. Each row only
+    matches while its stock still covers the requested qty plus what other
+    carts hold, so concurrent checkouts can't both take the last crate.
+    True if every row matched.
+    """
+    held = held_by_others(holder)
+    guard = Q()
+    whens = []
+    for pk, qty in need.items():
+        guard |= Q(pk=pk, stock_qty__gte=held + Value(qty))
+        whens.append(When(pk=pk, then=F("stock_qty") - qty))
+    stock_field = Product._meta.get_field("stock_qty")
+    updated = Product.objects.filter(guard).update(
+        stock_qty=Case(*whens, default=F("stock_qty"), output_field=DecimalField(
+            max_digits=stock_field.max_digits, decimal_places=stock_field.decimal_places,
+        ))
+    )
+    return updated == len(need)
+
+
+def find_shortages(need: Dict[int, Decimal], holder: str = "") -> List[Shortage]:
+    products = (
+        Product.objects.only("id", "name", "unit", "stock_qty")
+        .annotate(held=held_by_others(holder))
+        .in_bulk(list(need))
+    )
+    shortages = []
+    for pk, qty in need.items():
+        p = products.get(pk)
+        available = max(Decimal("0"), (p.stock_qty or Decimal("0")) - p.held) if p else Decimal("0")
+        if available < qty:
+            shortages.append(Shortage(
+                product_id=pk,
+                name=p.name if p else f"Product {pk}",
+                requested=display_remaining(p, qty) if p else qty,
+                available=display_remaining(p, available) if p else available,
+            ))
+    return shortages
+
+
+def place_order(priced: PricedCart, *, user, email: str, phone: str = "", payment_method: str,
+                holder: str = "") -> Order:
+    """
+    Write the order, its items, the stock decrement and the outgoing emails in
+    one transaction: one guarded stock UPDATE, one Order INSERT, one bulk
+    OrderItem INSERT and one bulk OutboxEmail INSERT. The cart's own stock
+    holds (``holder``) are released in the same transaction; other carts'
+    active holds are left untouched.
+    Raises InsufficientStock (with a per-line report) and writes nothing when
+    any line exceeds what's left.
+    """
+    lines = [line for line in priced.lines if line.qty > 0]
+    need: Dict[int, Decimal] = {}
+    for line in lines:
+        need[line.product.pk] = need.get(line.product.pk, Decimal("0")) + line.qty
+
+    try:
+        with transaction.atomic():
+            if need and not _reserve_stock(need, holder):
+                raise _Rollback
+            order = Order.objects.create(
+                user=user if user is not None and user.is_authenticated else None,
+                email=email,
+                phone=phone or "",
+                coupon=priced.coupon,
+                subtotal=priced.subtotal,
+                discount_total=priced.discount,
+                total=priced.total,
+                payment_method=payment_method,
+            )
+            OrderItem.objects.bulk_create(
+                OrderItem(
+                    order=order,
+                    product=line.product,
+                    qty=line.qty,
+                    unit=line.product.unit,
+                    unit_price=line.unit_price,
+                    line_total=line.line_total,
+                )
+                for line in lines
+            )
+            queue_order_emails(order)
+            if holder:
+                release_holds(holder)
+            # Stock moved without post_save, so invalidate cached catalogue pages ourselves
+            transaction.on_commit(bump_catalogue_version)
+    except _Rollback:
+        raise InsufficientStock(find_shortages(need, holder)) from None
+    return order
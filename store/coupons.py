@@ -0,0 +1,79 @@
+"""
+Per-process coupon lookup cache.
+
+Coupons are resolved by normalized (upper-cased) code through the
+``Upper(code)`` unique index and kept for COUPON_CACHE_TIMEOUT seconds,
+misses included, so cart and checkout renders don't query for them.
+Entries are tagged with a version number kept in the default cache (like
+store.catalogue's). Saving or deleting a coupon bumps it, so every worker
+sharing that cache drops its entries on its next lookup. That needs a
+shared cache (DJANGO_CACHE_DIR): with the per-process LocMemCache default
+only the saving worker sees the bump, and the others keep accepting the old
+row (a deactivated coupon included) for up to COUPON_CACHE_TIMEOUT.
+
+Only the row is cached: callers still check ``is_valid_now()`` on every
+read, so start/end windows apply at request time.
+"""
+from __future__ import annotations
+
+import time
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.functions import Upper
+
+from .models import Coupon
+
+# Upper bound on cached codes (junk codes typed at the form are cached as misses)
+MAX_ENTRIES = 1024
+
+VERSION_KEY = "coupons:version"
+
+# normalized code: (version, expires at, coupon or None)
+_entries: Dict[str, Tuple[int, float, Optional[Coupon]]] = {}
+
+
+def coupons_version() -> int:
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)  # clock seed: see catalogue_version
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def resolve_coupon(code: str) -> Optional[Coupon]:
+    """The coupon for ``code`` in any case, whether or not it is currently valid; None if unknown."""
+    key = Coupon.normalize(code)
+    if not key:
+        return None
+    now = time.monotonic()
+    version = coupons_version()
+    hit = _entries.get(key)
+    if hit is not None and hit[0] == version and hit[1] > now:
+        return hit[2]
+
+    coupon = Coupon.objects.alias(code_upper=Upper("code")).filter(code_upper=key).first()
+    if len(_entries) >= MAX_ENTRIES:
+        _entries.clear()
+    _entries[key] = (version, now + getattr(settings, "COUPON_CACHE_TIMEOUT", 60), coupon)
+    return coupon
+
+
+def clear_coupon_cache() -> None:
+    _entries.clear()
+
+
+def _invalidate() -> None:
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+    _entries.clear()
+
+
+def coupons_changed() -> None:
+    _invalidate()
+    # Again after commit, in case a request re-cached the pre-commit row meanwhile
+    transaction.on_commit(_invalidate)
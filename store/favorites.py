@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from typing import FrozenSet
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from products.models import Product
+from .models import Favorite
+
+# Legacy session list of favorited product ids (pre-Favorite table)
+SESSION_KEY = "favorites"
+
+
+def _cache_key(user_id: int) -> str:
+    return f"favorites:user:{user_id}"
+
+
+def favorite_ids(user) -> FrozenSet[int]:
+    """Product ids the user has favorited; cached per user, empty for anonymous visitors."""
+    if user is None or not user.is_authenticated:
+        return frozenset()
+    key = _cache_key(user.pk)
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(Favorite.objects.filter(user=user).values_list("product_id", flat=True))
+        cache.set(key, ids, timeout=getattr(settings, "FAVORITES_CACHE_TIMEOUT", 3600))
+    return ids
+
+
+def invalidate_favorites(user_id: int) -> None:
+    # After commit, so a concurrent request can't re-cache the pre-commit set
+    transaction.on_commit(lambda: cache.delete(_cache_key(user_id)))
+
+
+def flip_favorite(user, product_id: int) -> bool:
+    """Flip ``product_id`` in the user's favorites; True if it is now a favorite."""
+    with transaction.atomic():
+        deleted, _ = Favorite.objects.filter(user=user, product_id=product_id).delete()
+        if not deleted:
+            Favorite.objects.get_or_create(user=user, product_id=product_id)
+    return not deleted
+
+
+def merge_session_favorites(user, session) -> int:
+    """
+    Move a legacy session favorites list into the Favorite table with one
+    bulk INSERT (existing rows and vanished products are skipped).
+    Returns the number of ids considered.
+    """
+    raw = session.pop(SESSION_KEY, None)
+    if not isinstance(raw, list):
+        return 0
+    pks = {int(x) for x in raw if str(x).isdigit()}
+    if not pks:
+        return 0
+    existing = Product.objects.filter(pk__in=pks).values_list("pk", flat=True)
+    Favorite.objects.bulk_create(
+        [Favorite(user=user, product_id=pk) for pk in existing],
+        ignore_conflicts=True,
+    )
+    invalidate_favorites(user.pk)
+    return len(pks)
@@ -0,0 +1,59 @@
+import re
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from products.models import Category, Product
+
+SESSION_WRITE = re.compile(r'^\s*(INSERT INTO|UPDATE|DELETE FROM)\s+"?django_session"?', re.I)
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure django_session writes per cart interaction (cart_update_qty) for each "
+        "session profile. Runs inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interactions", type=int, default=50)
+        parser.add_argument("--profiles", nargs="*", default=list(settings.SESSION_ENGINES))
+
+    def handle(self, *args, **options):
+        n = options["interactions"]
+        rows = []
+        try:
+            with transaction.atomic():
+                cat = Category.objects.create(name="__bench_sessions__")
+                product = Product.objects.create(category=cat, name="__bench_sessions__", price=1, stock_qty=10_000)
+                url = reverse("store:update_qty", args=[product.pk])
+                for profile in options["profiles"]:
+                    rows.append((profile, self._measure(profile, url, n)))
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        self.stdout.write(f"{'profile':<14}{'session writes':>16}{'per interaction':>18}")
+        for profile, writes in rows:
+            self.stdout.write(f"{profile:<14}{writes:>16}{writes / n:>18.3f}")
+
+    def _measure(self, profile: str, url: str, n: int) -> int:
+        caches[settings.SESSION_CACHE_ALIAS].clear()
+        with override_settings(
+            SESSION_ENGINE=settings.SESSION_ENGINES[profile],
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+        ):
+            client = Client()
+            client.get(reverse("store:catalogue"))  # establish the session
+            with CaptureQueriesContext(connection) as ctx:
+                for i in range(n):
+                    client.post(url, {"qty": str(i % 5 + 1)})
+        return sum(1 for q in ctx.captured_queries if SESSION_WRITE.match(q["sql"]))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from store.catalogue import bump_catalogue_version
+from store.ratings import recompute_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = "Recompute Product.rating_count / rating_sum from the Rating table in bulk."
+
+    def handle(self, *args, **options):
+        drifted = recompute_rating_aggregates()
+        if drifted:
+            bump_catalogue_version()
+        self.stdout.write(self.style.SUCCESS(f"Repaired {drifted} product(s)."))
@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.bench import compare, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Time every store/accounts view against seed_bench data and print p50/p95 latency, "
+        "queries and peak memory as JSON. Writes are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--cold", action="store_true", help="Clear the cache before every request.")
+        parser.add_argument("--only", nargs="*", help="URL names to run (e.g. store:catalogue store:cart).")
+        parser.add_argument("-o", "--output", help="Write the JSON report here instead of stdout.")
+        parser.add_argument("--compare", metavar="BASELINE", help="Print deltas against an earlier JSON report.")
+
+    def handle(self, *args, **options):
+        try:
+            report = run_benchmarks(
+                iterations=max(1, options["iterations"]),
+                cold=options["cold"],
+                only=options["only"],
+                log=lambda msg: self.stderr.write(f"  {msg}"),
+            )
+        except LookupError as exc:
+            raise CommandError(str(exc))
+
+        text = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                fh.write(text + "\n")
+            self.stderr.write(self.style.SUCCESS(f"Wrote {len(report['views'])} view(s) to {options['output']}"))
+        elif not options["compare"]:
+            self.stdout.write(text)
+
+        if options["compare"]:
+            with open(options["compare"]) as fh:
+                baseline = json.load(fh)
+            self.stdout.write(f"{'view':<24}{'p50 ms':>20}{'p95 ms':>20}{'queries':>12}{'peak KB':>20}")
+            for row in compare(report, baseline):
+                cells = [f"{a} -> {b}" for a, b in (row["p50_ms"], row["p95_ms"], row["queries"], row["peak_kb"])]
+                self.stdout.write(f"{row['name']:<24}{cells[0]:>20}{cells[1]:>20}{cells[2]:>12}{cells[3]:>20}")
@@ -0,0 +1,29 @@
+from dataclasses import fields
+
+from django.core.management.base import BaseCommand
+
+from store.bench import SeedScale, clear_bench_data, seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-generate a synthetic shop for benchmarking (see run_bench). "
+        "Rows are prefixed 'bench-' and removed again with --clear."
+    )
+
+    def add_arguments(self, parser):
+        for f in fields(SeedScale):
+            parser.add_argument(f"--{f.name.replace('_', '-')}", type=int, default=f.default)
+        parser.add_argument("--clear", action="store_true", help="Delete earlier benchmark rows first.")
+        parser.add_argument("--clear-only", action="store_true", help="Delete benchmark rows and stop.")
+
+    def handle(self, *args, **options):
+        if options["clear"] or options["clear_only"]:
+            clear_bench_data()
+            self.stdout.write("Removed earlier benchmark data.")
+            if options["clear_only"]:
+                return
+        scale = SeedScale(**{f.name: options[f.name] for f in fields(SeedScale)})
+        counts = seed(scale, log=lambda msg: self.stdout.write(f"  {msg}"))
+        summary = ", ".join(f"{n} {name}" for name, n in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Seeded {summary}."))
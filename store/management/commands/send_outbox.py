@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.outbox import MAX_ATTEMPTS, drain
+
+
+class Command(BaseCommand):
+    help = "Deliver queued OutboxEmail rows in batches over one mail connection per batch."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS,
+                            help="Failures before a message is moved to the dead-letter state.")
+        parser.add_argument("--loop", action="store_true", help="Keep polling instead of exiting when drained.")
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds between polls with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            totals = drain(batch_size=options["batch_size"], max_attempts=options["max_attempts"])
+            if any(totals.values()) or not options["loop"]:
+                self.stdout.write(
+                    f"sent={totals['sent']} retry={totals['retry']} dead={totals['dead']}"
+                )
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from store.slowlog import read_slow_queries, reset_slow_queries
+
+
+class Command(BaseCommand):
+    help = "Rank logged slow SQL statements (SLOW_QUERY_MS and up) by total time, with their query plans."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--no-plans", action="store_true", help="Leave out EXPLAIN QUERY PLAN output.")
+        parser.add_argument("--reset", action="store_true", help="Clear the log after printing it.")
+
+    def handle(self, *args, **options):
+        rows = read_slow_queries(options["limit"])
+        if not rows:
+            self.stdout.write("No slow queries logged.")
+        for rank, (fp, sql, count, total_ms, max_ms, view, caller, plan) in enumerate(rows, start=1):
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"#{rank} [{fp}] total {total_ms:.1f} ms, {count} call(s), "
+                f"avg {total_ms / count:.1f} ms, max {max_ms:.1f} ms"
+            ))
+            self.stdout.write(f"  view:   {view}")
+            self.stdout.write(f"  caller: {caller}")
+            self.stdout.write(f"  sql:    {sql}")
+            if plan and not options["no_plans"]:
+                self.stdout.write("  plan:")
+                for line in plan.splitlines():
+                    self.stdout.write(f"    {line}")
+        if options["reset"]:
+            reset_slow_queries()
+            self.stdout.write(self.style.SUCCESS("Slow-query log cleared."))
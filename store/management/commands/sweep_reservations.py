@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from store.reservations import sweep_expired
+
+
+class Command(BaseCommand):
+    help = "Delete expired cart stock holds in small batches (they already stop counting once expired)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--max-batches", type=int, default=0, help="Stop after this many batches (0 = until done).")
+        parser.add_argument("--pause", type=float, default=0.05,
+                            help="Seconds to sleep between batches so checkouts can grab the write lock.")
+
+    def handle(self, *args, **options):
+        deleted, batches = sweep_expired(
+            batch_size=options["batch_size"],
+            max_batches=options["max_batches"],
+            pause=options["pause"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired reservation(s) in {batches} batch(es)."))
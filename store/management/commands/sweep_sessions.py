@@ -0,0 +1,39 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired django_session rows in small batches (an incremental "
+        "alternative to clearsessions' single large DELETE)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--max-batches", type=int, default=0, help="Stop after this many batches (0 = until done).")
+        parser.add_argument("--pause", type=float, default=0.05,
+                            help="Seconds to sleep between batches so checkouts can grab the write lock.")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now()
+        batch_size = options["batch_size"]
+        deleted = batches = 0
+        while True:
+            # Walks the expire_date index; each DELETE is a short transaction
+            keys = list(
+                Session.objects.filter(expire_date__lt=cutoff)
+                .order_by("expire_date")
+                .values_list("session_key", flat=True)[:batch_size]
+            )
+            if not keys:
+                break
+            deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+            batches += 1
+            if options["max_batches"] and batches >= options["max_batches"]:
+                break
+            if options["pause"]:
+                time.sleep(options["pause"])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired session(s) in {batches} batch(es)."))
@@ -0,0 +1,276 @@
+"""
+Per-request timing (``store.metrics.ServerTimingMiddleware``).
+
+Every response gets a ``Server-Timing`` header splitting its wall time into
+SQL (query count and time, via ``connection.execute_wrapper``), template
+rendering and session saving, so the browser's network panel shows where a
+slow page went. The same numbers feed per-route histograms, labelled by URL
+name (``store:catalogue``, ``store:cart``, ``accounts:login``; the whole admin
+counts as ``admin``).
+
+Histograms are added up in memory and flushed at most every
+METRICS_FLUSH_SECONDS into the SQLite file METRICS_DB, which every gunicorn
+worker on the host shares; ``/metrics`` renders the totals in Prometheus
+text format.
+"""
+from __future__ import annotations
+
+import functools
+import logging
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpRequest, HttpResponse, HttpResponseForbidden
+from django.template.base import Template
+
+logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+# name: (help, buckets)
+HISTOGRAMS = {
+    "farm_request_duration_seconds": ("Wall time spent in the view stack per request.", SECONDS_BUCKETS),
+    "farm_db_duration_seconds": ("SQL time per request.", SECONDS_BUCKETS),
+    "farm_db_queries": ("SQL queries per request.", QUERY_BUCKETS),
+    "farm_template_duration_seconds": ("Template render time per request.", SECONDS_BUCKETS),
+    "farm_session_save_duration_seconds": ("Session save time per request.", SECONDS_BUCKETS),
+}
+
+_current: ContextVar[Optional["RequestTimings"]] = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    __slots__ = ("total", "db", "queries", "template", "session", "_template_depth")
+
+    def __init__(self):
+        self.total = self.db = self.template = self.session = 0.0
+        self.queries = 0
+        self._template_depth = 0
+
+    def execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.queries += 1
+
+    def timed_session_save(self, save):
+        @functools.wraps(save)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return save(*args, **kwargs)
+            finally:
+                self.session += time.perf_counter() - start
+        return wrapper
+
+    def header(self) -> str:
+        def ms(seconds):
+            return f"{seconds * 1000:.1f}"
+        return (
+            f'view;dur={ms(self.total)}, db;dur={ms(self.db)};desc="{self.queries} queries", '
+            f"tpl;dur={ms(self.template)}, session;dur={ms(self.session)}"
+        )
+
+    def observations(self) -> Dict[str, float]:
+        return {
+            "farm_request_duration_seconds": self.total,
+            "farm_db_duration_seconds": self.db,
+            "farm_db_queries": self.queries,
+            "farm_template_duration_seconds": self.template,
+            "farm_session_save_duration_seconds": self.session,
+        }
+
+
+def _timed_render(render):
+    @functools.wraps(render)
+    def wrapper(self, context):
+        timings = _current.get()
+        if timings is None or timings._template_depth:
+            return render(self, context)  # {% include %} is already inside the outer timing
+        timings._template_depth += 1
+        start = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            timings.template += time.perf_counter() - start
+            timings._template_depth -= 1
+    wrapper._request_timed = True
+    return wrapper
+
+
+def install_template_timer() -> None:
+    if not getattr(Template.render, "_request_timed", False):
+        Template.render = _timed_render(Template.render)
+
+
+def route_label(request: HttpRequest) -> str:
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    if match.namespace == "admin":
+        return "admin"
+    return match.view_name
+
+
+# --- Shared store --------------------------------------------------------------
+# One row per (metric, route, bucket); bucket is a histogram upper bound
+# (non-cumulative count), "+Inf", "sum" or "count".
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS histogram (
+    metric TEXT NOT NULL,
+    route TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (metric, route, bucket)
+)
+"""
+
+
+def connect_store(schema: str = SCHEMA) -> sqlite3.Connection:
+    """A connection to the shared METRICS_DB file (also used by store.slowlog)."""
+    conn = sqlite3.connect(str(settings.METRICS_DB), timeout=5, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(schema)
+    return conn
+
+
+def _bucket(value: float, buckets: Tuple[float, ...]) -> str:
+    i = bisect_left(buckets, value)
+    return repr(buckets[i]) if i < len(buckets) else "+Inf"
+
+
+class Recorder:
+    """This process's not-yet-flushed histogram increments."""
+
+    def __init__(self):
+        self._pending: Dict[Tuple[str, str, str], float] = defaultdict(float)
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+    def observe(self, route: str, observations: Dict[str, float]) -> None:
+        with self._lock:
+            for metric, value in observations.items():
+                self._pending[(metric, route, _bucket(value, HISTOGRAMS[metric][1]))] += 1
+                self._pending[(metric, route, "sum")] += value
+                self._pending[(metric, route, "count")] += 1
+        if time.monotonic() - self._flushed_at >= getattr(settings, "METRICS_FLUSH_SECONDS", 5):
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(float)
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+        try:
+            conn = connect_store()
+            try:
+                with conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.executemany(
+                        "INSERT INTO histogram (metric, route, bucket, value) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (metric, route, bucket) DO UPDATE SET value = value + excluded.value",
+                        [(*key, value) for key, value in pending.items()],
+                    )
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            logger.warning("Could not flush request metrics to %s", settings.METRICS_DB, exc_info=True)
+            with self._lock:  # keep them for the next attempt
+                for key, value in pending.items():
+                    self._pending[key] += value
+
+    def reset(self) -> None:
+        with self._lock:
+            self._pending.clear()
+
+
+recorder = Recorder()
+
+
+def read_histograms() -> List[Tuple[str, str, str, float]]:
+    conn = connect_store()
+    try:
+        return conn.execute("SELECT metric, route, bucket, value FROM histogram").fetchall()
+    finally:
+        conn.close()
+
+
+def _escape(label: str) -> str:
+    return label.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus(rows: Iterable[Tuple[str, str, str, float]]) -> str:
+    data: Dict[str, Dict[str, Dict[str, float]]] = defaultdict(lambda: defaultdict(dict))
+    for metric, route, bucket, value in rows:
+        if metric in HISTOGRAMS:
+            data[metric][route][bucket] = value
+
+    def num(value):
+        return repr(int(value)) if float(value).is_integer() else repr(value)
+
+    lines = []
+    for metric, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+        for route in sorted(data.get(metric, {})):
+            values = data[metric][route]
+            label = f'route="{_escape(route)}"'
+            running = 0.0
+            for le in (*map(repr, buckets), "+Inf"):
+                running += values.get(le, 0)
+                lines.append(f'{metric}_bucket{{{label},le="{le}"}} {num(running)}')
+            lines.append(f"{metric}_sum{{{label}}} {num(values.get('sum', 0))}")
+            lines.append(f"{metric}_count{{{label}}} {num(values.get('count', 0))}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """Prometheus scrape endpoint; staff or METRICS_ALLOWED_IPS only."""
+    allowed = getattr(settings, "METRICS_ALLOWED_IPS", ())
+    user = getattr(request, "user", None)
+    if request.META.get("REMOTE_ADDR") not in allowed and not (user and user.is_staff):
+        return HttpResponseForbidden()
+    recorder.flush()
+    return HttpResponse(render_prometheus(read_histograms()), content_type="text/plain; version=0.0.4")
+
+
+class ServerTimingMiddleware:
+    """Place after WhiteNoise (static files aren't timed) and before SessionMiddleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_template_timer()
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timings.execute):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        timings.total = time.perf_counter() - start
+        response["Server-Timing"] = timings.header()
+        recorder.observe(route_label(request), timings.observations())
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = _current.get()
+        session = getattr(request, "session", None)
+        if timings is not None and session is not None:
+            # SessionMiddleware saves on the way out, inside our timing window
+            session.save = timings.timed_session_save(session.save)
+        return None
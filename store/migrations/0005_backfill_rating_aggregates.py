@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    Rating = apps.get_model("store", "Rating")
+    base = Rating.objects.filter(product=OuterRef("pk")).order_by().values("product")
+    Product.objects.update(
+        rating_count=Coalesce(Subquery(base.annotate(c=Count("id")).values("c")), Value(0)),
+        rating_sum=Coalesce(Subquery(base.annotate(s=Sum("stars")).values("s")), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_rating_aggregates'),
+        ('store', '0004_outboxemail'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
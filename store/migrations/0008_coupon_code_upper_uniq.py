@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:26
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+def dedupe_codes(apps, schema_editor):
+    # The new index treats codes case-insensitively. In each group of variants
+    # (case, stray whitespace) keep the oldest active coupon, else the oldest,
+    # and rename + deactivate the rest so their orders still point at them.
+    Coupon = apps.get_model("store", "Coupon")
+    groups = {}
+    for coupon in Coupon.objects.order_by("-active", "pk"):
+        groups.setdefault(coupon.code.strip().upper(), []).append(coupon)
+    for keeper, *duplicates in groups.values():
+        for coupon in duplicates:
+            suffix = f"-DUP{coupon.pk}"
+            coupon.code = coupon.code.strip()[: 50 - len(suffix)] + suffix
+            coupon.active = False
+            coupon.save(update_fields=["code", "active"])
+        if keeper.code != keeper.code.strip():
+            keeper.code = keeper.code.strip()
+            keeper.save(update_fields=["code"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_stockreservation'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_codes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='coupon',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Upper('code'), name='store_coupon_code_upper_uniq'),
+        ),
+    ]
@@ -5,6 +5,7 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
+from django.db.models.functions import Upper
 from django.utils import timezone
 
 
@@ -28,6 +29,10 @@ class Coupon(models.Model):
 
     class Meta:
         ordering = ["-start_at", "code"]
+        constraints = [
+            # Lookups go through Coupon.normalize(), so this is what they seek on
+            models.UniqueConstraint(Upper("code"), name="store_coupon_code_upper_uniq"),
+        ]
 
     def __str__(self) -> str:
         return self.code
@@ -95,10 +100,23 @@ class Rating(models.Model):
     class Meta:
         unique_together = [("product", "user")]
         ordering = ["-created_at"]
+        indexes = [
+            # Keyset pagination of a product's reviews, newest first
+            models.Index(fields=["product", "-created_at", "-id"], name="store_rating_keyset_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.product_id}:{self.user_id} → {self.stars}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored values so saves can adjust the Product aggregates by
+        # the delta (or move them when the rating was moved to another product)
+        instance._loaded_stars = instance.__dict__.get("stars")
+        instance._loaded_product_id = instance.__dict__.get("product_id")
+        return instance
+
 
 # ──────────────── Favorites (persistent across devices/logins) ────────────────
 class Favorite(models.Model):
@@ -123,3 +141,53 @@ class Favorite(models.Model):
 
     def __str__(self) -> str:
         return f"{self.user_id} ♥ {self.product_id}"
+
+
+# ──────────────── Outbound email (written in-transaction, sent by a worker) ────────────────
+class OutboxEmail(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        SENT = "sent", "Sent"
+        DEAD = "dead", "Dead letter"
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)  # blank → DEFAULT_FROM_EMAIL
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("id",)
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.subject} → {', '.join(self.recipients)} [{self.status}]"
+
+
+# ──────────────── Cart stock holds (see store/reservations.py) ────────────────
+class StockReservation(models.Model):
+    # Random per-cart token kept in the session cart (survives login's session-key rotation)
+    holder = models.CharField(max_length=32)
+    product = models.ForeignKey("products.Product", on_delete=models.CASCADE, related_name="reservations")
+    qty = models.DecimalField(max_digits=10, decimal_places=3, validators=[MinValueValidator(Decimal("0"))])
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["holder", "product"], name="store_reservation_holder_product"),
+        ]
+        indexes = [
+            models.Index(fields=["product", "expires_at"]),  # active holds per product
+            models.Index(fields=["expires_at"]),             # sweeper
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.holder}: {self.qty} × {self.product_id} until {self.expires_at:%H:%M}"
@@ -0,0 +1,149 @@
+"""
+Transactional email outbox.
+
+Mail is written to ``OutboxEmail`` in the same transaction as the change it
+announces (so a rolled-back order never emails anyone) and delivered later by
+``manage.py send_outbox``, which reuses one backend connection per batch,
+retries with exponential backoff and parks permanently failing rows in the
+dead-letter state.
+"""
+from __future__ import annotations
+
+import logging
+import uuid
+from datetime import timedelta
+from typing import Dict, Iterable, List
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from .models import Order, OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = timedelta(minutes=1)
+BACKOFF_MAX = timedelta(hours=6)
+# How long a worker may hold a claimed batch before another worker can retry it
+CLAIM_LEASE = timedelta(minutes=5)
+
+
+def order_emails(order: Order) -> List[OutboxEmail]:
+    """Customer confirmation plus the shop notification for a new order (unsaved)."""
+    number = order.order_number
+    emails = [
+        OutboxEmail(
+            subject=f"Order #{number} confirmation",
+            body=f"Thanks for your order #{number}. Total: ${order.total}",
+            recipients=[order.email],
+        )
+    ]
+    admin_mail = getattr(settings, "ORDER_NOTIFICATION_EMAIL", None) or getattr(settings, "DEFAULT_FROM_EMAIL", None)
+    if admin_mail:
+        emails.append(
+            OutboxEmail(
+                subject=f"New order #{number}",
+                body=f"Total: ${order.total}",
+                recipients=[admin_mail],
+            )
+        )
+    return emails
+
+
+def queue_order_emails(order: Order) -> None:
+    """Queue the order emails with one INSERT; call inside the order's transaction."""
+    OutboxEmail.objects.bulk_create(order_emails(order))
+
+
+def backoff(attempts: int) -> timedelta:
+    return min(BACKOFF_MAX, BACKOFF_BASE * (2 ** max(0, attempts - 1)))
+
+
+def claim_batch(batch_size: int) -> List[OutboxEmail]:
+    """
+    Lease up to ``batch_size`` due rows to this worker. Safe with several
+    workers: a row is only claimed by whoever moves its next_attempt_at first,
+    and a crashed worker's lease simply expires.
+    """
+    now = timezone.now()
+    due = list(
+        OutboxEmail.objects.filter(status=OutboxEmail.Status.PENDING, next_attempt_at__lte=now)
+        .order_by("next_attempt_at", "id")
+        .values_list("pk", flat=True)[:batch_size]
+    )
+    if not due:
+        return []
+    token = uuid.uuid4().hex
+    OutboxEmail.objects.filter(pk__in=due, next_attempt_at__lte=now).update(
+        claimed_by=token, next_attempt_at=now + CLAIM_LEASE,
+    )
+    return list(OutboxEmail.objects.filter(claimed_by=token).order_by("id"))
+
+
+def deliver(batch: Iterable[OutboxEmail], max_attempts: int = MAX_ATTEMPTS) -> Dict[str, int]:
+    """Send a claimed batch over one connection and record the outcome of every row."""
+    batch = list(batch)
+    token = batch[0].claimed_by if batch else ""  # claim_batch leases a batch under one token
+    sent: List[int] = []
+    failed: List[OutboxEmail] = []
+    now = timezone.now()
+
+    try:
+        with get_connection(fail_silently=False) as connection:
+            for email in batch:
+                try:
+                    EmailMessage(
+                        subject=email.subject,
+                        body=email.body,
+                        from_email=email.from_email or None,
+                        to=email.recipients,
+                        connection=connection,
+                    ).send()
+                except Exception as exc:
+                    email.last_error = repr(exc)
+                    failed.append(email)
+                else:
+                    sent.append(email.pk)
+    except Exception as exc:
+        # Couldn't open (or cleanly close) the connection: everything not yet sent failed
+        for email in batch:
+            if email.pk not in sent and email not in failed:
+                email.last_error = repr(exc)
+                failed.append(email)
+
+    dead = 0
+    for email in failed:
+        email.attempts += 1
+        email.claimed_by = ""
+        if email.attempts >= max_attempts:
+            email.status = OutboxEmail.Status.DEAD
+            dead += 1
+        else:
+            email.next_attempt_at = now + backoff(email.attempts)
+
+    if sent:
+        marked = OutboxEmail.objects.filter(pk__in=sent, claimed_by=token).update(
+            status=OutboxEmail.Status.SENT, sent_at=now, claimed_by="", last_error="",
+        )
+        if marked < len(sent):
+            # The lease ran out mid-batch and another worker re-claimed these rows
+            logger.warning(
+                "Outbox: %d of %d sent email(s) were re-claimed by another worker and may be sent again",
+                len(sent) - marked, len(sent),
+            )
+    if failed:
+        OutboxEmail.objects.bulk_update(failed, ["attempts", "status", "next_attempt_at", "claimed_by", "last_error"])
+
+    return {"sent": len(sent), "retry": len(failed) - dead, "dead": dead}
+
+
+def drain(batch_size: int = 50, max_attempts: int = MAX_ATTEMPTS) -> Dict[str, int]:
+    """Deliver batches until nothing is due. Returns totals."""
+    totals = {"sent": 0, "retry": 0, "dead": 0}
+    while True:
+        batch = claim_batch(batch_size)
+        if not batch:
+            return totals
+        for k, v in deliver(batch, max_attempts=max_attempts).items():
+            totals[k] += v
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Dict, List, Optional, Union
+
+from django.utils import timezone
+
+from products.models import Product
+from .cart import Cart
+from .coupons import resolve_coupon
+from .models import Coupon, Profile
+from .reservations import held_by_others
+
+CENT = Decimal("0.01")
+NEW_CUSTOMER_RATE = Decimal("0.10")
+
+
+def format_percent(dec: Decimal) -> str:
+    """
+    Return a human string without scientific notation.
+    10 -> '10', 12.5 -> '12.5', 12.34 -> '12.34'
+    """
+    dec = Decimal(dec)
+    if dec == dec.to_integral_value():
+        return str(int(dec))
+    # trim trailing zeros
+    s = f"{dec.quantize(CENT)}"
+    if "." in s:
+        s = s.rstrip("0").rstrip(".")
+    return s
+
+
+def coupon_description(coupon: Coupon) -> str:
+    parts: List[str] = []
+    if coupon.percent_off and coupon.percent_off > 0:
+        parts.append(f"{format_percent(coupon.percent_off)}% off")
+    if coupon.amount_off and coupon.amount_off > 0:
+        parts.append(f"${coupon.amount_off.quantize(CENT)} off")
+    return " + ".join(parts) if parts else "discount"
+
+
+def display_remaining(product: Product, remaining: Decimal) -> Union[int, Decimal]:
+    """No decimals for 'ea' products."""
+    return int(remaining) if product.unit == Product.Unit.EACH else remaining
+
+
+@dataclass
+class CartLine:
+    product: Product
+    qty: Decimal
+    unit_price: Decimal
+    line_total: Decimal
+    held: Decimal = Decimal("0")  # reserved by other carts
+
+    @property
+    def remaining(self) -> Union[int, Decimal]:
+        stock = self.product.stock_qty or Decimal("0")
+        return display_remaining(self.product, max(Decimal("0"), stock - self.held - self.qty))
+
+
+@dataclass
+class PricedCart:
+    lines: List[CartLine] = field(default_factory=list)
+    subtotal: Decimal = Decimal("0")
+    coupon: Optional[Coupon] = None  # only set when valid right now
+    coupon_desc: str = ""
+    coupon_discount: Decimal = Decimal("0")
+    new_customer_discount: Decimal = Decimal("0")
+    dropped: List[str] = field(default_factory=list)  # cart keys whose product no longer exists
+
+    @property
+    def discount(self) -> Decimal:
+        return self.coupon_discount + self.new_customer_discount
+
+    @property
+    def total(self) -> Decimal:
+        return max(Decimal("0"), self.subtotal - self.discount)
+
+
+class CartPricer:
+    """
+    Prices a session cart in a constant number of queries: one ``in_bulk``
+    for every product in the cart, one coupon lookup (usually served from
+    the coupon cache), and (for signed-in users without a preloaded
+    ``profile``) one profile lookup.
+
+    Lines whose product has been deleted are dropped from the cart rather
+    than failing the whole page, and the cart's last-priced subtotal is
+    refreshed.
+    """
+
+    def __init__(self, cart: Cart, *, coupon_code: str = "", user=None, profile: Optional[Profile] = None):
+        self.cart = cart
+        self.coupon_code = coupon_code or ""
+        self.user = user
+        self.profile = profile
+
+    @classmethod
+    def for_request(cls, request, cart: Cart, profile: Optional[Profile] = None) -> "CartPricer":
+        return cls(cart, coupon_code=request.session.get("coupon_code") or "", user=request.user, profile=profile)
+
+    def load_products(self, extra_ids=()) -> Dict[int, Product]:
+        """
+        Every product in the cart (plus ``extra_ids``) in one query, each
+        annotated with ``held``: qty reserved by other shoppers' carts.
+        """
+        ids = {int(pid) for pid in self.cart}
+        ids.update(int(pk) for pk in extra_ids)
+        return (
+            Product.objects.select_related("primary_image")
+            .annotate(held=held_by_others(self.cart.holder))
+            .in_bulk(ids)
+        )
+
+    def price(self, products: Optional[Dict[int, Product]] = None) -> PricedCart:
+        """Price the cart, reusing ``products`` from ``load_products()`` when given."""
+        result = PricedCart()
+        if products is None:
+            products = self.load_products()
+
+        for pid, qty in list(self.cart.items()):
+            p = products.get(int(pid))
+            if p is None:
+                self.cart.remove(pid)
+                result.dropped.append(pid)
+                continue
+            unit_price = p.effective_price
+            line_total = (unit_price * qty).quantize(CENT)
+            result.lines.append(CartLine(product=p, qty=qty, unit_price=unit_price, line_total=line_total, held=p.held))
+            result.subtotal += line_total
+
+        self._apply_coupon(result)
+        self._apply_new_customer(result)
+        self.cart.set_subtotal(result.subtotal)
+        return result
+
+    def _apply_coupon(self, result: PricedCart) -> None:
+        if not self.coupon_code:
+            return
+        coupon = resolve_coupon(self.coupon_code)
+        if coupon is None or not coupon.is_valid_now():
+            return
+        discount = Decimal("0")
+        if coupon.percent_off:
+            discount += (result.subtotal * (coupon.percent_off / Decimal("100"))).quantize(CENT)
+        discount += coupon.amount_off
+        result.coupon = coupon
+        result.coupon_desc = coupon_description(coupon)
+        result.coupon_discount = discount
+
+    def _apply_new_customer(self, result: PricedCart) -> None:
+        # New customer discount 10% if within 30 days of signup
+        if self.user is None or not self.user.is_authenticated:
+            return
+        prof = self.profile
+        if prof is None:
+            prof = Profile.objects.filter(user=self.user).first()
+        if prof and prof.signup_discount_ends_at and timezone.now() <= prof.signup_discount_ends_at:
+            result.new_customer_discount = (result.subtotal * NEW_CUSTOMER_RATE).quantize(CENT)
@@ -0,0 +1,225 @@
+"""
+Opt-in cProfile capture of live requests (``store.profiling.ProfilingMiddleware``).
+
+A request is profiled when
+
+* a staff user sends ``X-Profile: <token>``, the signed token shown on the
+  admin "Request profiles" page (valid for PROFILE_TOKEN_MAX_AGE seconds and
+  only for the user it was issued to), or
+* it is picked by the 1-in-PROFILE_SAMPLE_RATE random sample (0 = off).
+
+Each profile is a ``.prof`` file (``pstats`` / snakeviz format) in
+PROFILE_DIR with a ``.json`` sidecar holding the URL name, duration and the
+slowest SQL statements. Only the newest PROFILE_KEEP profiles are kept.
+"""
+from __future__ import annotations
+
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import time
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.contrib import admin
+from django.core import signing
+from django.db import connection
+from django.http import FileResponse, Http404, HttpRequest
+from django.template.response import TemplateResponse
+
+from .metrics import route_label
+
+logger = logging.getLogger(__name__)
+
+HEADER = "HTTP_X_PROFILE"
+SIGNING_SALT = "store.profiling"
+TOP_SQL = 10
+PROFILE_NAME = re.compile(r"^[0-9]{8}-[0-9]{12}_[\w.-]+$")
+UNSAFE_CHARS = re.compile(r"[^\w.-]+")
+
+
+def profile_token(user) -> str:
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign(str(user.pk))
+
+
+def _token_valid(request: HttpRequest) -> bool:
+    token = request.META.get(HEADER)
+    user = getattr(request, "user", None)
+    if not token or not (user and user.is_authenticated and user.is_staff):
+        return False
+    try:
+        value = signing.TimestampSigner(salt=SIGNING_SALT).unsign(
+            token, max_age=getattr(settings, "PROFILE_TOKEN_MAX_AGE", 3600),
+        )
+    except signing.BadSignature:
+        return False
+    return value == str(user.pk)
+
+
+def should_profile(request: HttpRequest) -> bool:
+    rate = getattr(settings, "PROFILE_SAMPLE_RATE", 0)
+    if rate and random.randrange(rate) == 0:
+        return True
+    return _token_valid(request)
+
+
+class SQLCollector:
+    """execute_wrapper totalling time and count per SQL statement."""
+
+    def __init__(self):
+        self.stats: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0])
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            entry = self.stats[sql]
+            entry[0] += 1
+            entry[1] += time.perf_counter() - start
+
+    def top(self, n: int = TOP_SQL) -> List[dict]:
+        ranked = sorted(self.stats.items(), key=lambda kv: kv[1][1], reverse=True)[:n]
+        return [{"sql": sql, "count": count, "ms": round(total * 1000, 2)} for sql, (count, total) in ranked]
+
+
+# --- Profile files ---------------------------------------------------------------
+
+def profile_dir() -> str:
+    return str(settings.PROFILE_DIR)
+
+
+def save_profile(profiler: cProfile.Profile, meta: dict) -> str:
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(dt_timezone.utc).strftime("%Y%m%d-%H%M%S%f")
+    name = f"{stamp}_{UNSAFE_CHARS.sub('-', meta['route'])}"
+    profiler.dump_stats(os.path.join(directory, f"{name}.prof"))
+    with open(os.path.join(directory, f"{name}.json"), "w") as fh:
+        json.dump(meta, fh)
+    rotate(directory)
+    return name
+
+
+def rotate(directory: str) -> None:
+    keep = getattr(settings, "PROFILE_KEEP", 100)
+    names = sorted((f[:-5] for f in os.listdir(directory) if f.endswith(".json")), reverse=True)
+    for name in names[keep:]:
+        for ext in (".json", ".prof"):
+            try:
+                os.remove(os.path.join(directory, name + ext))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(limit: int = 200) -> List[dict]:
+    directory = profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    names = sorted((f[:-5] for f in os.listdir(directory) if f.endswith(".json")), reverse=True)[:limit]
+    profiles = []
+    for name in names:
+        meta = load_meta(name)
+        if meta is not None:
+            profiles.append(meta)
+    return profiles
+
+
+def load_meta(name: str) -> Optional[dict]:
+    if not PROFILE_NAME.match(name):
+        return None
+    try:
+        with open(os.path.join(profile_dir(), f"{name}.json")) as fh:
+            meta = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    meta["name"] = name
+    return meta
+
+
+class ProfilingMiddleware:
+    """Place after AuthenticationMiddleware (the header trigger needs request.user)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not should_profile(request):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        sql = SQLCollector()
+        started_at = datetime.now(dt_timezone.utc)
+        start = time.perf_counter()
+        try:
+            profiler.enable()
+        except ValueError:  # another profiler is already active in this thread
+            return self.get_response(request)
+        try:
+            with connection.execute_wrapper(sql):
+                response = self.get_response(request)
+        finally:
+            profiler.disable()
+        duration = time.perf_counter() - start
+
+        meta = {
+            "route": route_label(request),
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "duration_ms": round(duration * 1000, 1),
+            "queries": sum(count for count, _ in sql.stats.values()),
+            "started_at": started_at.isoformat(),
+            "trigger": "header" if HEADER in request.META else "sample",
+            "top_sql": sql.top(),
+        }
+        try:
+            save_profile(profiler, meta)
+        except OSError:
+            logger.warning("Could not write request profile to %s", profile_dir(), exc_info=True)
+        return response
+
+
+# --- Admin pages -----------------------------------------------------------------
+
+def profiles_view(request: HttpRequest):
+    profiles = list_profiles()
+    route = request.GET.get("route")
+    context = {
+        **admin.site.each_context(request),
+        "title": "Request profiles",
+        "profiles": [p for p in profiles if not route or p.get("route") == route],
+        "routes": sorted({p.get("route", "") for p in profiles}),
+        "route": route,
+        "token": profile_token(request.user),
+        "sample_rate": getattr(settings, "PROFILE_SAMPLE_RATE", 0),
+    }
+    return TemplateResponse(request, "admin/store/profiles.html", context)
+
+
+def profile_detail_view(request: HttpRequest, name: str):
+    meta = load_meta(name)
+    if meta is None:
+        raise Http404()
+    path = os.path.join(profile_dir(), f"{name}.prof")
+    if request.GET.get("download"):
+        return FileResponse(open(path, "rb"), as_attachment=True, filename=f"{name}.prof")
+    out = StringIO()
+    try:
+        pstats.Stats(path, stream=out).sort_stats("cumulative").print_stats(40)
+    except (OSError, TypeError, ValueError):
+        raise Http404()
+    context = {
+        **admin.site.each_context(request),
+        "title": f"Profile: {meta['route']} ({meta['duration_ms']} ms)",
+        "profile": meta,
+        "stats": out.getvalue(),
+    }
+    return TemplateResponse(request, "admin/store/profile_detail.html", context)
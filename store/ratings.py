@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from products.models import Product
+from .models import Rating
+
+
+def adjust_rating_aggregates(product_id: int, *, count: int = 0, stars: int = 0) -> None:
+    """Shift a product's rating_count/rating_sum in place (one UPDATE, race-free)."""
+    if count or stars:
+        Product.objects.filter(pk=product_id).update(
+            rating_count=F("rating_count") + count,
+            rating_sum=F("rating_sum") + stars,
+        )
+
+
+def _actual_aggregates():
+    base = Rating.objects.filter(product=OuterRef("pk")).order_by().values("product")
+    return (
+        Coalesce(Subquery(base.annotate(c=Count("id")).values("c")), Value(0)),
+        Coalesce(Subquery(base.annotate(s=Sum("stars")).values("s")), Value(0)),
+    )
+
+
+def recompute_rating_aggregates(product_ids=None) -> int:
+    """
+    Recompute rating_count/rating_sum from the Rating table in one UPDATE
+    (for every product, or just ``product_ids``). Returns how many products
+    had drifted.
+    """
+    count_sq, sum_sq = _actual_aggregates()
+    qs = Product.objects.all()
+    if product_ids is not None:
+        qs = qs.filter(pk__in=list(product_ids))
+    drifted = (
+        qs.annotate(actual_count=count_sq, actual_sum=sum_sq)
+        .filter(~Q(rating_count=F("actual_count")) | ~Q(rating_sum=F("actual_sum")))
+        .count()
+    )
+    if drifted:
+        qs.update(rating_count=count_sq, rating_sum=sum_sq)
+    return drifted
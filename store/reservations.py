@@ -0,0 +1,103 @@
+"""
+Short-lived stock holds for items sitting in carts.
+
+Setting a cart line upserts a StockReservation for (cart holder, product)
+that expires CART_RESERVATION_SECONDS after the cart was last touched.
+What a shopper can still take is ``stock_qty`` minus everyone else's
+active holds, computed either as a correlated subquery on a product query
+(``held_by_others``) or, for cached catalogue cards, with one grouped query
+(``held_quantities``). Expired rows stop counting at once and are deleted
+later, in batches, by ``sweep_reservations``.
+"""
+from __future__ import annotations
+
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import DecimalField, OuterRef, QuerySet, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import StockReservation
+
+HELD_FIELD = DecimalField(max_digits=10, decimal_places=3)
+
+
+def reservation_ttl() -> timedelta:
+    return timedelta(seconds=getattr(settings, "CART_RESERVATION_SECONDS", 900))
+
+
+def active_reservations(exclude_holder: str = "") -> QuerySet:
+    qs = StockReservation.objects.filter(expires_at__gt=timezone.now())
+    if exclude_holder:
+        qs = qs.exclude(holder=exclude_holder)
+    return qs
+
+
+def held_by_others(exclude_holder: str = "") -> Coalesce:
+    """Expression: qty of the outer product held by active carts other than ``exclude_holder``."""
+    total = (
+        active_reservations(exclude_holder)
+        .filter(product=OuterRef("pk"))
+        .order_by()
+        .values("product")
+        .annotate(total=Sum("qty"))
+        .values("total")
+    )
+    return Coalesce(Subquery(total, output_field=HELD_FIELD), Value(Decimal("0")), output_field=HELD_FIELD)
+
+
+def held_quantities(exclude_holder: str = "") -> Dict[int, Decimal]:
+    """{product_id: qty held by other carts} for every product with an active hold, in one query."""
+    return dict(
+        active_reservations(exclude_holder)
+        .order_by()
+        .values_list("product_id")
+        .annotate(total=Sum("qty"))
+    )
+
+
+def reserve(holder: str, product_id: int, qty: Decimal) -> None:
+    """Hold ``qty`` of a product for ``holder`` (replacing any earlier hold); zero releases it."""
+    if qty <= 0:
+        StockReservation.objects.filter(holder=holder, product_id=product_id).delete()
+        return
+    StockReservation.objects.update_or_create(
+        holder=holder,
+        product_id=product_id,
+        defaults={"qty": qty, "expires_at": timezone.now() + reservation_ttl()},
+    )
+
+
+def refresh_holds(holder: str) -> int:
+    """Push back the expiry of every hold for ``holder`` (one UPDATE)."""
+    return StockReservation.objects.filter(holder=holder).update(expires_at=timezone.now() + reservation_ttl())
+
+
+def release_holds(holder: str) -> int:
+    return StockReservation.objects.filter(holder=holder).delete()[0]
+
+
+def sweep_expired(batch_size: int = 500, max_batches: int = 0, pause: float = 0.0,
+                  now: Optional[datetime] = None) -> Tuple[int, int]:
+    """Delete expired holds in short batches along the expires_at index. Returns (deleted, batches)."""
+    cutoff = now or timezone.now()
+    deleted = batches = 0
+    while True:
+        ids = list(
+            StockReservation.objects.filter(expires_at__lte=cutoff)
+            .order_by("expires_at")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        deleted += StockReservation.objects.filter(id__in=ids).delete()[0]
+        batches += 1
+        if max_batches and batches >= max_batches:
+            break
+        if pause:
+            time.sleep(pause)
+    return deleted, batches
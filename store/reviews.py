@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import base64
+import binascii
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.db.models import Count, Q
+
+from .models import Rating
+
+REVIEWS_PAGE_SIZE = 20
+
+
+def encode_cursor(rating: Rating) -> str:
+    raw = f"{rating.created_at.isoformat()}|{rating.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[datetime, int]]:
+    """(created_at, id) of the last review already shown, or None if the cursor is missing/garbled."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created, pk = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created), int(pk)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+def review_page(product_id: int, cursor: str = "", size: int = REVIEWS_PAGE_SIZE) -> Tuple[List[Rating], Optional[str]]:
+    """
+    One page of a product's reviews, newest first, seeking past ``cursor`` on
+    (created_at, id) with a range seek on store_rating_keyset_idx, so cost is
+    independent of how deep the page is. Returns (reviews, next_cursor or None).
+    """
+    qs = Rating.objects.filter(product_id=product_id).select_related("user").order_by("-created_at", "-id")
+    after = decode_cursor(cursor)
+    if after is not None:
+        created, pk = after
+        # The created_at bound is the seekable prefix; the OR alone would
+        # make the index scan every newer row of the product first
+        qs = qs.filter(created_at__lte=created).filter(Q(created_at__lt=created) | Q(created_at=created, id__lt=pk))
+    rows = list(qs[: size + 1])
+    if len(rows) > size:
+        rows = rows[:size]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+def star_breakdown(product_id: int) -> Dict[str, Any]:
+    """
+    Star distribution, total and average from one grouped query:
+    {'breakdown': [(stars, count, pct), 5..1], 'total': int, 'avg': float}.
+    """
+    counts = dict(
+        Rating.objects.filter(product_id=product_id)
+        .order_by()
+        .values_list("stars")
+        .annotate(c=Count("id"))
+    )
+    total = sum(counts.values())
+    avg = sum(s * c for s, c in counts.items()) / total if total else 0
+    breakdown = [(s, counts.get(s, 0), (counts.get(s, 0) * 100.0) / (total or 1)) for s in range(5, 0, -1)]
+    return {"breakdown": breakdown, "total": total, "avg": avg}
+
+
+def review_as_json(r: Rating) -> Dict[str, Any]:
+    return {
+        "id": r.pk,
+        "user": r.user.email or r.user.username,
+        "created_at": r.created_at.isoformat(),
+        "stars": r.stars,
+        "text": r.text,
+    }
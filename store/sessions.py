@@ -0,0 +1,61 @@
+"""
+Write-behind cached_db session engine (SESSION_ENGINE = "store.sessions").
+
+Every save goes to the session cache; the ``django_session`` row is only
+rewritten when the session is created or when the last DB write is older
+than SESSION_WRITE_BEHIND_SECONDS. A burst of cart tweaks therefore costs
+one row write instead of one per click. The DB row still lets a session
+survive a cache restart, minus at most that many seconds of changes.
+
+Requires a cache shared by every worker (see DJANGO_CACHE_DIR in settings);
+with per-process local memory, use the plain "db" profile instead.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+logger = logging.getLogger("django.contrib.sessions")
+
+KEY_PREFIX = "store.sessions.write_behind"
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = KEY_PREFIX
+
+    @property
+    def _synced_key(self):
+        return f"{self.cache_key}:synced"
+
+    def save(self, must_create=False):
+        if must_create or self.session_key is None:
+            super().save(must_create)  # creates the row (and caches)
+            self._mark_synced()
+            return
+
+        interval = getattr(settings, "SESSION_WRITE_BEHIND_SECONDS", 60)
+        synced_at = self._cache.get(self._synced_key)
+        if synced_at is None or time.time() - synced_at >= interval:
+            super().save(must_create)
+            self._mark_synced()
+            return
+
+        try:
+            self._cache.set(self.cache_key, self._session, self.get_expiry_age())
+        except Exception:
+            # Cache unavailable: fall back to a normal write so nothing is lost
+            logger.exception("Error saving to cache (%s)", self._cache)
+            super().save(must_create)
+
+    def _mark_synced(self):
+        try:
+            self._cache.set(self._synced_key, time.time(), self.get_expiry_age())
+        except Exception:
+            logger.exception("Error saving to cache (%s)", self._cache)
+
+    def delete(self, session_key=None):
+        key = session_key or self.session_key
+        super().delete(session_key)
+        if key:
+            self._cache.delete(f"{self.cache_key_prefix}{key}:synced")
@@ -0,0 +1,88 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from products.models import Category, Product, ProductImage
+from products.signals import products_bulk_changed
+from .catalogue import bump_catalogue_version
+from .coupons import coupons_changed
+from .favorites import invalidate_favorites, merge_session_favorites
+from .models import Coupon, Favorite, Rating
+from .ratings import adjust_rating_aggregates, recompute_rating_aggregates
+
+CATALOGUE_SENDERS = (Product, Category, ProductImage, Rating)
+
+
+def _catalogue_changed(sender, **kwargs):
+    # After commit, so a concurrent request can't re-cache pre-commit rows under the new version
+    transaction.on_commit(bump_catalogue_version)
+
+
+for _model in CATALOGUE_SENDERS:
+    post_save.connect(_catalogue_changed, sender=_model, dispatch_uid=f"catalogue-save-{_model.__name__}")
+    post_delete.connect(_catalogue_changed, sender=_model, dispatch_uid=f"catalogue-delete-{_model.__name__}")
+
+
+def _products_bulk_changed(sender, **kwargs):
+    bump_catalogue_version()  # already sent after commit
+
+
+products_bulk_changed.connect(_products_bulk_changed, dispatch_uid="catalogue-bulk-products")
+
+
+# --- Product rating aggregates (run inside the saving transaction) ---
+
+def _rating_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, "_loaded_stars", None)
+    previous_product = getattr(instance, "_loaded_product_id", None)
+    if created:
+        adjust_rating_aggregates(instance.product_id, count=1, stars=instance.stars)
+    elif previous is None or previous_product is None:
+        # Saved from an instance not loaded from the DB (or with stars/product deferred)
+        recompute_rating_aggregates([instance.product_id])
+    elif previous_product != instance.product_id:
+        # Moved to another product (e.g. in RatingAdmin)
+        adjust_rating_aggregates(previous_product, count=-1, stars=-previous)
+        adjust_rating_aggregates(instance.product_id, count=1, stars=instance.stars)
+    else:
+        adjust_rating_aggregates(instance.product_id, stars=instance.stars - previous)
+    instance._loaded_stars = instance.stars
+    instance._loaded_product_id = instance.product_id
+
+
+def _rating_deleted(sender, instance, **kwargs):
+    adjust_rating_aggregates(instance.product_id, count=-1, stars=-instance.stars)
+
+
+post_save.connect(_rating_saved, sender=Rating, dispatch_uid="rating-aggregates-save")
+post_delete.connect(_rating_deleted, sender=Rating, dispatch_uid="rating-aggregates-delete")
+
+
+# --- Per-user favorites cache ---
+
+def _favorite_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_favorites(instance.user_id)
+
+
+def _merge_favorites_on_login(sender, request, user, **kwargs):
+    if request is not None and hasattr(request, "session"):
+        merge_session_favorites(user, request.session)
+
+
+post_save.connect(_favorite_changed, sender=Favorite, dispatch_uid="favorites-cache-save")
+post_delete.connect(_favorite_changed, sender=Favorite, dispatch_uid="favorites-cache-delete")
+user_logged_in.connect(_merge_favorites_on_login, dispatch_uid="favorites-merge-on-login")
+
+
+# --- Coupon lookup cache ---
+
+def _coupon_changed(sender, raw=False, **kwargs):
+    if not raw:
+        coupons_changed()
+
+
+post_save.connect(_coupon_changed, sender=Coupon, dispatch_uid="coupon-cache-save")
+post_delete.connect(_coupon_changed, sender=Coupon, dispatch_uid="coupon-cache-delete")
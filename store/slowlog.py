@@ -0,0 +1,179 @@
+"""
+Slow-query log.
+
+Every database connection gets an execute wrapper (installed on
+``connection_created``, so requests, commands and workers are all covered)
+that times each statement. Statements slower than SLOW_QUERY_MS are logged
+to the ``store.slowlog`` logger and accumulated per fingerprint (the SQL
+with literals and IN-lists folded) in the shared METRICS_DB file, together
+with the view and the innermost project line that issued them. The first
+time a process sees a slow SELECT it also stores SQLite's
+``EXPLAIN QUERY PLAN``, so full scans and temp B-trees show up next to the
+timings. ``manage.py slow_queries`` ranks fingerprints by total time.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import traceback
+from typing import List, Tuple
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.backends.signals import connection_created
+
+from .metrics import connect_store
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS slow_query (
+    fingerprint TEXT PRIMARY KEY,
+    sql TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    total_ms REAL NOT NULL,
+    max_ms REAL NOT NULL,
+    view TEXT NOT NULL,
+    caller TEXT NOT NULL,
+    plan TEXT NOT NULL DEFAULT '',
+    last_seen REAL NOT NULL
+)
+"""
+
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+# Frames from these files are instrumentation, not callers
+_SKIP_FILES = ("store/metrics.py", "store/profiling.py", "store/slowlog.py", "manage.py")
+
+_local = threading.local()  # .busy while this thread runs its own EXPLAIN
+_explained: set = set()  # fingerprints whose plan this process already stored
+
+
+def normalize(sql: str) -> str:
+    sql = sql.replace("%s", "?")
+    sql = _STRINGS.sub("?", sql)
+    sql = _NUMBERS.sub("?", sql)
+    sql = _IN_LISTS.sub("IN (...)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+def fingerprint(sql: str) -> str:
+    return hashlib.sha1(normalize(sql).encode()).hexdigest()[:16]
+
+
+def _project_frames() -> List[str]:
+    """``path:line in func`` for this project's frames on the stack, outermost first."""
+    base = str(settings.BASE_DIR) + os.sep
+    frames = []
+    for frame in traceback.extract_stack()[:-3]:
+        if not frame.filename.startswith(base) or "site-packages" in frame.filename:
+            continue
+        rel = os.path.relpath(frame.filename, base).replace(os.sep, "/")
+        if rel.startswith(_SKIP_FILES):
+            continue
+        frames.append(f"{rel}:{frame.lineno} in {frame.name}")
+    return frames
+
+
+def explain(connection, sql: str, params) -> str:
+    if connection.vendor != "sqlite" or not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+        return ""
+    _local.busy = True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return "\n".join(row[-1] for row in cursor.fetchall())
+    except DatabaseError:
+        return ""
+    finally:
+        _local.busy = False
+
+
+def record(sql: str, elapsed_ms: float, view: str, caller: str, plan: str) -> None:
+    conn = connect_store(SCHEMA)
+    try:
+        conn.execute(
+            "INSERT INTO slow_query (fingerprint, sql, count, total_ms, max_ms, view, caller, plan, last_seen) "
+            "VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (fingerprint) DO UPDATE SET count = count + 1, total_ms = total_ms + excluded.total_ms, "
+            "max_ms = max(max_ms, excluded.max_ms), view = excluded.view, caller = excluded.caller, "
+            "plan = CASE WHEN excluded.plan != '' THEN excluded.plan ELSE plan END, last_seen = excluded.last_seen",
+            (fingerprint(sql), normalize(sql), elapsed_ms, elapsed_ms, view, caller, plan, time.time()),
+        )
+    finally:
+        conn.close()
+
+
+def read_slow_queries(limit: int = 20) -> List[Tuple]:
+    """(fingerprint, sql, count, total_ms, max_ms, view, caller, plan), worst total first."""
+    conn = connect_store(SCHEMA)
+    try:
+        return conn.execute(
+            "SELECT fingerprint, sql, count, total_ms, max_ms, view, caller, plan FROM slow_query "
+            "ORDER BY total_ms DESC LIMIT ?", (limit,),
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def reset_slow_queries() -> None:
+    conn = connect_store(SCHEMA)
+    try:
+        conn.execute("DELETE FROM slow_query")
+    finally:
+        conn.close()
+    _explained.clear()
+
+
+class SlowQueryLogger:
+    """Execute wrapper for one connection."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_local, "busy", False):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            threshold = getattr(settings, "SLOW_QUERY_MS", 0)
+            if threshold and elapsed_ms >= threshold:
+                self.log(sql, params, many, elapsed_ms)
+
+    def log(self, sql: str, params, many: bool, elapsed_ms: float) -> None:
+        frames = _project_frames()
+        view = frames[0] if frames else "?"
+        caller = frames[-1] if frames else "?"
+        fp = fingerprint(sql)
+        plan = ""
+        if fp not in _explained and not many:
+            _explained.add(fp)
+            plan = explain(self.connection, sql, params)
+        logger.warning("Slow query (%.1f ms) [%s] at %s: %s", elapsed_ms, fp, caller, normalize(sql)[:500])
+        try:
+            record(sql, elapsed_ms, view, caller, plan)
+        except sqlite3.Error:
+            logger.warning("Could not record slow query in %s", settings.METRICS_DB, exc_info=True)
+
+
+def _install(sender, connection, **kwargs):
+    if not any(isinstance(w, SlowQueryLogger) for w in connection.execute_wrappers):
+        # First in the list (outermost), and out of reach of execute_wrapper()'s
+        # pop() when the connection is opened inside one
+        connection.execute_wrappers.insert(0, SlowQueryLogger(connection))
+
+
+def install() -> None:
+    """Wrap every new database connection (called from StoreConfig.ready)."""
+    connection_created.connect(_install, dispatch_uid="store-slow-query-log")
@@ -0,0 +1,122 @@
+"""
+Query budgets for tests.
+
+``query_budget`` is a context manager and a decorator::
+
+    with query_budget(6):
+        self.client.get(reverse("store:catalogue"))
+
+    @query_budget(3, max_repeats=1)
+    def test_favorites_count(self): ...
+
+It fails the test when the block runs more than ``max_queries`` statements,
+or runs any one SQL fingerprint (store.slowlog: the statement with its
+literals and IN-lists folded) more than ``max_repeats`` times. The second
+check is the N+1 signature: a SELECT repeated once per row can stay under a
+budget measured on a small fixture and still explode on real data.
+Transaction and savepoint statements are not counted as repeats.
+
+``QueryBudgetMixin`` adds ``assertQueryBudget`` to TestCase classes.
+
+``TestRunner`` (settings.TEST_RUNNER) points METRICS_DB and PROFILE_DIR at
+a temporary directory for the whole run, so request metrics, slow queries
+and profiles recorded by tests never land in the real files.
+"""
+from __future__ import annotations
+
+import os
+import shutil
+import tempfile
+from collections import Counter
+from contextlib import ContextDecorator
+from typing import List, Optional
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from .slowlog import fingerprint, normalize
+
+# Same statement shape allowed this many times per block by default
+DEFAULT_MAX_REPEATS = 2
+
+_TRANSACTION_PREFIXES = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT", "BEGIN", "COMMIT", "ROLLBACK")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class query_budget(ContextDecorator):
+    def __init__(self, max_queries: int, *, max_repeats: Optional[int] = DEFAULT_MAX_REPEATS,
+                 using: str = DEFAULT_DB_ALIAS, label: str = ""):
+        self.max_queries = max_queries
+        self.max_repeats = max_repeats
+        self.using = using
+        self.label = label
+        self._capture: Optional[CaptureQueriesContext] = None
+
+    @property
+    def queries(self) -> List[str]:
+        return [q["sql"] for q in self._capture.captured_queries] if self._capture else []
+
+    def __enter__(self):
+        self._capture = CaptureQueriesContext(connections[self.using])
+        self._capture.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._capture.__exit__(exc_type, exc, tb)
+        if exc_type is None:
+            self.check()
+        return False
+
+    def repeated(self) -> List[tuple]:
+        """(count, normalized SQL) for fingerprints run more than ``max_repeats`` times."""
+        if self.max_repeats is None:
+            return []
+        counts: Counter = Counter()
+        sample = {}
+        for sql in self.queries:
+            if sql.lstrip().upper().startswith(_TRANSACTION_PREFIXES):
+                continue
+            fp = fingerprint(sql)
+            counts[fp] += 1
+            sample.setdefault(fp, sql)
+        return [(n, normalize(sample[fp])) for fp, n in counts.most_common() if n > self.max_repeats]
+
+    def check(self) -> None:
+        queries = self.queries
+        where = f" ({self.label})" if self.label else ""
+        if len(queries) > self.max_queries:
+            listing = "\n".join(f"{i}. {sql}" for i, sql in enumerate(queries, start=1))
+            raise QueryBudgetExceeded(
+                f"{len(queries)} queries{where}, budget is {self.max_queries}:\n{listing}"
+            )
+        repeated = self.repeated()
+        if repeated:
+            listing = "\n".join(f"{n}x {sql}" for n, sql in repeated)
+            raise QueryBudgetExceeded(
+                f"Same statement run more than {self.max_repeats} times{where} (N+1?):\n{listing}"
+            )
+
+
+class QueryBudgetMixin:
+    def assertQueryBudget(self, max_queries: int, **kwargs) -> query_budget:
+        return query_budget(max_queries, **kwargs)
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._scratch = tempfile.mkdtemp(prefix="farm-store-tests-")
+        self._scratch_settings = override_settings(
+            METRICS_DB=os.path.join(self._scratch, "metrics.sqlite3"),
+            PROFILE_DIR=os.path.join(self._scratch, "profiles"),
+        )
+        self._scratch_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._scratch_settings.disable()
+        shutil.rmtree(self._scratch, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
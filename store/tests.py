@@ -1,3 +1,1031 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from products.admin import ProductAdmin
+from products.models import CARD_IMAGE_LIMIT, Category, Product, ProductImage
+from products.search import index_products
+from .cache import FileCache
+from .cart import Cart
+from .coupons import clear_coupon_cache, coupons_changed, resolve_coupon
+from .catalogue import (
+    OVERLAY_QUERY_BUDGET, QUERY_BUDGET, apply_user_overlay, catalogue_products,
+    bump_catalogue_version, group_by_category, load_catalogue,
+)
+from .favorites import favorite_ids
+from .metrics import Recorder, recorder, render_prometheus, read_histograms
+from .profiling import list_profiles, profile_token
+from .ratings import recompute_rating_aggregates
+from .models import Coupon, Favorite, Order, OrderItem, OutboxEmail, Rating, StockReservation
+from .outbox import claim_batch, deliver, drain
+from .reservations import sweep_expired
+from .testing import QueryBudgetExceeded, QueryBudgetMixin, query_budget
+from .slowlog import fingerprint, read_slow_queries, reset_slow_queries
+from .reviews import REVIEWS_PAGE_SIZE, review_page, star_breakdown
+from .sessions import SessionStore as WriteBehindSession
+
+User = get_user_model()
+
+
+def make_catalogue(n_products: int, n_categories: int = 3, prefix: str = ""):
+    cats = [Category.objects.create(name=f"{prefix}Cat {i}") for i in range(n_categories)]
+    products = Product.objects.bulk_create(
+        Product(
+            category=cats[i % n_categories],
+            name=f"{prefix}Product {i}",
+            slug=f"{prefix}product-{i}",
+            price=Decimal("2.50"),
+            stock_qty=Decimal("10"),
+        )
+        for i in range(n_products)
+    )
+    index_products(p.id for p in products)  # bulk_create skips the post_save receivers
+    return products
+
+
+class CatalogueLoaderTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("shopper", "shopper@example.com", "pw")
+
+    def _purchase_and_rate(self, products, stars=4):
+        order = Order.objects.create(user=self.user, email=self.user.email)
+        for p in products:
+            OrderItem.objects.create(order=order, product=p, qty=1)
+            Rating.objects.create(product=p, user=self.user, stars=stars)
+
+    def test_query_budget_is_independent_of_catalogue_size(self):
+        total = 0
+        for n in (10, 200):
+            products = make_catalogue(n, prefix=f"s{n}-")
+            self._purchase_and_rate(products[:5])
+            total += n
+            with self.assertNumQueries(QUERY_BUDGET):
+                groups = group_by_category(catalogue_products())
+            self.assertEqual(sum(len(g["visible_products"]) for g in groups), total)
+
+    def test_annotations(self):
+        products = make_catalogue(3)
+        self._purchase_and_rate(products[:1], stars=3)
+
+        shown = {p.id: p for p in catalogue_products()}
+        self.assertEqual(shown[products[0].id].avg_stars, 3)
+        self.assertEqual(shown[products[1].id].avg_stars, 5)
+
+    def test_search_returns_every_match(self):
+        make_catalogue(250, prefix="Squash ")
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(len(catalogue_products(q="squash")), 250)
+        # One joined query, not the matching ids spelled out as parameters
+        self.assertLess(len(ctx.captured_queries[0]["sql"]), 4000)
+
+        Product.objects.filter(name="Squash Product 8").update(description="Butternut")
+        Product.objects.filter(name="Squash Product 7").update(name="Winter Butternut")
+        index_products(Product.objects.values_list("pk", flat=True))
+        self.assertEqual(
+            [p.name for p in catalogue_products(q="butternut")], ["Winter Butternut", "Squash Product 8"],
+        )
+        resp = self.client.get(reverse("store:catalogue"), {"q": "squash"})
+        self.assertEqual(sum(len(g["visible_products"]) for g in resp.context["categories"]), 250)
+
+    def test_catalogue_view_renders(self):
+        make_catalogue(3)
+        self.client.force_login(self.user)
+        resp = self.client.get(reverse("store:catalogue"), {"q": "Product 1"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertContains(resp, "Product 1")
+
+
+class ProductImageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_primary_image_follows_image_saves_and_deletes(self):
+        (p,) = make_catalogue(1)
+        first = ProductImage.objects.create(product=p, image="products/a.jpg")
+        second = ProductImage.objects.create(product=p, image="products/b.jpg")
+        p.refresh_from_db()
+        self.assertEqual(p.primary_image_id, first.id)
+
+        first.delete()
+        p.refresh_from_db()
+        self.assertEqual(p.primary_image_id, second.id)
+
+        second.delete()
+        p.refresh_from_db()
+        self.assertIsNone(p.primary_image_id)
+
+    def test_catalogue_image_queries_are_constant(self):
+        self.client.get(reverse("store:catalogue"))  # create the session
+        counts = []
+        for n in (5, 60):
+            for p in make_catalogue(n, prefix=f"s{n}-"):
+                for name in "abcde":
+                    ProductImage.objects.create(product=p, image=f"products/{p.slug}-{name}.jpg")
+            bump_catalogue_version()  # measure the cache-miss path
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.get(reverse("store:catalogue"))
+            self.assertEqual(resp.status_code, 200)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+        card = resp.context["categories"][0]["visible_products"][0]
+        self.assertEqual(len(card.card_images), CARD_IMAGE_LIMIT)
+
+
+class CatalogueCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("shopper", "shopper@example.com", "pw")
+        self.products = make_catalogue(4)
+
+    def test_cache_hit_skips_product_query(self):
+        load_catalogue()
+        with self.assertNumQueries(0):
+            groups = load_catalogue()
+            apply_user_overlay(groups, None, {})
+        self.assertEqual(sum(len(g["visible_products"]) for g in groups), 4)
+
+    def test_overlay_is_per_user(self):
+        p = self.products[0]
+        order = Order.objects.create(user=self.user, email=self.user.email)
+        OrderItem.objects.create(order=order, product=p, qty=1)
+        Rating.objects.create(product=p, user=self.user, stars=2)
+        groups = load_catalogue()
+
+        with self.assertNumQueries(OVERLAY_QUERY_BUDGET):
+            apply_user_overlay(groups, self.user, {str(p.id): Decimal("3")}, {str(p.id)})
+        card = next(x for g in groups for x in g["visible_products"] if x.id == p.id)
+        self.assertEqual(card.in_cart, Decimal("3"))
+        self.assertEqual(card.remaining, Decimal("7"))
+        self.assertTrue(card.is_favorite)
+        self.assertEqual(card.user_stars, 2)
+        self.assertTrue(card.user_can_rate)
+
+        # A fresh read is not polluted by the previous visitor's overlay
+        card = next(x for g in load_catalogue() for x in g["visible_products"] if x.id == p.id)
+        self.assertFalse(hasattr(card, "in_cart"))
+
+    def test_saves_bump_version(self):
+        load_catalogue()
+        p = self.products[0]
+        p.name = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            p.save()
+        names = {x.name for g in load_catalogue() for x in g["visible_products"]}
+        self.assertIn("Renamed", names)
+
+
+class CartPricerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_coupon_cache()
+        self.products = make_catalogue(6)
+        Coupon.objects.create(code="SAVE10", percent_off=Decimal("10"))
+
+    def _set_cart(self, products, coupon=""):
+        session = self.client.session
+        session["cart"] = {str(p.id): {"qty": "2"} for p in products}
+        session["coupon_code"] = coupon
+        session.save()
+
+    def test_cart_page_queries_do_not_grow_with_lines(self):
+        resolve_coupon("SAVE10")  # warm the coupon cache so both passes match
+        counts = []
+        for n in (1, 6):
+            self._set_cart(self.products[:n], coupon="SAVE10")
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.get(reverse("store:cart"))
+            self.assertEqual(resp.status_code, 200)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(resp.context["subtotal"], Decimal("30.00"))
+        self.assertEqual(resp.context["discount"], Decimal("3.00"))
+        self.assertEqual(resp.context["total"], Decimal("27.00"))
+
+    def test_missing_product_drops_line(self):
+        self._set_cart(self.products[:2])
+        session = self.client.session
+        session["cart"]["999999"] = {"qty": "1"}
+        session.save()
+
+        resp = self.client.get(reverse("store:cart"))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.context["items"]), 2)
+        self.assertNotIn("999999", self.client.session["cart"]["items"])
+
+    def test_update_qty_returns_priced_totals(self):
+        self._set_cart(self.products[:1], coupon="SAVE10")
+        p = self.products[0]
+        resp = self.client.post(reverse("store:update_qty", args=[p.id]), {"qty": "4"})
+        data = resp.json()
+        self.assertEqual(data["remaining"], "6")
+        self.assertEqual(Decimal(data["subtotal"]), Decimal("10.00"))
+        self.assertEqual(Decimal(data["total"]), Decimal("9.00"))
+
+
+class CouponCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_coupon_cache()
+        self.coupon = Coupon.objects.create(code="Spring5", amount_off=Decimal("5"))
+
+    def test_lookup_is_case_insensitive_and_cached(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(resolve_coupon(" spring5 "), self.coupon)
+        self.assertIn("UPPER(", ctx.captured_queries[0]["sql"])
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_coupon("SPRING5"), self.coupon)
+            self.assertIsNone(resolve_coupon(""))
+
+    def test_unknown_codes_cached_until_a_coupon_is_saved(self):
+        self.assertIsNone(resolve_coupon("NEW"))
+        with self.assertNumQueries(0):
+            self.assertIsNone(resolve_coupon("new"))
+        created = Coupon.objects.create(code="NEW", percent_off=Decimal("5"))
+        self.assertEqual(resolve_coupon("new"), created)
+
+    def test_change_in_another_worker_drops_local_entries(self):
+        self.assertEqual(resolve_coupon("spring5").amount_off, Decimal("5"))
+        Coupon.objects.filter(pk=self.coupon.pk).update(amount_off=Decimal("7"))  # no signal in this process
+        with mock.patch("store.coupons._entries", {}):  # the other worker's own entries
+            coupons_changed()
+        self.assertEqual(resolve_coupon("spring5").amount_off, Decimal("7"))
+
+    def test_validity_window_checked_at_read_time(self):
+        self.coupon.end_at = timezone.now() + timedelta(minutes=5)
+        self.coupon.save()
+        self.assertTrue(resolve_coupon("SPRING5").is_valid_now())
+        later = timezone.now() + timedelta(minutes=10)
+        with mock.patch("django.utils.timezone.now", return_value=later), self.assertNumQueries(0):
+            self.assertFalse(resolve_coupon("SPRING5").is_valid_now())
+
+    def test_case_variants_rejected(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Coupon.objects.create(code="SPRING5")
+
+
+class CartTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.products = make_catalogue(3)
+
+    def test_summary_tracks_mutations(self):
+        session = self.client.session
+        cart = Cart(session)
+        a, b, c = (p.id for p in self.products)
+        cart.set(a, Decimal("2"))
+        cart.set(b, Decimal("1.5"))
+        cart.set(a, Decimal("5"))
+        cart.set(c, Decimal("1"))
+        cart.remove(b)
+        cart.remove(999)  # not in cart: no-op
+        self.assertEqual(Decimal(cart.count), Decimal("6"))
+        self.assertEqual(cart.lines, 2)
+        self.assertEqual(cart.quantities(), {str(a): Decimal("5"), str(c): Decimal("1")})
+        cart.clear()
+        self.assertEqual((cart.count, cart.lines), ("0", 0))
+
+    def test_legacy_cart_migrated_once(self):
+        a, b, c = (str(p.id) for p in self.products)
+        session = self.client.session
+        session["cart"] = {a: {"qty": "2"}, b: "3", c: {"qty": "0"}, "junk": {"qty": "1"}}
+        session.save()
+
+        cart = Cart(self.client.session)
+        self.assertEqual(cart.data["v"], 2)
+        self.assertEqual(cart.quantities(), {a: Decimal("2"), b: Decimal("3")})
+        self.assertEqual((Decimal(cart.count), cart.lines), (Decimal("5"), 2))
+
+    def test_header_count_and_priced_subtotal(self):
+        a = self.products[0]
+        self.client.post(reverse("store:update_qty", args=[a.id]), {"qty": "4"})
+        self.assertEqual(Decimal(self.client.session["cart"]["count"]), Decimal("4"))
+
+        resp = self.client.get(reverse("store:cart"))
+        self.assertEqual(Decimal(resp.context["cart_item_total"]), Decimal("4"))
+        self.assertEqual(Cart(self.client.session).subtotal, Decimal("10.00"))
+
+    def test_browsing_does_not_write_empty_cart(self):
+        self.client.get(reverse("store:catalogue"))
+        self.assertNotIn("cart", self.client.session)
+
+
+class FavoriteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.products = make_catalogue(4)
+        self.user = User.objects.create_user("shopper", "shopper@example.com", "pw")
+
+    def test_toggle_persists_and_invalidates_cached_set(self):
+        self.client.force_login(self.user)
+        p = self.products[0]
+        self.assertEqual(favorite_ids(self.user), frozenset())
+        with self.assertNumQueries(0):
+            favorite_ids(self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(reverse("store:toggle_favorite", args=[p.id]))
+        self.assertTrue(resp.json()["favorited"])
+        self.assertTrue(Favorite.objects.filter(user=self.user, product=p).exists())
+        self.assertEqual(self.client.get(reverse("store:favorites_count")).json()["count"], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(reverse("store:toggle_favorite", args=[p.id]))
+        self.assertFalse(resp.json()["favorited"])
+        self.assertEqual(favorite_ids(self.user), frozenset())
+
+    def test_session_favorites_merged_at_login(self):
+        a, b = self.products[:2]
+        Favorite.objects.create(user=self.user, product=a)
+        session = self.client.session
+        session["favorites"] = [str(a.id), str(b.id), "999999"]
+        session.save()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.login(username="shopper", password="pw")
+        self.assertEqual(favorite_ids(self.user), frozenset({a.id, b.id}))
+        self.assertNotIn("favorites", self.client.session)
+
+    def test_only_favorites_filtered_in_sql(self):
+        a, b = self.products[1], self.products[3]
+        Favorite.objects.bulk_create([Favorite(user=self.user, product=a), Favorite(user=self.user, product=b)])
+        self.client.force_login(self.user)
+        resp = self.client.get(reverse("store:catalogue"), {"fav": "1", "oos": "1"})
+        shown = {p.id for c in resp.context["categories"] for p in c["visible_products"]}
+        self.assertEqual(shown, {a.id, b.id})
+        self.assertEqual(resp.context["fav_count"], 2)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.products = make_catalogue(5)
+
+    def _checkout(self, qtys):
+        session = self.client.session
+        session["cart"] = {str(p.id): {"qty": str(q)} for p, q in qtys}
+        session.save()
+        return self.client.post(
+            reverse("store:checkout"),
+            {"email": "guest@example.com", "payment_method": "cash"},
+        )
+
+    def test_checkout_writes_order_and_decrements_stock(self):
+        a, b = self.products[:2]
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self._checkout([(a, 3), (b, 10)])
+        order = Order.objects.get()
+        self.assertRedirects(resp, reverse("store:thanks", args=[order.pk]), fetch_redirect_response=False)
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(order.total, Decimal("32.50"))
+        a.refresh_from_db()
+        b.refresh_from_db()
+        self.assertEqual(a.stock_qty, Decimal("7"))
+        self.assertEqual(b.stock_qty, Decimal("0"))
+        self.assertEqual(self.client.session["cart"]["items"], {})
+
+    def test_checkout_round_trips_do_not_grow_with_lines(self):
+        self._checkout([])  # create the session
+        counts = []
+        for chunk in (self.products[:1], self.products[1:5]):
+            with CaptureQueriesContext(connection) as ctx:
+                self._checkout([(p, 1) for p in chunk])
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_shortage_fails_whole_order(self):
+        a, b = self.products[:2]
+        # Someone else bought most of b after it went into our cart
+        Product.objects.filter(pk=b.pk).update(stock_qty=Decimal("2"))
+        resp = self._checkout([(a, 1), (b, 5)])
+
+        self.assertRedirects(resp, reverse("store:cart"), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        a.refresh_from_db()
+        self.assertEqual(a.stock_qty, Decimal("10"))
+        self.assertEqual(self.client.session["cart"]["lines"], 2)
+
+        page = self.client.get(reverse("store:cart"))
+        self.assertEqual(page.context["checkout_shortages"], [f"{b.name}: 5 requested, only 2 left"])
+
+
+class ReservationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = make_catalogue(1)[0]  # stock 10
+        self.alice, self.bob = Client(), Client()
+
+    def _set_qty(self, client, qty):
+        return client.post(reverse("store:update_qty", args=[self.product.id]), {"qty": str(qty)}).json()
+
+    def _card(self, client):
+        resp = client.get(reverse("store:catalogue"), {"oos": "1"})
+        return next(p for c in resp.context["categories"] for p in c["visible_products"])
+
+    def test_other_carts_holds_reduce_remaining(self):
+        self.assertEqual(self._set_qty(self.alice, 8)["remaining"], "2")
+        self.assertEqual(self._card(self.bob).remaining, Decimal("2"))
+
+        data = self._set_qty(self.bob, 5)  # clamped to what Alice left
+        self.assertEqual(data["remaining"], "0")
+        self.assertEqual(Decimal(self.bob.session["cart"]["count"]), Decimal("2"))
+        self.assertEqual(self._card(self.alice).remaining, Decimal("0"))
+
+        self._set_qty(self.alice, 0)  # releases her hold
+        self.assertEqual(self._card(self.bob).remaining, Decimal("8"))
+
+    def test_expired_holds_stop_counting_and_are_swept(self):
+        self._set_qty(self.alice, 8)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self._card(self.bob).remaining, Decimal("10"))
+
+        holders = [StockReservation(holder=f"h{i}", product=self.product, qty=1,
+                                    expires_at=timezone.now() - timedelta(minutes=1)) for i in range(4)]
+        StockReservation.objects.bulk_create(holders)
+        self.assertEqual(sweep_expired(batch_size=2), (5, 3))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_checkout_honours_other_holds_and_releases_own(self):
+        self._set_qty(self.alice, 8)
+        session = self.bob.session
+        session["cart"] = {str(self.product.id): {"qty": "5"}}  # added before holds existed
+        session.save()
+        checkout = {"email": "guest@example.com", "payment_method": "cash"}
+
+        self.bob.post(reverse("store:checkout"), checkout)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(
+            self.bob.get(reverse("store:cart")).context["checkout_shortages"],
+            [f"{self.product.name}: 5 requested, only 2 left"],
+        )
+
+        self.alice.post(reverse("store:checkout"), checkout)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_qty, Decimal("2"))
+        self.assertFalse(StockReservation.objects.exists())
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class OutboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.products = make_catalogue(1)
+
+    def _place_order(self):
+        session = self.client.session
+        session["cart"] = {str(self.products[0].id): {"qty": "1"}}
+        session.save()
+        self.client.post(reverse("store:checkout"), {"email": "guest@example.com", "payment_method": "cash"})
+        return Order.objects.latest("id")
+
+    def test_checkout_queues_mail_without_sending(self):
+        order = self._place_order()
+        self.assertEqual(len(mail.outbox), 0)
+        queued = list(OutboxEmail.objects.values_list("recipients", "status"))
+        self.assertIn(([order.email], OutboxEmail.Status.PENDING), queued)
+        self.assertEqual(len(queued), 2)
+
+    def test_worker_sends_batch(self):
+        order = self._place_order()
+        out = StringIO()
+        call_command("send_outbox", stdout=out)
+        self.assertIn("sent=2", out.getvalue())
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertIn(order.order_number, mail.outbox[0].subject)
+        self.assertFalse(OutboxEmail.objects.exclude(status=OutboxEmail.Status.SENT).exists())
+
+    def test_expired_claim_is_not_marked_sent(self):
+        self._place_order()
+        batch = claim_batch(10)
+
+        def lease_lost(*args, **kwargs):
+            OutboxEmail.objects.update(claimed_by="other-worker")
+            return 1
+
+        with mock.patch("django.core.mail.EmailMessage.send", side_effect=lease_lost), \
+                self.assertLogs("store.outbox", "WARNING") as logs:
+            self.assertEqual(deliver(batch)["sent"], 2)
+        self.assertIn("2 of 2", logs.output[0])
+        self.assertFalse(OutboxEmail.objects.filter(status=OutboxEmail.Status.SENT).exists())
+        self.assertEqual(set(OutboxEmail.objects.values_list("claimed_by", flat=True)), {"other-worker"})
+
+    def test_failures_back_off_then_dead_letter(self):
+        self._place_order()
+        with mock.patch("django.core.mail.EmailMessage.send", side_effect=OSError("smtp down")):
+            self.assertEqual(drain(max_attempts=2), {"sent": 0, "retry": 2, "dead": 0})
+            # Not due yet: nothing is retried immediately
+            self.assertEqual(drain(max_attempts=2), {"sent": 0, "retry": 0, "dead": 0})
+            OutboxEmail.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(drain(max_attempts=2), {"sent": 0, "retry": 0, "dead": 2})
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.Status.DEAD).count(), 2)
+        self.assertIn("smtp down", OutboxEmail.objects.first().last_error)
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("shopper", "shopper@example.com", "pw")
+        (self.product,) = make_catalogue(1)
+        order = Order.objects.create(user=self.user, email=self.user.email)
+        OrderItem.objects.create(order=order, product=self.product, qty=1)
+        self.client.force_login(self.user)
+
+    def _rate(self, stars):
+        return self.client.post(reverse("store:rate_product", args=[self.product.id]), {"stars": stars}).json()
+
+    def test_rate_and_rerate_maintain_aggregates(self):
+        other = User.objects.create_user("other", "other@example.com", "pw")
+        Rating.objects.create(product=self.product, user=other, stars=5)
+
+        self.assertEqual(self._rate(2), {"ok": True, "avg": 3.5})
+        self.assertEqual(self._rate(4), {"ok": True, "avg": 4.5})
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_sum), (2, 9))
+
+        Rating.objects.filter(user=other).delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.avg_rating, 4)
+
+    def test_stale_admin_save_keeps_aggregates(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        self._rate(3)
+        stale.price = Decimal("9.99")
+        ProductAdmin(Product, admin.site).save_model(None, stale, None, change=True)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.price), (1, Decimal("9.99")))
+
+    def test_clone_is_a_full_insert(self):
+        self._rate(4)
+        clone = Product.objects.get(pk=self.product.pk)
+        clone.pk = None
+        clone.slug = f"{clone.slug}-copy"
+        clone.save()
+        self.assertNotEqual(clone.pk, self.product.pk)
+        clone.refresh_from_db()
+        self.assertEqual((clone.name, clone.rating_count), (self.product.name, 1))
+
+    def test_moving_a_rating_moves_its_aggregates(self):
+        self._rate(4)
+        (other,) = make_catalogue(1, prefix="other-")
+        rating = Rating.objects.get(user=self.user)
+        rating.product = other
+        rating.stars = 2
+        rating.save()
+        self.product.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_sum), (0, 0))
+        self.assertEqual((other.rating_count, other.rating_sum), (1, 2))
+        self.assertEqual(recompute_rating_aggregates(), 0)
+
+    def test_recompute_command_repairs_drift(self):
+        self._rate(5)
+        Product.objects.filter(pk=self.product.pk).update(rating_count=7, rating_sum=1)
+        out = StringIO()
+        call_command("recompute_ratings", stdout=out)
+        self.assertIn("Repaired 1 product", out.getvalue())
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_sum), (1, 5))
+
+
+class ReviewsPageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        (self.product,) = make_catalogue(1)
+        users = User.objects.bulk_create(User(username=f"u{i}", email=f"u{i}@example.com") for i in range(45))
+        Rating.objects.bulk_create(
+            Rating(product=self.product, user=u, stars=(i % 5) + 1) for i, u in enumerate(users)
+        )
+        # Identical timestamps force the id tiebreaker
+        Rating.objects.filter(user__in=users[10:30]).update(created_at=timezone.now())
+
+    def test_cursor_walks_every_review_once(self):
+        seen, after = [], ""
+        while True:
+            with self.assertNumQueries(1):
+                page, after = review_page(self.product.id, after)
+            seen += [r.id for r in page]
+            if after is None:
+                break
+        self.assertEqual(len(seen), 45)
+        self.assertEqual(len(set(seen)), 45)
+
+    def test_deep_page_seeks_the_index(self):
+        _, after = review_page(self.product.id)
+        statements = []
+
+        def capture(execute, sql, params, many, context):
+            statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(capture):
+            review_page(self.product.id, after)
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {statements[0][0]}", statements[0][1])  # bound, as in production
+            plan = " ".join(row[-1] for row in cursor.fetchall())
+        self.assertIn("store_rating_keyset_idx (product_id=? AND created_at<?)", plan)
+
+    def test_breakdown_single_query(self):
+        with self.assertNumQueries(1):
+            stats = star_breakdown(self.product.id)
+        self.assertEqual(stats["total"], 45)
+        self.assertEqual(stats["avg"], 3)
+        self.assertEqual(stats["breakdown"][0], (5, 9, 20.0))
+
+    def test_json_load_more(self):
+        first = self.client.get(reverse("store:reviews_detail", args=[self.product.id]))
+        self.assertEqual(len(first.context["reviews"]), REVIEWS_PAGE_SIZE)
+        more = self.client.get(
+            reverse("store:reviews_page", args=[self.product.id]), {"after": first.context["next_cursor"]}
+        ).json()
+        self.assertEqual(len(more["reviews"]), REVIEWS_PAGE_SIZE)
+        self.assertNotIn(first.context["reviews"][-1].id, [r["id"] for r in more["reviews"]])
+
+    def test_garbled_cursor_starts_from_top(self):
+        resp = self.client.get(reverse("store:reviews_page", args=[self.product.id]), {"after": "!!nope"})
+        self.assertEqual(len(resp.json()["reviews"]), REVIEWS_PAGE_SIZE)
+
+
+class SessionProfileTests(TestCase):
+    def setUp(self):
+        caches["sessions"].clear()
+
+    def test_write_behind_coalesces_db_writes(self):
+        store = WriteBehindSession()
+        store["cart"] = {"1": {"qty": "1"}}
+        store.save()  # creates the row
+        with CaptureQueriesContext(connection) as ctx:
+            for qty in range(2, 6):
+                store["cart"] = {"1": {"qty": str(qty)}}
+                store.save()
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(WriteBehindSession(store.session_key)["cart"], {"1": {"qty": "5"}})
+
+        with override_settings(SESSION_WRITE_BEHIND_SECONDS=0):
+            store.save()
+        caches["sessions"].clear()  # cache lost: the DB row has the latest data
+        self.assertEqual(WriteBehindSession(store.session_key)["cart"], {"1": {"qty": "5"}})
+
+    def test_sweeper_deletes_expired_in_batches(self):
+        past = timezone.now() - timedelta(days=1)
+        Session.objects.bulk_create(
+            Session(session_key=f"expired{i:04d}", session_data="", expire_date=past) for i in range(25)
+        )
+        Session.objects.create(session_key="live", session_data="", expire_date=timezone.now() + timedelta(days=1))
+        out = StringIO()
+        call_command("sweep_sessions", batch_size=10, pause=0, stdout=out)
+        self.assertIn("Deleted 25 expired session(s) in 3 batch(es)", out.getvalue())
+        self.assertEqual(list(Session.objects.values_list("session_key", flat=True)), ["live"])
+
+
+class FileCacheTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.cache = FileCache(self.dir, {"OPTIONS": {"MAX_ENTRIES": 6, "CULL_FREQUENCY": 2}})
+
+    def test_culls_expired_then_oldest_at_most_once_per_interval(self):
+        for i in range(6):
+            self.cache.set(f"old{i}", i, timeout=1 if i < 2 else None)
+            os.utime(self.cache._key_to_file(f"old{i}"), (1000 + i, 1000 + i))
+        self.cache._culled_at = float("-inf")  # interval over
+        with mock.patch("django.core.cache.backends.filebased.time.time", return_value=time.time() + 5), \
+                mock.patch.object(self.cache, "_list_cache_files", wraps=self.cache._list_cache_files) as listing:
+            self.cache.set("new", "x")  # 2 expired go, the 4 live ones stay: under MAX_ENTRIES
+            self.cache.set("new2", "y")  # inside the interval: no directory scan
+        self.assertEqual(listing.call_count, 1)
+        self.assertEqual([self.cache.has_key(f"old{i}") for i in range(6)], [False, False, True, True, True, True])
+
+        self.cache._culled_at = float("-inf")
+        self.cache.set("new3", "z")  # 6 live: the oldest half goes
+        self.assertEqual([self.cache.has_key(f"old{i}") for i in range(2, 6)], [False, False, False, True])
+        self.assertTrue(all(self.cache.has_key(k) for k in ("new", "new2", "new3")))
+
+
+class OrderAdminTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        self.client.force_login(self.admin)
+
+    def _add_orders(self, n):
+        users = User.objects.bulk_create(
+            User(username=f"buyer{Order.objects.count()}-{i}", email=f"b{i}@example.com") for i in range(n)
+        )
+        Order.objects.bulk_create(Order(user=u, email=u.email, total=Decimal("1")) for u in users)
+
+    def _queries(self):
+        url = reverse("admin:store_order_changelist")
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_changelist_constant_queries(self):
+        self._add_orders(10)
+        small = self._queries()
+        self._add_orders(490)
+        self.assertEqual(self._queries(), small)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        settings = override_settings(METRICS_DB=os.path.join(self.tmp, "metrics.sqlite3"), METRICS_FLUSH_SECONDS=3600)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        recorder.reset()
+        make_catalogue(4)
+
+    def test_server_timing_header(self):
+        self.client.get(reverse("store:catalogue"))
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(reverse("store:catalogue"))
+        timing = resp["Server-Timing"]
+        self.assertRegex(timing, r'^view;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, session;dur=[\d.]+$')
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', timing)
+
+    def test_metrics_endpoint_aggregates_routes_and_workers(self):
+        for _ in range(2):
+            self.client.get(reverse("store:catalogue"))
+        self.client.get(reverse("store:cart"))
+        other_worker = Recorder()
+        other_worker.observe("store:catalogue", {"farm_request_duration_seconds": 0.2, "farm_db_queries": 4})
+        other_worker.flush()
+
+        staff = User.objects.create_user("ops", "ops@example.com", "pw", is_staff=True)
+        self.client.force_login(staff)
+        resp = self.client.get("/metrics")
+        self.assertEqual(resp.status_code, 200)
+        body = resp.content.decode()
+        self.assertIn('farm_request_duration_seconds_count{route="store:catalogue"} 3', body)
+        self.assertIn('farm_request_duration_seconds_count{route="store:cart"} 1', body)
+        self.assertIn('farm_db_queries_bucket{route="store:catalogue",le="5"}', body)
+        self.assertIn('farm_request_duration_seconds_bucket{route="store:catalogue",le="+Inf"} 3', body)
+
+        # Buckets are cumulative
+        rows = [("farm_db_queries", "r", "1", 2), ("farm_db_queries", "r", "5", 1), ("farm_db_queries", "r", "count", 3)]
+        text = render_prometheus(rows)
+        self.assertIn('farm_db_queries_bucket{route="r",le="3"} 2', text)
+        self.assertIn('farm_db_queries_bucket{route="r",le="+Inf"} 3', text)
+        self.assertTrue(read_histograms())
+
+    def test_metrics_endpoint_is_restricted(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)  # not even localhost by default
+        with override_settings(METRICS_ALLOWED_IPS=["203.0.113.5"]):
+            self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="203.0.113.5").status_code, 200)
+            self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="203.0.113.6").status_code, 403)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        settings = override_settings(PROFILE_DIR=tmp, PROFILE_SAMPLE_RATE=0, PROFILE_KEEP=2)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        make_catalogue(3)
+        self.staff = User.objects.create_superuser("staff", "staff@example.com", "pw")
+        self.url = reverse("store:catalogue")
+
+    def test_signed_header_profiles_staff_requests_only(self):
+        token = profile_token(self.staff)
+        self.client.get(self.url, HTTP_X_PROFILE=token)  # anonymous: ignored
+        self.assertEqual(list_profiles(), [])
+
+        self.client.force_login(self.staff)
+        self.client.get(self.url, HTTP_X_PROFILE=token + "x")
+        self.assertEqual(list_profiles(), [])
+        self.client.get(self.url, HTTP_X_PROFILE=token)
+        [profile] = list_profiles()
+        self.assertEqual((profile["route"], profile["trigger"], profile["status"]), ("store:catalogue", "header", 200))
+        self.assertTrue(profile["top_sql"])
+
+        resp = self.client.get(reverse("profiles"))
+        self.assertContains(resp, "store:catalogue")
+        shown = resp.context["token"]  # signed now: differs from ``token`` once the clock ticks a second
+        self.assertContains(resp, shown)
+        resp = self.client.get(reverse("profile_detail", args=[profile["name"]]))
+        self.assertContains(resp, "Slowest SQL")
+        self.assertContains(resp, "function calls")
+
+        self.client.get(self.url, HTTP_X_PROFILE=shown)
+        self.assertEqual(len(list_profiles()), 2)
+
+    def test_sampling_and_rotation(self):
+        with override_settings(PROFILE_SAMPLE_RATE=1):
+            for _ in range(3):
+                self.client.get(self.url)
+            self.client.get(reverse("store:cart"))
+        profiles = list_profiles()
+        self.assertEqual([p["route"] for p in profiles], ["store:cart", "store:catalogue"])
+        self.assertEqual({p["trigger"] for p in profiles}, {"sample"})
+
+
+class SlowQueryLogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        settings = override_settings(METRICS_DB=os.path.join(tmp, "metrics.sqlite3"))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        reset_slow_queries()
+        make_catalogue(3)
+
+    def test_fingerprint_folds_literals_and_in_lists(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'kale' LIMIT 21"),
+            fingerprint("SELECT * FROM t WHERE id IN (%s) AND name = 'leeks'  LIMIT 5"),
+        )
+
+    def test_slow_statements_logged_with_caller_and_plan(self):
+        with override_settings(SLOW_QUERY_MS=0.000001), self.assertLogs("store.slowlog", "WARNING"):
+            self.client.get(reverse("store:catalogue"))
+            self.client.get(reverse("store:catalogue"), {"q": "product"})
+        rows = read_slow_queries(limit=100)
+        products = [r for r in rows if r[1].startswith('SELECT "products_product"."id"')]
+        self.assertTrue(products)
+        self.assertTrue(products[0][6].startswith("store/catalogue.py:"))  # innermost project line
+        self.assertTrue(all(r[5].startswith("store/tests.py") for r in rows))  # outermost: the caller
+        self.assertTrue(all("products_product" in r[7] for r in products))  # EXPLAIN QUERY PLAN
+
+        out = StringIO()
+        call_command("slow_queries", limit=3, stdout=out)
+        report = out.getvalue()
+        self.assertIn("#1 [", report)
+        self.assertIn("plan:", report)
+        totals = [r[3] for r in read_slow_queries(limit=3)]
+        self.assertEqual(totals, sorted(totals, reverse=True))
+
+    def test_fast_statements_are_not_logged(self):
+        with override_settings(SLOW_QUERY_MS=60_000):
+            self.client.get(reverse("store:catalogue"))
+        self.assertEqual(read_slow_queries(), [])
+
+
+class QueryBudgetUtilityTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.products = make_catalogue(4)
+
+    def test_over_budget_fails_with_listing(self):
+        with self.assertRaisesRegex(QueryBudgetExceeded, r"2 queries, budget is 1:\n1\. SELECT"):
+            with self.assertQueryBudget(1):
+                list(Product.objects.all())
+                list(Category.objects.all())
+
+    def test_repeated_fingerprint_is_n_plus_one(self):
+        with self.assertRaisesRegex(QueryBudgetExceeded, r"more than 2 times \(N\+1\?\):\n4x SELECT"):
+            with self.assertQueryBudget(10):
+                for p in self.products:
+                    Product.objects.get(pk=p.pk)
+        with self.assertQueryBudget(1, max_repeats=1):
+            list(Product.objects.filter(pk__in=[p.pk for p in self.products]))
+
+    @query_budget(2)
+    def test_decorator_form(self):
+        list(Product.objects.select_related("category"))
+
+
+class RouteQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Every store: and accounts: route, signed in with a full cart, coupon,
+    orders, favorites and reviews, at a small and a large fixture: the same
+    budget must hold for both, and no statement may repeat. Caches are
+    cleared before each request, so these are cold-cache (worst-case) counts.
+    The checkout GET page has no template in this tree; checkout is budgeted
+    through its POST.
+    """
+
+    def _shop(self, size):
+        products = make_catalogue(size, n_categories=max(3, size // 10))
+        ProductImage.objects.bulk_create(
+            ProductImage(product=p, image=f"products/{p.slug}-{k}.jpg") for p in products for k in range(2)
+        )
+        user = User.objects.create_user("shopper", "shopper@example.com", "pw")
+        reviewers = User.objects.bulk_create(User(username=f"u{i}", email=f"u{i}@example.com") for i in range(size))
+        for i in range(0, size, 5):
+            order = Order.objects.create(user=user, email=user.email)
+            OrderItem.objects.bulk_create(OrderItem(order=order, product=p, qty=1) for p in products[i:i + 5])
+        Rating.objects.bulk_create(Rating(product=products[0], user=u, stars=4, text="Good") for u in reviewers)
+        Favorite.objects.bulk_create(Favorite(user=user, product=p) for p in products[::2])
+        Coupon.objects.create(code="SAVE10", percent_off=10)
+
+        self.client.force_login(user)
+        session = self.client.session
+        cart = Cart(session)
+        for p in products[:max(2, size // 2)]:
+            cart.set(p.pk, Decimal("1"))
+        session["coupon_code"] = "SAVE10"
+        session.save()
+        return products
+
+    def _routes(self, products):
+        a, b = products[0].pk, products[1].pk
+        checkout = {"email": "guest@example.com", "payment_method": "cash"}
+        # (budget, method, url, data); order matters: later routes see earlier writes
+        return [
+            (8, "get", reverse("store:catalogue"), {}),
+            (8, "get", reverse("store:catalogue"), {"q": "product"}),
+            (8, "get", reverse("store:catalogue"), {"fav": "1"}),
+            (11, "get", reverse("store:cart"), {}),
+            (14, "post", reverse("store:update_qty", args=[a]), {"qty": "2"}),
+            (5, "post", reverse("store:remove_from_cart", args=[b]), {}),
+            (5, "post", reverse("store:apply_coupon"), {"code": "save10"}),
+            (5, "get", reverse("store:orders"), {}),
+            (3, "get", reverse("store:favorites_count"), {}),
+            (14, "post", reverse("store:rate_product", args=[a]), {"stars": "5"}),
+            (4, "get", reverse("store:reviews_detail", args=[a]), {}),
+            (1, "get", reverse("store:reviews_page", args=[a]), {}),
+            (7, "post", reverse("store:toggle_favorite", args=[a]), {}),
+            (15, "post", reverse("store:checkout"), checkout),
+            (1, "get", reverse("store:thanks", args=[1]), {}),
+            (3, "get", reverse("accounts:profile"), {}),
+            (5, "get", reverse("accounts:orders"), {}),
+            (4, "post", reverse("accounts:logout"), {}),
+            (1, "get", reverse("accounts:signup"), {}),
+            (1, "get", reverse("accounts:login"), {}),
+        ]
+
+    def _check_routes(self, size):
+        for budget, method, url, data in self._routes(self._shop(size)):
+            cache.clear()
+            clear_coupon_cache()
+            with self.subTest(url=url, data=data, size=size):
+                with self.assertQueryBudget(budget, max_repeats=1, label=f"{method.upper()} {url}"):
+                    resp = getattr(self.client, method)(url, data)
+                self.assertLess(resp.status_code, 400)
+
+    def test_small_fixture(self):
+        self._check_routes(5)
+
+    def test_large_fixture(self):
+        self._check_routes(60)
+
+
+class BenchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_seed_run_and_clear(self):
+        out = StringIO()
+        call_command("seed_bench", products=30, categories=3, users=5, orders=10, ratings=20, sessions=4,
+                     batch_size=7, stdout=out)
+        self.assertIn("Seeded 3 categories, 30 products, 60 images", out.getvalue())
+        self.assertEqual(Product.objects.exclude(primary_image=None).count(), 30)
+        self.assertEqual(sum(Product.objects.values_list("rating_count", flat=True)), Rating.objects.count())
+        self.assertTrue(Session.objects.filter(session_key__startswith="bench").exists())
+
+        path = os.path.join(tempfile.mkdtemp(), "bench.json")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path), ignore_errors=True)
+        orders = Order.objects.count()
+        call_command("run_bench", iterations=2, output=path, stdout=StringIO(), stderr=StringIO())
+        with open(path) as fh:
+            report = json.load(fh)
+        views = {v["name"]: v for v in report["views"]}
+        self.assertEqual(report["meta"]["rows"]["products"], 30)
+        self.assertEqual(views["store:catalogue"]["status"], 200)
+        self.assertEqual(views["store:checkout"]["status"], 302)
+        self.assertTrue({"store:cart", "store:rate_product", "accounts:orders", "accounts:logout"} <= set(views))
+        for view in views.values():
+            self.assertLessEqual(view["p50_ms"], view["p95_ms"])
+            self.assertGreater(view["peak_kb"], 0)
+        self.assertEqual(Order.objects.count(), orders)  # benchmark writes rolled back
+
+        out = StringIO()
+        call_command("run_bench", iterations=1, only=["store:cart"], compare=path, stdout=out, stderr=StringIO())
+        self.assertIn("store:cart", out.getvalue())
+
+        call_command("seed_bench", clear_only=True, stdout=StringIO())
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(User.objects.exists())
+
+    def test_run_without_seed_fails(self):
+        with self.assertRaisesRegex(CommandError, "seed_bench"):
+            call_command("run_bench", stdout=StringIO(), stderr=StringIO())
@@ -17,5 +17,6 @@ urlpatterns = [
     path("thanks/<int:order_id>/", views.thanks_view, name="thanks"),
     path("product/<int:product_id>/rate/", views.rate_product, name="rate_product"),
     path("product/<int:product_id>/reviews/", views.reviews_detail, name="reviews_detail"),
+    path("product/<int:product_id>/reviews/page/", views.reviews_page, name="reviews_page"),
     path("product/<int:product_id>/favorite/", views.toggle_favorite, name="toggle_favorite"),
 ]
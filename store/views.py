@@ -1,107 +1,35 @@
 from __future__ import annotations
 
-from collections import defaultdict
 from decimal import Decimal
-from typing import Dict, Any, List, Tuple
 from urllib import request
 
-from django.conf import settings
 from django.contrib import messages  # left here for other pages; not used for coupon flashes
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
-from django.core.mail import send_mail
-from django.db.models import Avg, Count, Q
+from django.db import transaction
 from django.http import HttpRequest, HttpResponse, JsonResponse, Http404
 from django.shortcuts import get_object_or_404, redirect, render
-from django.utils import timezone
 from django.views.decorators.http import require_POST
 
 from products.models import Product
+from .cart import Cart
+from .catalogue import apply_user_overlay, catalogue_products, group_by_category, load_catalogue
+from .checkout import InsufficientStock, place_order
+from .coupons import resolve_coupon
+from .favorites import favorite_ids, flip_favorite
 from .forms import SignupForm, ProfileForm, CouponForm, CheckoutForm
-from .models import Rating, Coupon, Order, OrderItem, Profile
+from .models import Rating, Order, OrderItem, Profile
+from .pricing import CartPricer, coupon_description, display_remaining
+from .reservations import held_quantities, refresh_holds, reserve
+from .reviews import review_as_json, review_page, star_breakdown
 
 
 # --- Helpers ---
 
-def _get_cart(session) -> Dict[str, Dict[str, Any]]:
-    """Ensure cart exists and is a dict; reset if it somehow became another type."""
-    cart = session.get("cart")
-    if not isinstance(cart, dict):
-        cart = {}
-        session["cart"] = cart
-        session.modified = True
-    return cart
-
-def _entry_qty(entry) -> Decimal:
-    """Read qty from either new dict shape {'qty': ...} or legacy raw number/string."""
-    if isinstance(entry, dict):
-        try:
-            return Decimal(str(entry.get("qty", "0") or "0"))
-        except Exception:
-            return Decimal("0")
-    try:
-        return Decimal(str(entry))
-    except Exception:
-        return Decimal("0")
-
-def _cart_item_count(cart: Dict[str, Any]) -> str:
-    total = Decimal("0")
-    for entry in cart.values():
-        total += _entry_qty(entry)
-    return str(total)
-
-def _effective_price(p: Product) -> Decimal:
-    sp = getattr(p, "sale_price", None)
-    price = getattr(p, "price", Decimal("0"))
-    if sp and sp < price:
-        return sp
-    return price
-
-def _remaining_for(p: Product) -> Decimal:
-    # Using product.stock_qty minus in-cart qty (as tracked on the product object)
-    stock = Decimal(str(getattr(p, "stock_qty", "0") or "0"))
-    in_cart = Decimal(str(getattr(p, "in_cart", 0) or "0"))
-    return max(Decimal("0"), stock - in_cart)
-
 def _ensure_profile(user):
     prof, _ = Profile.objects.get_or_create(user=user)
     return prof
 
-def _get_favorites(session) -> set[str]:
-    fav = session.get("favorites")
-    if not isinstance(fav, list):
-        fav = []
-        session["favorites"] = fav
-        session.modified = True
-    return {str(x) for x in fav}
-
-def _set_favorites(session, fav_ids: set[str]) -> None:
-    session["favorites"] = list(fav_ids)
-    session.modified = True
-
-def _format_percent(dec: Decimal) -> str:
-    """
-    Return a human string without scientific notation.
-    10 -> '10', 12.5 -> '12.5', 12.34 -> '12.34'
-    """
-    dec = Decimal(dec)
-    if dec == dec.to_integral_value():
-        return str(int(dec))
-    # trim trailing zeros
-    s = f"{dec.quantize(Decimal('0.01'))}"
-    if "." in s:
-        s = s.rstrip("0").rstrip(".")
-    return s
-
-def _coupon_description(coupon: Coupon) -> str:
-    parts: List[str] = []
-    if coupon.percent_off and coupon.percent_off > 0:
-        parts.append(f"{_format_percent(coupon.percent_off)}% off")
-    if coupon.amount_off and coupon.amount_off > 0:
-        parts.append(f"${coupon.amount_off.quantize(Decimal('0.01'))} off")
-    return " + ".join(parts) if parts else "discount"
-
-
 # --- Public pages ---
 
 def catalogue(request: HttpRequest) -> HttpResponse:
@@ -111,104 +39,33 @@ def catalogue(request: HttpRequest) -> HttpResponse:
     show_fav = request.GET.get("fav") == "1"
 
     # Favorites state for header toggle
-    fav_ids = _get_favorites(request.session)
+    fav_ids = favorite_ids(request.user)
     has_favorites = bool(fav_ids)
     fav_count = len(fav_ids)
 
+    cart = Cart(request.session)
+    cart_qty = cart.quantities()
 
-    products_qs = Product.objects.all().select_related("category")
-
-    # Search filter: name or category name
-    if q:
-        products_qs = products_qs.filter(
-            Q(name__icontains=q) | Q(category__name__icontains=q)
-        )
-
-    # Ratings maps
-    ratings = Rating.objects.values("product_id").annotate(avg=Avg("stars"))
-    avg_map = {r["product_id"]: r["avg"] or 0 for r in ratings}
-
-    user_map: Dict[int, int] = {}
-    if request.user.is_authenticated:
-        your_ratings = (
-            Rating.objects.filter(user=request.user)
-            .values("product_id")
-            .annotate(stars=Avg("stars"))
-        )
-        user_map = {r["product_id"]: int(r["stars"]) for r in your_ratings}
-    purchased_ids: set[int] = set()
-    if request.user.is_authenticated:
-        purchased_ids = set(
-            OrderItem.objects.filter(order__user=request.user).values_list('product_id', flat=True)
-        )
-    # Has the current user purchased each product?  (needed to gate ratings)
-    purchased_ids = set()
-    if request.user.is_authenticated:
-        purchased_ids = set(
-            OrderItem.objects
-            .filter(order__user=request.user)
-            .values_list("product_id", flat=True)
-        )
-    cart = _get_cart(request.session)
-    fav_ids = _get_favorites(request.session)
-
-    categories_dict: Dict[Any, Dict[str, Any]] = defaultdict(
-        lambda: {"name": "", "description": "", "visible_products": []}
-    )
-    # Which products has this user purchased? (for rating gate)
-    purchased_ids: set[int] = set()
-    if request.user.is_authenticated:
-        purchased_ids = set(
-            OrderItem.objects
-                .filter(order__user=request.user)
-                .values_list('product_id', flat=True)
-        )
-
-    # Build product objects with in_cart/remaining/ratings/favorite flags
-    for p in products_qs:
-        pid = str(p.id)
-        in_cart = _entry_qty(cart.get(pid, 0))
-        setattr(p, "in_cart", in_cart)
-        setattr(p, "remaining", _remaining_for(p))
-        # Default average to 5.0 when no ratings
-        setattr(p, "avg_stars", Decimal(str(avg_map.get(p.id, 5))))
-        setattr(p, "user_stars", user_map.get(p.id, 0))
-        setattr(p, "user_can_rate", p.id in purchased_ids)
-        setattr(p, "user_can_rate", p.id in purchased_ids)
-        setattr(p, "is_favorite", pid in fav_ids)
-        setattr(p, "user_can_rate", (p.id in purchased_ids))
-
-        cat = getattr(p, "category", None)
-        key = cat.id if cat else 0
-        if key not in categories_dict:
-            categories_dict[key]["name"] = getattr(cat, "name", "All Products" if key == 0 else str(cat))
-            categories_dict[key]["description"] = getattr(cat, "description", "")
-            categories_dict[key]["visible_products"] = []
-        categories_dict[key]["visible_products"].append(p)
-
-    # Hide OOS when requested (but keep items that are in the cart visible)
-    if not show_oos:
-        for c in categories_dict.values():
-            c["visible_products"] = [
-                p for p in c["visible_products"]
-                if (Decimal(str(getattr(p, "remaining"))) > 0) or (Decimal(str(getattr(p, "in_cart") or "0")) > 0)
-            ]
-
-    # Filter by favorites toggle
+    # Cached, user-independent grid + cheap per-visitor overlay.
+    # "Only favorites" is filtered in SQL instead (small, per-user, uncached).
     if show_fav:
-        for c in categories_dict.values():
-            c["visible_products"] = [p for p in c["visible_products"] if getattr(p, "is_favorite", False)]
+        categories = group_by_category(catalogue_products(q=q).filter(pk__in=fav_ids)) if fav_ids else []
+    else:
+        categories = load_catalogue(q)
+    held = held_quantities(exclude_holder=cart.holder)  # one grouped query over active holds
+    apply_user_overlay(categories, request.user, cart_qty, fav_ids, held)
+    products = [p for c in categories for p in c["visible_products"]]
 
     # has_oos for the current (searched) subset, unfiltered by show_oos
-    has_oos = any(
-        Decimal(str(getattr(p, "stock_qty", "0") or "0")) <= 0
-        for p in products_qs
-    )
-
+    has_oos = any((p.stock_qty or 0) <= 0 for p in products)
 
+    # Hide OOS when requested (but keep items that are in the cart visible)
+    if not show_oos:
+        for c in categories:
+            c["visible_products"] = [p for p in c["visible_products"] if p.remaining > 0 or p.in_cart > 0]
 
     # Drop empty categories after filters
-    categories = [c for c in categories_dict.values() if c["visible_products"]]
+    categories = [c for c in categories if c["visible_products"]]
 
     return render(
         request,
@@ -221,7 +78,6 @@ def catalogue(request: HttpRequest) -> HttpResponse:
             "show_fav": show_fav,
             "has_favorites": has_favorites,
             "fav_count": fav_count,
-            "cart_item_total": _cart_item_count(cart),  # keep header cart count accurate
         },
     )
 
@@ -229,82 +85,41 @@ def catalogue(request: HttpRequest) -> HttpResponse:
 # --- Cart ---
 
 def cart_view(request: HttpRequest) -> HttpResponse:
-    cart = _get_cart(request.session)
-
-    items: List[Dict[str, Any]] = []
-    subtotal = Decimal("0")
-    modified = False  # if we see legacy entries, rewrite them into normalized dicts
-
-    for pid, entry in list(cart.items()):
-        qty = _entry_qty(entry)
-        if not isinstance(entry, dict) or "qty" not in entry or str(entry["qty"]) != str(qty):
-            cart[str(pid)] = {"qty": str(qty)}
-            modified = True
-
-        p = get_object_or_404(Product, pk=int(pid))
-        unit_price = _effective_price(p)
-        line_total = (unit_price * qty).quantize(Decimal("0.01"))
-
-        # Remaining display (no decimals for 'ea')
-        rem_raw = max(Decimal("0"), Decimal(str(getattr(p, "stock_qty", 0))) - qty)
-        remaining = int(rem_raw) if getattr(p, "unit", "ea") == "ea" else rem_raw
-
-        items.append(
-            {
-                "product": p,
-                "qty": qty,
-                "remaining": remaining,
-                "line_total": line_total,
-                "unit_price": unit_price,
-            }
-        )
-        subtotal += line_total
-
-    if modified:
-        request.session.modified = True
-
-    # Coupon (stored on session)
-    discount = Decimal("0")
-    code = request.session.get("coupon_code") or ""
-    coupon = None
-    coupon_desc = ""
-    if code:
-        coupon = Coupon.objects.filter(code=code).first()
-        if coupon and coupon.is_valid_now():
-            if coupon.percent_off:
-                discount += (subtotal * (coupon.percent_off / Decimal("100"))).quantize(Decimal("0.01"))
-            discount += coupon.amount_off
-            coupon_desc = _coupon_description(coupon)
-
-    total = max(Decimal("0"), subtotal - discount)
-
-    # Inline-only coupon messages (pop from session)
-    coupon_error = request.session.pop("coupon_error", "")
-    coupon_success = request.session.pop("coupon_success", "")
+    cart = Cart(request.session)  # legacy carts are converted on first touch
 
     # Prefill "Place Order" (if/when you render it on cart page)
     initial = {}
+    prof = None
     if request.user.is_authenticated:
         initial["email"] = request.user.email
         prof = _ensure_profile(request.user)
         initial["phone"] = prof.phone
     checkout_form = CheckoutForm(initial=initial)
 
+    priced = CartPricer.for_request(request, cart, profile=prof).price()
+    if cart.holder and len(cart):
+        refresh_holds(cart.holder)  # still shopping: keep this cart's stock held
+
+    # Inline-only coupon messages (pop from session)
+    coupon_error = request.session.pop("coupon_error", "")
+    coupon_success = request.session.pop("coupon_success", "")
+    checkout_shortages = request.session.pop("checkout_shortages", [])
+
     return render(
         request,
         "store/cart.html",
         {
-            "items": items,
-            "subtotal": subtotal,
-            "discount": discount,
-            "total": total,
-            "coupon": coupon,
-            "coupon_desc": coupon_desc,
+            "items": priced.lines,
+            "subtotal": priced.subtotal,
+            "discount": priced.discount,
+            "total": priced.total,
+            "coupon": priced.coupon,
+            "coupon_desc": priced.coupon_desc,
             "coupon_form": CouponForm(),
             "checkout_form": checkout_form,
-            "cart_item_total": _cart_item_count(cart),
             "coupon_error": coupon_error,
             "coupon_success": coupon_success,
+            "checkout_shortages": checkout_shortages,
         },
     )
 
@@ -313,37 +128,45 @@ def cart_update_qty(request: HttpRequest, product_id: int) -> JsonResponse:
     if request.method != "POST":
         raise Http404()
 
-    cart = _get_cart(request.session)
+    cart = Cart(request.session)
     qty = Decimal(str(request.POST.get("qty", "0") or "0"))
     qty = max(Decimal("0"), qty)
 
-    p = get_object_or_404(Product, pk=product_id)
-    stock = Decimal(str(getattr(p, "stock_qty", "0") or "0"))
-    # clamp
-    if qty > stock:
-        qty = stock
+    pricer = CartPricer.for_request(request, cart)
+    products = pricer.load_products(extra_ids=[product_id])
+    p = products.get(product_id)
+    if p is None:
+        raise Http404()
+    # What's left after other shoppers' holds; clamp to it
+    available = max(Decimal("0"), Decimal(str(getattr(p, "stock_qty", "0") or "0")) - p.held)
+    if qty > available:
+        qty = available
 
-    if qty == 0:
-        cart.pop(str(product_id), None)
-    else:
-        cart[str(product_id)] = {"qty": str(qty)}  # normalized shape
+    cart.set(product_id, qty)
+    if qty > 0 or cart.holder:
+        reserve(cart.ensure_holder(), product_id, qty)
 
-    request.session.modified = True
+    priced = pricer.price(products)
 
-    # Remaining = stock - qty
-    remaining = max(Decimal("0"), stock - qty)
-    if getattr(p, "unit", "ea") == "ea":
-        remaining_str = str(int(remaining))
-    else:
-        remaining_str = str(remaining)
+    remaining = display_remaining(p, available - qty)
 
-    return JsonResponse({"ok": True, "remaining": remaining_str, "cart_total": _cart_item_count(cart)})
+    return JsonResponse(
+        {
+            "ok": True,
+            "remaining": str(remaining),
+            "cart_total": cart.count,
+            "subtotal": str(priced.subtotal),
+            "discount": str(priced.discount),
+            "total": str(priced.total),
+        }
+    )
 
 
 def cart_remove(request: HttpRequest, product_id: int) -> HttpResponse:
-    cart = _get_cart(request.session)
-    cart.pop(str(product_id), None)
-    request.session.modified = True
+    cart = Cart(request.session)
+    cart.remove(product_id)
+    if cart.holder:
+        reserve(cart.holder, product_id, Decimal("0"))
     return redirect("store:cart")
 
 
@@ -366,7 +189,7 @@ def apply_coupon(request: HttpRequest) -> HttpResponse:
         request.session["coupon_success"] = "Coupon removed."
         return redirect("store:cart")
 
-    c = Coupon.objects.filter(code__iexact=code_norm).first()
+    c = resolve_coupon(code_norm)
     if not c:
         request.session["coupon_error"] = f"Coupon {code_norm} not found"
         request.session["coupon_code"] = ""
@@ -378,7 +201,7 @@ def apply_coupon(request: HttpRequest) -> HttpResponse:
 
     # Store canonical casing and success text
     request.session["coupon_code"] = c.code
-    request.session["coupon_success"] = f"Coupon {c.code} has been applied for {_coupon_description(c)}"
+    request.session["coupon_success"] = f"Coupon {c.code} has been applied for {coupon_description(c)}"
     return redirect("store:cart")
 
 
@@ -411,30 +234,23 @@ def rate_product(request: HttpRequest, product_id: int) -> JsonResponse:
     if not has_purchased:
         return JsonResponse({"ok": False, "error": "not_purchased"}, status=403)
 
-    Rating.objects.update_or_create(
-        product=product,
-        user=request.user,
-        defaults={"stars": stars},
-    )
+    # Rating row and Product.rating_count/rating_sum change in one transaction
+    with transaction.atomic():
+        Rating.objects.update_or_create(
+            product=product,
+            user=request.user,
+            defaults={"stars": stars},
+        )
 
     # Return fresh average so the UI can update immediately
-    new_avg = Rating.objects.filter(product=product).aggregate(avg=Avg("stars")).get("avg") or 0
-    return JsonResponse({"ok": True, "avg": float(new_avg)})
+    product.refresh_from_db(fields=["rating_count", "rating_sum"])
+    return JsonResponse({"ok": True, "avg": float(product.avg_rating)})
 
 
 def reviews_detail(request: HttpRequest, product_id: int) -> HttpResponse:
     product = get_object_or_404(Product, pk=product_id)
-    reviews = Rating.objects.filter(product=product).select_related("user")
-
-    # breakdown
-    counts = Rating.objects.filter(product=product).values("stars").annotate(c=Count("id"))
-    total = sum(r["c"] for r in counts) or 1
-    dist: List[Tuple[int, int, float]] = []
-    for s in range(5, 0, -1):
-        c = next((r["c"] for r in counts if r["stars"] == s), 0)
-        dist.append((s, c, (c * 100.0) / total))
-
-    avg = reviews.aggregate(avg=Avg("stars")).get("avg") or 0
+    reviews, next_cursor = review_page(product.pk, request.GET.get("after", ""))
+    stats = star_breakdown(product.pk)
 
     return render(
         request,
@@ -442,12 +258,20 @@ def reviews_detail(request: HttpRequest, product_id: int) -> HttpResponse:
         {
             "product": product,
             "reviews": reviews,
-            "avg": avg,
-            "breakdown": dist,
+            "next_cursor": next_cursor,
+            "avg": stats["avg"],
+            "total": stats["total"],
+            "breakdown": stats["breakdown"],
         },
     )
 
 
+def reviews_page(request: HttpRequest, product_id: int) -> JsonResponse:
+    """JSON "load more" for reviews_detail: ?after=<cursor> → {'reviews': [...], 'next': cursor|null}."""
+    reviews, next_cursor = review_page(product_id, request.GET.get("after", ""))
+    return JsonResponse({"ok": True, "reviews": [review_as_json(r) for r in reviews], "next": next_cursor})
+
+
 # --- Auth/Account ---
 
 def signup_view(request: HttpRequest) -> HttpResponse:
@@ -479,100 +303,42 @@ def profile_view(request: HttpRequest) -> HttpResponse:
 
 @login_required
 def orders_view(request: HttpRequest) -> HttpResponse:
-    orders = Order.objects.filter(user=request.user).prefetch_related("items__product")
+    orders = Order.objects.filter(user=request.user).prefetch_related("items__product__primary_image")
     return render(request, "store/auth/orders.html", {"orders": orders})
 
 
 # --- Checkout ---
 
-def _compute_totals_from_session_cart(request: HttpRequest):
-    cart = _get_cart(request.session)
-    items = []
-    subtotal = Decimal("0")
-    for pid, entry in cart.items():
-        p = get_object_or_404(Product, pk=int(pid))
-        qty = _entry_qty(entry)
-        unit_price = _effective_price(p)
-        line_total = (unit_price * qty).quantize(Decimal("0.01"))
-        items.append((p, qty, unit_price, line_total))
-        subtotal += line_total
-
-    # Coupon
-    discount = Decimal("0")
-    coupon = None
-    code = request.session.get("coupon_code")
-    if code:
-        coupon = Coupon.objects.filter(code=code).first()
-        if coupon and coupon.is_valid_now():
-            if coupon.percent_off:
-                discount += (subtotal * (coupon.percent_off / Decimal("100"))).quantize(Decimal("0.01"))
-            discount += coupon.amount_off
-
-    # New customer discount 10% if within 30 days
-    if request.user.is_authenticated:
-        prof = _ensure_profile(request.user)
-        if prof.signup_discount_ends_at and timezone.now() <= prof.signup_discount_ends_at:
-            discount += (subtotal * Decimal("0.10")).quantize(Decimal("0.01"))
-
-    total = max(Decimal("0"), subtotal - discount)
-    return items, subtotal, discount, total, coupon
-
-
 def checkout_view(request: HttpRequest) -> HttpResponse:
-    items, subtotal, discount, total, coupon = _compute_totals_from_session_cart(request)
+    cart = Cart(request.session)
+    priced = CartPricer.for_request(request, cart).price()
 
     if request.method == "POST":
         form = CheckoutForm(request.POST)
         if form.is_valid():
-            order = Order.objects.create(
-                user=request.user if request.user.is_authenticated else None,
-                email=form.cleaned_data["email"],
-                phone=form.cleaned_data.get("phone") or "",
-                coupon=coupon,
-                subtotal=subtotal,
-                discount_total=discount,
-                total=total,
-                payment_method=form.cleaned_data["payment_method"],
-            )
-            for p, qty, unit_price, line_total in items:
-                OrderItem.objects.create(
-                    order=order,
-                    product=p,
-                    qty=qty,
-                    unit=getattr(p, "unit", "ea"),
-                    unit_price=unit_price,
-                    line_total=line_total,
+            if not priced.lines:
+                return redirect("store:cart")
+            try:
+                order = place_order(
+                    priced,
+                    user=request.user,
+                    email=form.cleaned_data["email"],
+                    phone=form.cleaned_data.get("phone") or "",
+                    payment_method=form.cleaned_data["payment_method"],
+                    holder=cart.holder,
                 )
-                # Update inventory after placing order
-                p.stock_qty = max(Decimal("0"), Decimal(str(p.stock_qty or 0)) - qty)
-                p.save(update_fields=["stock_qty"])
+            except InsufficientStock as exc:
+                # Inline report on the cart page, same pattern as coupon messages
+                request.session["checkout_shortages"] = [str(s) for s in exc.shortages] or [
+                    "Some items sold out while you were checking out."
+                ]
+                return redirect("store:cart")
 
             # Clear cart
-            request.session["cart"] = {}
+            cart.clear()
             request.session["coupon_code"] = ""
             request.session.modified = True
 
-            # Email (simple)
-            try:
-                send_mail(
-                    subject=f"Order #{order_display} confirmation",
-                    message=f"Thanks for your order #{order_display}. Total: ${order.total}",
-                    from_email=None,
-                    recipient_list=[order.email],
-                    fail_silently=True,
-                )
-                admin_mail = getattr(settings, "ORDER_NOTIFICATION_EMAIL", None) or getattr(settings, "DEFAULT_FROM_EMAIL", None)
-                if admin_mail:
-                    send_mail(
-                        subject=f"New order #{order_display}",
-                        message=f"Total: ${order.total}",
-                        from_email=None,
-                        recipient_list=[admin_mail],
-                        fail_silently=True,
-                    )
-            except Exception:
-                pass
-
             return redirect("store:thanks", order_id=order.pk)
     else:
         initial = {}
@@ -587,10 +353,10 @@ def checkout_view(request: HttpRequest) -> HttpResponse:
         "store/checkout.html",
         {
             "form": form,
-            "subtotal": subtotal,
-            "discount": discount,
-            "total": total,
-            "coupon": coupon,
+            "subtotal": priced.subtotal,
+            "discount": priced.discount,
+            "total": priced.total,
+            "coupon": priced.coupon,
         },
     )
 
@@ -600,32 +366,22 @@ def thanks_view(request: HttpRequest, order_id: int) -> HttpResponse:
     return render(request, "store/thanks.html", {"order_id": order_display})
 
 
-# --- Favorites (session-based) ---
+# --- Favorites ---
 
 @login_required
 def toggle_favorite(request: HttpRequest, product_id: int) -> JsonResponse:
     if request.method != "POST":
         raise Http404()
     _ = get_object_or_404(Product, pk=product_id)
-    fav_ids = _get_favorites(request.session)
-    pid = str(product_id)
-    if pid in fav_ids:
-        fav_ids.remove(pid)
-        favorited = False
-    else:
-        fav_ids.add(pid)
-        favorited = True
-    _set_favorites(request.session, fav_ids)
+    favorited = flip_favorite(request.user, product_id)
     return JsonResponse({"ok": True, "favorited": favorited})
 
-from django.http import JsonResponse
 def favorites_count(request: HttpRequest) -> JsonResponse:
-    fav_ids = _get_favorites(request.session)
-    return JsonResponse({"ok": True, "count": len(fav_ids)})
+    return JsonResponse({"ok": True, "count": len(favorite_ids(request.user))})
 
 
 def orders_history(request: HttpRequest) -> HttpResponse:
     if not request.user.is_authenticated:
         return redirect('login')
-    orders = Order.objects.filter(user=request.user).prefetch_related('items__product')
+    orders = Order.objects.filter(user=request.user).prefetch_related('items__product__primary_image')
     return render(request, 'store/orders.html', {'orders': orders})